@@ -55,6 +55,7 @@ setup(
     ],
     extras_require={
         'test': ['pytest>=2.9.2',],
+        'columnar': ['pyarrow>=8.0.0',],
     },
     entry_points={
         'console_scripts': [
@@ -274,12 +274,8 @@ def write_serovar_and_spp_tables(outdir, df_serovar, predictions, genome_names):
     pred_genome_serovar = {}
     pred_genome_spp = {}
     for genome, prediction in zip(genome_names, predictions):
-        pred_dict = prediction.__dict__
-        pred_genome_serovar[genome] = pred_dict['serovar']
-        if 'cgmlst_subspecies' in pred_dict:
-            pred_genome_spp[genome] = pred_dict['cgmlst_subspecies']
-        else:
-            pred_genome_spp[genome] = None
+        pred_genome_serovar[genome] = prediction.serovar
+        pred_genome_spp[genome] = prediction.cgmlst_subspecies
 
     if df_serovar is not None:
         for i, row in df_serovar.iterrows():
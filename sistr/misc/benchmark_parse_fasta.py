@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import argparse
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from sistr.src.cgmlst import CGMLST_FULL_FASTA_PATH
+from sistr.src.logger import init_console_logger
+from sistr.src.parsers import parse_fasta, parse_fasta_lines
+
+
+def init_arg_parser():
+    prog_desc = 'Benchmark the block-based FASTA parser against the line-by-line text mode parser'
+    parser = argparse.ArgumentParser(prog='benchmark_parse_fasta',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=prog_desc)
+    parser.add_argument('-i', '--input',
+                        default=CGMLST_FULL_FASTA_PATH,
+                        help='FASTA file to parse (default: full cgMLST330 allele FASTA)')
+    parser.add_argument('-r', '--repeats',
+                        type=int,
+                        default=3,
+                        help='Number of timed runs of each parser (best time is reported)')
+    parser.add_argument('--gzip',
+                        action='store_true',
+                        help='Also time parsing a gzip compressed copy of the input')
+    parser.add_argument('-v', '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity (-v to log warnings; -vvv to log debug info)')
+    return parser
+
+
+def time_parser(parse, path, repeats):
+    """Best wall time of parsing a FASTA file
+
+    Args:
+        parse (function): FASTA parser
+        path (str): FASTA path
+        repeats (int): number of timed runs
+
+    Returns:
+        (float, int): best time in seconds and number of records parsed
+    """
+    best = None
+    n = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        n = sum(1 for _ in parse(path))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, n
+
+
+def main():
+    parser = init_arg_parser()
+    args = parser.parse_args()
+    init_console_logger(args.verbose)
+    path = args.input
+    size_mb = os.path.getsize(path) / float(1 << 20)
+    if list(parse_fasta(path)) != list(parse_fasta_lines(path)):
+        raise Exception('parse_fasta and parse_fasta_lines records differ for "{}"!'.format(path))
+    runs = [('parse_fasta_lines', parse_fasta_lines, path),
+            ('parse_fasta', parse_fasta, path)]
+    tmp_dir = None
+    if args.gzip:
+        tmp_dir = tempfile.mkdtemp(prefix='sistr-benchmark-')
+        gz_path = os.path.join(tmp_dir, os.path.basename(path) + '.gz')
+        with open(path, 'rb') as fin, gzip.open(gz_path, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+        runs.append(('parse_fasta (gzip)', parse_fasta, gz_path))
+    try:
+        print('{} ({:.1f} MB)'.format(path, size_mb))
+        baseline = None
+        for name, parse, run_path in runs:
+            elapsed, n = time_parser(parse, run_path, args.repeats)
+            if baseline is None:
+                baseline = elapsed
+            print('{:<20} {:>9} records {:>8.3f} s {:>8.1f} MB/s {:>6.1f}x'.format(
+                name, n, elapsed, size_mb / elapsed, baseline / elapsed))
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
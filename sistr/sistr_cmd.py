@@ -13,9 +13,11 @@ from pkg_resources import resource_filename
 from sistr.version import __version__
 from sistr.src.blast_wrapper import BlastRunner
 from sistr.src.cgmlst import run_cgmlst
+from sistr.src.genome import Genome
 from sistr.src.logger import init_console_logger
 from sistr.src.qc import qc
-from sistr.src.serovar_prediction import SerovarPredictor, overall_serovar_call, serovar_table, SISTR_DB_URL, SISTR_DATA_DIR
+from sistr.src.reference_data import reference_data
+from sistr.src.serovar_prediction import SerovarPredictor, overall_serovar_call, serovar_resolver, SISTR_DB_URL, SISTR_DATA_DIR
 
 
 def init_parser():
@@ -32,6 +34,12 @@ If you find this program useful in your research, please cite as:
 The Salmonella In Silico Typing Resource (SISTR): an open web-accessible tool for rapidly typing and subtyping draft Salmonella genome assemblies.
 Catherine Yoshida, Peter Kruczkiewicz, Chad R. Laing, Erika J. Lingohr, Victor P.J. Gannon, John H.E. Nash, Eduardo N. Taboada.
 PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
+
+Re-predict serovars from existing cgMLST330 allelic profiles and antigen predictions without BLAST with "sistr_cmd reprofile" (see "sistr_cmd reprofile -h").
+
+Merge the outputs of runs on separate shards of a batch (--shard i/N) with "sistr_cmd merge" (see "sistr_cmd merge -h").
+
+Analyze genomes of a work queue created with --queue on other hosts with "sistr_cmd worker" (see "sistr_cmd worker -h").
 '''
 
     parser = argparse.ArgumentParser(prog='sistr_cmd',
@@ -48,10 +56,17 @@ PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
                         metavar=('fasta_path', 'genome_name'),
                         action='append',
                         help='fasta file path to genome name pair')
+    parser.add_argument('--multi-fasta',
+                        help='Input FASTA (or "-" for standard input) with the contigs of multiple genomes, e.g. a stream of assemblies. Each genome is analyzed as soon as all of its contigs are read. Contigs of each genome must be contiguous and the genome ID is taken from each contig header (see --genome-id-delimiter and --genome-id-regex). Cannot be combined with FASTA file inputs.')
+    parser.add_argument('--genome-id-delimiter',
+                        default='|',
+                        help='With --multi-fasta, the genome ID is the contig header text before the first occurrence of this delimiter (default: "|"; the first word of the header if not found)')
+    parser.add_argument('--genome-id-regex',
+                        help='With --multi-fasta, regular expression matched at the start of contig headers whose first group (or whole match) is the genome ID, e.g. "(\\w+)_contig"')
     parser.add_argument('-f',
                         '--output-format',
                         default='json',
-                        help='Output format (json, csv, tab, pickle)')
+                        help='Output format (json, jsonl, csv, tab, parquet, arrow, pickle). Text output is gzip compressed if the output path ends with ".gz". Parquet and Arrow output require pyarrow')
     parser.add_argument('-o',
                         '--output-prediction',
                         help='SISTR serovar prediction output path')
@@ -60,15 +75,43 @@ PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
                         action='count',
                         default=0,
                         help='Output more detailed results (-M) and all antigen search blastn results (-MM)')
+    parser.add_argument('--blast-hits-output',
+                        help='Output path for a table of all antigen gene blastn results (tab-delimited, or Parquet/Arrow table if path ends with ".parquet" or ".arrow"). These results are then not included in the -MM prediction output')
     parser.add_argument('-p',
                         '--cgmlst-profiles',
-                        help='Output CSV file destination for cgMLST allelic profiles')
+                        help='Output CSV file destination for cgMLST allelic profiles (Parquet or Arrow table if path ends with ".parquet" or ".arrow")')
     parser.add_argument('-n',
                         '--novel-alleles',
                         help='Output FASTA file destination of novel cgMLST alleles from input genomes')
     parser.add_argument('-a',
                         '--alleles-output',
                         help='Output path of allele sequences and info to JSON')
+    parser.add_argument('--alleles-format',
+                        choices=['json', 'compact'],
+                        default='json',
+                        help='Allele results output (-a) format: "json" with all allele sequences and BLAST results for each genome, or "compact" with each distinct allele sequence stored once and BLAST results in a side table (default: json)')
+    parser.add_argument('--results-db',
+                        help='SQLite database path to add predictions, QC status and cgMLST allele calls to (created if it does not exist)')
+    parser.add_argument('--result-cache',
+                        help='Directory to cache per-genome results in, keyed by FASTA content, SISTR DB version and analysis options. Cached results are reused and identical input genomes are only analyzed once. Not used with --artifacts-dir since cached results have no search artifacts.')
+    parser.add_argument('--result-cache-max-size',
+                        help='Max total size of the result cache (e.g. "500M", "10G"); least recently used results are removed when exceeded')
+    parser.add_argument('--checkpoint-dir',
+                        help='Directory to durably record each completed genome\'s results in as soon as it is finished. A restarted run with the same inputs, options and checkpoint directory skips completed genomes and writes all results to the requested outputs.')
+    parser.add_argument('--artifacts-dir',
+                        help='Directory to save per-genome search artifacts to (antigen gene and cgMLST blastn results, extracted cgMLST alleles and Mash distances) for rebuilding predictions with --from-artifacts')
+    parser.add_argument('--from-artifacts',
+                        action='store_true',
+                        help='Rebuild predictions from search artifacts saved with --artifacts-dir instead of analyzing FASTA files. Inputs are artifact files or directories of artifact files. No BLAST, Mash or genome FASTA files are needed.')
+    parser.add_argument('--shard',
+                        help='Only analyze shard i of N of the input genomes given as "i/N" (1-based), e.g. to split a batch across cluster nodes. Inputs are ordered by genome name and split into N contiguous shards; combine the shard outputs with "sistr_cmd merge".')
+    parser.add_argument('--queue',
+                        help='SQLite work queue database on shared storage to add the input genomes to. Genomes are analyzed by this run\'s --threads worker processes (none with "-t 0") and by any "sistr_cmd worker" processes on other hosts, and all results are written to the requested outputs in input order once finished. Rerunning with the same queue reuses finished results.')
+    parser.add_argument('--preflight',
+                        action='store_true',
+                        help='Check all input FASTA files in parallel (with --threads processes) before any analysis: FASTA format, IUPAC nucleotide characters, genome size and duplicate content. Invalid inputs are rejected up front and not analyzed.')
+    parser.add_argument('--manifest',
+                        help='Write a JSON manifest of the pre-flight check of each input (file size, genome size, number of contigs, content SHA-256, duplicates and errors) to this path. Implies --preflight.')
     parser.add_argument('-T',
                         '--tmp-dir',
                         default='/tmp',
@@ -86,6 +129,11 @@ PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
     parser.add_argument('-m', '--run-mash',
                         action='store_true',
                         help='Determine Mash MinHash genomic distances to Salmonella genomes with trusted serovar designations. Mash binary must be in accessible via $PATH (e.g. /usr/bin).')
+    parser.add_argument('--native-mash',
+                        action='store_true',
+                        help='With --run-mash, compute Mash distances in-process with a NumPy MinHash implementation instead of running the Mash binary for each genome. The Mash binary is only needed once to cache the reference sketch hashes.')
+    parser.add_argument('--mash-sketch-cache',
+                        help='Directory to cache Mash sketches of input genomes in (by FASTA content hash) for reuse across runs. By default sketches are only kept for the current run.')
     parser.add_argument('--qc',
                         action='store_true',
                         help='Perform basic QC to provide level of confidence in serovar prediction results.')
@@ -93,6 +141,8 @@ PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
                         type=int,
                         default=1,
                         help='Number of parallel threads to run sistr_cmd analysis.')
+    parser.add_argument('--max-memory',
+                        help='Memory budget of all analysis processes (e.g. "16G"). With --threads > 1, genomes are only started while the measured memory use of the worker processes and the estimated memory of running genomes (from genome size and analysis options) stay within the budget, so a high --threads is throttled instead of running out of memory.')
     parser.add_argument('-l', '--list-of-serovars', nargs='?',
                         required=False, const=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/serovar-list.txt"),
                         help='A path to a single column text file containing list of serovars to check SISTR serovar prediction against. Result reported in the "predicted_serovar_in_list" field as Y (present) or N (absent) value.')
@@ -105,12 +155,186 @@ PLoS ONE 11(1): e0147101. doi: 10.1371/journal.pone.0147101
     return parser
 
 
-def run_mash(input_fasta):
-    from sistr.src.mash import mash_dist_trusted, mash_output_to_pandas_df, mash_subspeciation
+def init_reprofile_parser():
+    prog_desc = '''
+Re-predict cgMLST330 and overall serovars, subspecies and closest reference genomes from existing cgMLST330
+allelic profiles and saved antigen gene predictions (e.g. after a SISTR reference data update).
+
+No BLAST searching is performed and no genome FASTA files are needed. Allelic profiles are read from a previous
+run's cgMLST profiles output (-p/--cgmlst-profiles) or allele results output (-a/--alleles-output) and saved
+serogroup, H1 and H2 antigen predictions (and Mash results) from its prediction output (-o).
+'''
+    parser = argparse.ArgumentParser(prog='sistr_cmd reprofile',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=prog_desc)
+    profiles = parser.add_mutually_exclusive_group(required=True)
+    profiles.add_argument('-p',
+                          '--cgmlst-profiles',
+                          help='cgMLST330 allelic profiles (CSV, Parquet or Arrow) from a previous run')
+    profiles.add_argument('-a',
+                          '--alleles',
+                          help='Allele results JSON ("json" or "compact" format) from a previous run')
+    parser.add_argument('-P',
+                        '--predictions',
+                        required=True,
+                        help='Prediction output of a previous run with saved antigen predictions (json, jsonl, csv, tab, parquet or arrow)')
+    parser.add_argument('-f',
+                        '--output-format',
+                        default='json',
+                        help='Output format (json, jsonl, csv, tab, parquet, arrow, pickle)')
+    parser.add_argument('-o',
+                        '--output-prediction',
+                        help='SISTR serovar prediction output path')
+    parser.add_argument('-M',
+                        '--more-results',
+                        action='count',
+                        default=0,
+                        help='Output more detailed results (-M)')
+    parser.add_argument('--results-db',
+                        help='SQLite database path to add predictions and cgMLST allele calls to (created if it does not exist)')
+    parser.add_argument('--qc',
+                        action='store_true',
+                        help='Re-run QC on the new predictions. The genome size check result is taken from the saved QC messages. By default saved QC results are kept.')
+    parser.add_argument('-l', '--list-of-serovars', nargs='?',
+                        required=False, const=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data/serovar-list.txt"),
+                        help='A path to a single column text file containing list of serovars to check SISTR serovar prediction against. Result reported in the "predicted_serovar_in_list" field as Y (present) or N (absent) value.')
+    parser.add_argument('-v',
+                        '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    return parser
+
+
+def init_merge_parser():
+    prog_desc = '''
+Merge the outputs of SISTR runs on separate shards of a batch of genomes (see "sistr_cmd --shard i/N").
+
+Predictions, cgMLST330 profiles and allele results are merged in genome name order and novel alleles in marker and
+allele name order. Genomes (or novel alleles) found in more than one input are written once, keeping the first input's
+results.
+'''
+    parser = argparse.ArgumentParser(prog='sistr_cmd merge',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=prog_desc)
+    parser.add_argument('-P',
+                        '--predictions',
+                        nargs='+',
+                        default=[],
+                        help='Prediction outputs to merge (json, jsonl, csv, tab, parquet or arrow)')
+    parser.add_argument('-p',
+                        '--cgmlst-profiles',
+                        nargs='+',
+                        default=[],
+                        help='cgMLST330 allelic profiles outputs to merge (CSV, Parquet or Arrow)')
+    parser.add_argument('-a',
+                        '--alleles',
+                        nargs='+',
+                        default=[],
+                        help='Allele results JSON outputs to merge ("json" or "compact" format)')
+    parser.add_argument('-n',
+                        '--novel-alleles',
+                        nargs='+',
+                        default=[],
+                        help='Novel cgMLST330 allele FASTA outputs to merge')
+    parser.add_argument('-o',
+                        '--output-prediction',
+                        help='Merged prediction output path')
+    parser.add_argument('-f',
+                        '--output-format',
+                        default='json',
+                        help='Merged prediction output format (json, jsonl, csv, tab, parquet, arrow, pickle)')
+    parser.add_argument('-M',
+                        '--more-results',
+                        action='count',
+                        default=0,
+                        help='Output more detailed results (-M) and all antigen search blastn results (-MM) if present in the inputs')
+    parser.add_argument('--output-cgmlst-profiles',
+                        help='Merged cgMLST330 allelic profiles output path (CSV, or Parquet/Arrow table if path ends with ".parquet" or ".arrow")')
+    parser.add_argument('--output-alleles',
+                        help='Merged allele results JSON output path')
+    parser.add_argument('--alleles-format',
+                        choices=['json', 'compact'],
+                        default='json',
+                        help='Merged allele results output format (default: json)')
+    parser.add_argument('--output-novel-alleles',
+                        help='Merged novel cgMLST330 allele FASTA output path')
+    parser.add_argument('-v',
+                        '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    return parser
+
+
+def init_worker_parser():
+    prog_desc = '''
+Analyze genomes from a shared work queue created with "sistr_cmd --queue QUEUE".
+
+Workers on any host with access to the queue database (and the input FASTA files) claim genomes one at a time, so
+genomes are balanced across hosts regardless of their analysis time. Genomes are analyzed with the options of the
+"sistr_cmd --queue" run and results are stored in the queue. Genomes of workers that stop sending heartbeats are
+reclaimed by other workers. Workers exit when all genomes in the queue are finished.
+'''
+    from sistr.src.work_queue import HEARTBEAT_INTERVAL, MAX_ATTEMPTS, STALE_AFTER
+    parser = argparse.ArgumentParser(prog='sistr_cmd worker',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=prog_desc)
+    parser.add_argument('queue',
+                        help='Work queue SQLite database path')
+    parser.add_argument('-t', '--threads',
+                        type=int,
+                        default=1,
+                        help='Number of parallel worker processes')
+    parser.add_argument('-T',
+                        '--tmp-dir',
+                        default='/tmp',
+                        help='Base temporary working directory for intermediate analysis files.')
+    parser.add_argument('-K',
+                        '--keep-tmp',
+                        action='store_true',
+                        help='Keep temporary analysis files.')
+    parser.add_argument('--heartbeat-interval',
+                        type=float,
+                        default=HEARTBEAT_INTERVAL,
+                        help='Seconds between heartbeats of running genomes (default: %(default)s)')
+    parser.add_argument('--stale-after',
+                        type=float,
+                        default=STALE_AFTER,
+                        help='Seconds without a heartbeat after which another worker\'s genome is reclaimed (default: %(default)s)')
+    parser.add_argument('--max-attempts',
+                        type=int,
+                        default=MAX_ATTEMPTS,
+                        help='Max number of attempts per genome before it is marked as failed (default: %(default)s)')
+    parser.add_argument('-v',
+                        '--verbose',
+                        action='count',
+                        default=0,
+                        help='Logging verbosity level (-v == show warnings; -vvv == show debug info)')
+    return parser
+
+
+def run_mash(input_fasta, mash_out=None):
+    """Mash serovar and subspecies prediction
 
-    mash_out = mash_dist_trusted(input_fasta)
-    df_mash = mash_output_to_pandas_df(mash_out)
-    if df_mash.empty:
+    Args:
+        input_fasta (str): genome FASTA path
+        mash_out (bytes or sistr.src.mash.MashResults): `mash dist` output or parsed Mash results for the genome
+            if already computed (see :func:`sistr.src.mash.mash_dist_batch`); `mash dist` is run on `input_fasta`
+            if None
+
+    Returns:
+        dict: Mash prediction results
+    """
+    from sistr.src.mash import MashResults, mash_dist_trusted, parse_mash_dist, mash_subspeciation
+
+    if mash_out is None:
+        mash_out = mash_dist_trusted(input_fasta)
+    if isinstance(mash_out, MashResults):
+        mash_results = mash_out
+    else:
+        mash_results = parse_mash_dist(mash_out, top_k=5)
+    if mash_results.empty:
         logging.error('Could not perform Mash subspeciation!')
         mash_result_dict = {
             'mash_genome': '',
@@ -121,9 +345,9 @@ def run_mash(input_fasta):
             'mash_top_5': {},
         }
         return mash_result_dict
-    df_mash_top_5 = df_mash[['ref', 'dist', 'n_match', 'serovar']].head(n=5)
-    logging.debug('Mash top 5 results:\n{}\n'.format(df_mash_top_5))
-    mash_spp_tuple = mash_subspeciation(df_mash)
+    mash_top_5 = mash_results.top_to_dict()
+    logging.debug('Mash top 5 results:\n{}\n'.format(mash_top_5))
+    mash_spp_tuple = mash_subspeciation(mash_results)
     spp = None
     if mash_spp_tuple is not None:
         spp, spp_dict, spp_counter = mash_spp_tuple
@@ -132,29 +356,31 @@ def run_mash(input_fasta):
     else:
         logging.error('Could not perform Mash subspeciation!')
 
-    for idx, row in df_mash_top_5.iterrows():
-        mash_genome = row['ref']
-        mash_serovar = row['serovar']
-        mash_distance = row['dist']
-        mash_match = row['n_match']
+    # closest reference genome, as reported by the first iteration of the previous top 5 results loop; ties in
+    # distance go to the first of the tied genomes in `mash dist` output
+    top = mash_results.top[0]
+    mash_genome = top['ref']
+    mash_serovar = top['serovar']
+    mash_distance = top['dist']
+    mash_match = top['n_match']
 
-        log_msg = 'Top serovar by Mash: "{}" with dist={}, # matching sketches={}, matching genome={}'
-        logging.info(log_msg.format(mash_serovar, mash_distance, mash_match, mash_genome))
+    log_msg = 'Top serovar by Mash: "{}" with dist={}, # matching sketches={}, matching genome={}'
+    logging.info(log_msg.format(mash_serovar, mash_distance, mash_match, mash_genome))
 
-        mash_result_dict = {
-            'mash_genome': mash_genome,
-            'mash_serovar': mash_serovar,
-            'mash_distance': mash_distance,
-            'mash_match': mash_match,
-            'mash_subspecies': spp,
-            'mash_top_5': df_mash_top_5.to_dict(),
-        }
-        return mash_result_dict
+    mash_result_dict = {
+        'mash_genome': mash_genome,
+        'mash_serovar': mash_serovar,
+        'mash_distance': mash_distance,
+        'mash_match': mash_match,
+        'mash_subspecies': spp,
+        'mash_top_5': mash_top_5,
+    }
+    return mash_result_dict
 
 
 def merge_mash_prediction(prediction, mash_prediction):
     for k in mash_prediction:
-        prediction.__dict__[k] = mash_prediction[k]
+        setattr(prediction, k, mash_prediction[k])
     return prediction
 
 
@@ -174,18 +400,13 @@ def merge_cgmlst_prediction(serovar_prediction, cgmlst_prediction):
 
 
 def infer_o_antigen(prediction):
-    df_serovar = serovar_table()
     if '|' in prediction.serovar:
         prediction.o_antigen = '-'
     else:
-        predicted_serovars = [prediction.serovar]
-        series_o_antigens = df_serovar.O_antigen[df_serovar.Serovar.isin(predicted_serovars)]
-        
-        if series_o_antigens.size == 0:
+        most_common_o_antigen = serovar_resolver().o_antigen(prediction.serovar)
+        if most_common_o_antigen is None:
             prediction.o_antigen = '-'
         else:
-            counter_o_antigens = Counter(series_o_antigens)
-            most_common_o_antigen = counter_o_antigens.most_common(1)[0][0]
             logging.info(f"Reporting final O-antigen result {most_common_o_antigen}")        
             prediction.o_antigen = most_common_o_antigen
     prediction.antigenic_formula=f"{prediction.o_antigen}:{prediction.h1}:{prediction.h2}"    
@@ -248,83 +469,182 @@ def setup_sistr_dbs():
 
 
 
-def sistr_predict(input_fasta, genome_name, tmp_dir, keep_tmp, args):
-    blast_runner = None
+def selected_serovars(args):
+    """List of serovars (-l/--list-of-serovars) to check the overall serovar prediction against (empty if none)"""
     serovars_selected_list = []
     if args.list_of_serovars:
-        if os.path.exists(args.list_of_serovars):
-            with open(args.list_of_serovars) as fp:
-                serovars_selected_list = [l.rstrip() for l in fp.readlines()]
+        serovars_selected_list = reference_data().serovar_list(args.list_of_serovars)
+        if serovars_selected_list is not None:
             logging.info(f"Using the selected list of serovars {args.list_of_serovars} with {len(serovars_selected_list)} serovars to check overall SISTR serovar prediction against. Result will be reported in the 'predicted_serovar_in_list' field")
         else:
+            serovars_selected_list = []
             logging.warning(f"File {args.list_of_serovars} does not exist in path specified. Would not perform SISTR serovar check against the list of serovars ...")      
-    
+    return serovars_selected_list
+
+
+def finalize_prediction(prediction, serovar_predictor, cgmlst_prediction, mash_prediction, serovars_selected_list, args):
+    """Add cgMLST and Mash results to an antigen gene prediction and make the overall serovar call
+
+    Args:
+        prediction (SerovarPrediction): antigen gene serovar prediction
+        serovar_predictor (SerovarPredictor): antigen gene serovar predictor
+        cgmlst_prediction (dict): cgMLST prediction or None
+        mash_prediction (dict): Mash prediction or None
+        serovars_selected_list (list of str): serovars to check the overall serovar prediction against
+        args (argparse.Namespace): sistr_cmd arguments
+    """
+    if cgmlst_prediction:
+        merge_cgmlst_prediction(prediction, cgmlst_prediction)
+    if mash_prediction:
+        merge_mash_prediction(prediction, mash_prediction)
+    overall_serovar_call(prediction, serovar_predictor)
+    infer_o_antigen(prediction)
+    # if list of reportable serovars is provided to check prediction serovar against
+    if serovars_selected_list:
+        prediction.predicted_serovar_in_list = "N"
+        for serovar in serovars_selected_list:
+            if serovar in prediction.serovar: #try to match list serovar to the predicted serovar(s) 
+                prediction.predicted_serovar_in_list = "Y"
+                logging.info(f"Found {serovar} serovar from {args.list_of_serovars} in SISTR predicted serovar(s) ({prediction.serovar})")
+                break
+
+
+def predict_genome(blast_runner, input_fasta, genome_name, args, mash_out=None, genome_size=None):
+    """Mash, cgMLST and antigen gene serovar prediction of a genome with a prepared BLAST runner
+
+    Args:
+        blast_runner (sistr.src.blast_wrapper.BlastRunner): blastn runner with genome BLAST DB prepared, or
+            :class:`sistr.src.artifacts.ArtifactBlastRunner` to rebuild the prediction from artifacts
+        input_fasta (str): genome FASTA path
+        genome_name (str): genome name
+        args (argparse.Namespace): sistr_cmd arguments
+        mash_out (bytes or sistr.src.mash.MashResults): `mash dist` output or parsed Mash results for the genome
+            if already computed
+        genome_size (int): genome size for QC; taken from the runner's loaded genome or computed from
+            `input_fasta` if None
+
+    Returns:
+        (SerovarPrediction, dict): prediction and cgMLST results
+    """
+    serovars_selected_list = selected_serovars(args)
+    artifacts = blast_runner.artifacts
+    spp = None
+    mash_prediction = None
+    if args.run_mash:
+        if blast_runner.replay:
+            mash_out = artifacts.mash_out
+            if mash_out is None:
+                logging.warning('%s | No Mash results in artifacts! Skipping Mash prediction', genome_name)
+        else:
+            if args.native_mash and mash_out is None:
+                from sistr.src.minhash import native_mash_dist
+                mash_out = native_mash_dist(input_fasta)
+            if mash_out is None:
+                from sistr.src.mash import mash_dist_trusted
+                mash_out = mash_dist_trusted(input_fasta)
+            if artifacts is not None:
+                artifacts.mash_out = mash_out
+        if mash_out is not None:
+            mash_prediction = run_mash(input_fasta, mash_out)
+            spp = mash_prediction['mash_subspecies']
+
+    cgmlst_prediction = None
+    cgmlst_results = None
+    if not args.no_cgmlst:
+        cgmlst_prediction, cgmlst_results = run_cgmlst(blast_runner, full=args.use_full_cgmlst_db)
+        spp = cgmlst_prediction['subspecies']
+
+    serovar_predictor = SerovarPredictor(blast_runner,
+                                         spp,
+                                         more_results=args.more_results,
+                                         keep_blast_results=True if args.blast_hits_output else None)
+    serovar_predictor.predict_serovar_from_antigen_blast()
+
+    prediction = serovar_predictor.get_serovar_prediction()
+    prediction.genome = genome_name
+    prediction.fasta_filepath = os.path.abspath(input_fasta)
+    finalize_prediction(prediction, serovar_predictor, cgmlst_prediction, mash_prediction, serovars_selected_list, args)
+
+    logging.info('%s | Antigen gene BLAST serovar prediction: "%s" serogroup=%s %s:%s:%s',
+                 genome_name,
+                 prediction.serovar_antigen,
+                 prediction.serogroup,
+                 prediction.o_antigen,
+                 prediction.h1,
+                 prediction.h2)
+    logging.info(f'{genome_name} | cgMLST serovar prediction: {prediction.serovar_cgmlst} assigned by '
+                 f'top matching genome {prediction.cgmlst_genome_match} at {prediction.cgmlst_matching_alleles}/330 matching alleles ratio')
+    logging.info('%s | Subspecies prediction: %s',
+                 genome_name,
+                 spp)
+    logging.info('%s | Overall serovar prediction: %s',
+                 genome_name,
+                 prediction.serovar)
+    if args.qc:
+        qc_status, qc_msgs = qc(blast_runner.tmp_fasta_path, cgmlst_results, prediction,
+                                genome_size=genome_size,
+                                genome=blast_runner.genome)
+        prediction.qc_status = qc_status
+        prediction.qc_messages = ' | '.join(qc_msgs)
+    return prediction, cgmlst_results
+
+
+def sistr_predict(input_fasta, genome_name, tmp_dir, keep_tmp, args, mash_out=None, genome=None):
+    """Analyze a genome FASTA file or a genome already loaded into memory
+
+    Args:
+        input_fasta (str): genome FASTA path; None if `genome` is only in memory
+        genome_name (str): genome name; taken from `input_fasta` if None or empty
+        tmp_dir (str): base temporary working directory
+        keep_tmp (bool): keep the temporary analysis directory?
+        args (argparse.Namespace): sistr_cmd arguments
+        mash_out (bytes or sistr.src.mash.MashResults): `mash dist` output or parsed Mash results for the genome
+            if already computed
+        genome (sistr.src.genome.Genome): loaded genome (e.g. from a multi-genome FASTA); read from `input_fasta`
+            if None
+
+    Returns:
+        (SerovarPrediction, dict): prediction and cgMLST results
+    """
+    blast_runner = None
     try:
-        assert os.path.exists(input_fasta), "Input fasta file '%s' must exist!" % input_fasta
+        if genome is None:
+            assert os.path.exists(input_fasta), "Input fasta file '%s' must exist!" % input_fasta
         if genome_name is None or genome_name == '':
-            genome_name = genome_name_from_fasta_path(input_fasta)
+            genome_name = genome_name_from_fasta_path(input_fasta) if genome is None else genome.name
         dtnow = datetime.now()
         genome_name_no_spaces = re.sub(r'\W', '_', genome_name)
         genome_tmp_dir = os.path.join(tmp_dir, dtnow.strftime("%Y%m%d%H%M%S") + '-' + 'SISTR' + '-' + genome_name_no_spaces)
-        blast_runner = BlastRunner(input_fasta, genome_tmp_dir)
+        if genome is None:
+            genome = Genome.from_fasta(input_fasta, genome_name)
+        blast_runner = BlastRunner(input_fasta, genome_tmp_dir, genome=genome)
         logging.info('Initializing temporary analysis directory "%s" and preparing for BLAST searching.', genome_tmp_dir)
         blast_runner.prep_blast()
-        logging.info('Temporary FASTA file copied to %s', blast_runner.tmp_fasta_path)
-        spp = None
-        mash_prediction = None
-        if args.run_mash:
-            mash_prediction = run_mash(input_fasta)
-            spp = mash_prediction['mash_subspecies']
-
-        cgmlst_prediction = None
-        cgmlst_results = None
-        if not args.no_cgmlst:
-            cgmlst_prediction, cgmlst_results = run_cgmlst(blast_runner, full=args.use_full_cgmlst_db)
-            spp = cgmlst_prediction['subspecies']
-
-        serovar_predictor = SerovarPredictor(blast_runner, spp)
-        serovar_predictor.predict_serovar_from_antigen_blast()
-
-        prediction = serovar_predictor.get_serovar_prediction()
-        prediction.genome = genome_name
-        prediction.fasta_filepath = os.path.abspath(input_fasta)
-
-        if cgmlst_prediction:
-            merge_cgmlst_prediction(prediction, cgmlst_prediction)
-        if mash_prediction:
-            merge_mash_prediction(prediction, mash_prediction)
-        overall_serovar_call(prediction, serovar_predictor)
-        infer_o_antigen(prediction)
-        # if list of reportable serovars is provided to check prediction serovar against
-        if serovars_selected_list:
-            prediction.predicted_serovar_in_list = "N"
-            for serovar in serovars_selected_list:
-                if serovar in prediction.serovar: #try to match list serovar to the predicted serovar(s) 
-                    prediction.predicted_serovar_in_list = "Y"
-                    logging.info(f"Found {serovar} serovar from {args.list_of_serovars} in SISTR predicted serovar(s) ({prediction.serovar})")
-                    break
-
-        logging.info('%s | Antigen gene BLAST serovar prediction: "%s" serogroup=%s %s:%s:%s',
-                     genome_name,
-                     prediction.serovar_antigen,
-                     prediction.serogroup,
-                     prediction.o_antigen,
-                     prediction.h1,
-                     prediction.h2)
-        logging.info(f'{genome_name} | cgMLST serovar prediction: {prediction.serovar_cgmlst} assigned by '
-                     f'top matching genome {prediction.cgmlst_genome_match} at {prediction.cgmlst_matching_alleles}/330 matching alleles ratio')
-        logging.info('%s | Subspecies prediction: %s',
-                     genome_name,
-                     spp)
-        logging.info('%s | Overall serovar prediction: %s',
-                     genome_name,
-                     prediction.serovar)
-        if args.qc:
-            qc_status, qc_msgs = qc(blast_runner.tmp_fasta_path, cgmlst_results, prediction)
-            prediction.qc_status = qc_status
-            prediction.qc_messages = ' | '.join(qc_msgs)
+        logging.info('Temporary FASTA file written to %s', blast_runner.tmp_fasta_path)
+        fasta_filepath = os.path.abspath(input_fasta) if input_fasta is not None else genome.fasta_path
+        # digest computed while the genome was read; None for genomes only in memory
+        fasta_sha256 = genome.sha256
+        if args.artifacts_dir:
+            from sistr.src.artifacts import GenomeArtifacts
+            blast_runner.artifacts = GenomeArtifacts(genome_name,
+                                                     fasta_filepath=fasta_filepath,
+                                                     fasta_sha256=fasta_sha256,
+                                                     genome_size=genome.size)
+        # Mash runs on the staged plain FASTA written from memory rather than re-reading the
+        # (possibly compressed or remote) input
+        prediction, cgmlst_results = predict_genome(blast_runner, blast_runner.tmp_fasta_path, genome_name, args,
+                                                    mash_out=mash_out)
+        prediction.fasta_filepath = fasta_filepath
+        prediction.input_sha256 = fasta_sha256
+        if blast_runner.artifacts is not None:
+            from sistr.src.artifacts import artifacts_path
+            path = artifacts_path(args.artifacts_dir, genome_name)
+            blast_runner.artifacts.save(path)
+            logging.info('%s | Wrote search artifacts to %s', genome_name, path)
     finally:
-        if not keep_tmp:
+        if blast_runner is None:
+            pass
+        elif not keep_tmp:
             logging.info('Deleting temporary working directory at %s', blast_runner.tmp_work_dir)
             blast_runner.cleanup()
         else:
@@ -332,6 +652,221 @@ def sistr_predict(input_fasta, genome_name, tmp_dir, keep_tmp, args):
     return prediction, cgmlst_results
 
 
+def sistr_predict_from_artifacts(artifacts_path, args):
+    """Rebuild a genome's prediction from search artifacts without BLAST, Mash or the genome FASTA
+
+    Args:
+        artifacts_path (str): genome artifacts file path (see `--artifacts-dir`)
+        args (argparse.Namespace): sistr_cmd arguments
+
+    Returns:
+        (SerovarPrediction, dict): prediction and cgMLST results
+    """
+    from sistr.src.artifacts import GenomeArtifacts, ArtifactBlastRunner
+    artifacts = GenomeArtifacts.load(artifacts_path)
+    logging.info('%s | Rebuilding prediction from search artifacts %s', artifacts.genome, artifacts_path)
+    prediction, cgmlst_results = predict_genome(ArtifactBlastRunner(artifacts),
+                                                artifacts.fasta_filepath,
+                                                artifacts.genome,
+                                                args,
+                                                genome_size=artifacts.genome_size)
+    prediction.input_sha256 = artifacts.fasta_sha256
+    return prediction, cgmlst_results
+
+
+def sistr_predict_from_artifacts_star(sistr_predict_args):
+    """:func:`sistr_predict_from_artifacts` taking a single tuple of arguments for use with ``Pool.imap``"""
+    return sistr_predict_from_artifacts(*sistr_predict_args)
+
+
+def run_mash_batch(input_fastas, args, sha256s=None):
+    """Mash distances for all input genomes with a single `mash dist` run
+
+    Args:
+        input_fastas (list of str): input genome FASTA paths
+        args (argparse.Namespace): sistr_cmd arguments
+        sha256s (dict): input FASTA path to SHA-256 of files already hashed
+
+    Returns:
+        dict: FASTA path to parsed Mash results (:class:`sistr.src.mash.MashResults`)
+    """
+    import tempfile
+    from sistr.src.mash import mash_dist_batch
+
+    cache_dir = args.mash_sketch_cache
+    if cache_dir:
+        return mash_dist_batch(input_fastas, cache_dir, threads=args.threads, sha256s=sha256s)
+    cache_dir = tempfile.mkdtemp(prefix='SISTR-mash-', dir=args.tmp_dir)
+    try:
+        return mash_dist_batch(input_fastas, cache_dir, threads=args.threads, sha256s=sha256s)
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+def input_sha256s(input_fastas, threads=1, known=None):
+    """SHA-256 digests of input FASTA files (see :func:`sistr.src.parsers.file_sha256`) hashed in parallel
+
+    Args:
+        input_fastas (list of str): input genome FASTA paths
+        threads (int): number of files hashed at a time
+        known (dict): absolute FASTA path to SHA-256 of files already hashed (e.g. by the pre-flight check)
+
+    Returns:
+        dict: absolute FASTA path to SHA-256 hex digest of `known` and all existing input files
+    """
+    from multiprocessing.pool import ThreadPool
+    from sistr.src.parsers import file_sha256
+    digests = dict(known or {})
+    paths = [x for x in dict.fromkeys(os.path.abspath(x) for x in input_fastas)
+             if x not in digests and os.path.exists(x)]
+    if paths:
+        with ThreadPool(max(1, min(threads, len(paths)))) as pool:
+            digests.update(zip(paths, pool.map(file_sha256, paths)))
+    return digests
+
+
+def result_cache_options(args):
+    """Analysis options affecting per-genome results for result cache keys
+
+    Args:
+        args (argparse.Namespace): sistr_cmd arguments
+
+    Returns:
+        dict: option name to value
+    """
+    from sistr.src.parsers import file_sha256
+    serovar_list = None
+    if args.list_of_serovars and os.path.exists(args.list_of_serovars):
+        serovar_list = file_sha256(args.list_of_serovars)
+    return {'use_full_cgmlst_db': args.use_full_cgmlst_db,
+            'no_cgmlst': args.no_cgmlst,
+            'run_mash': args.run_mash,
+            'native_mash': args.native_mash,
+            'qc': args.qc,
+            'more_results': args.more_results,
+            'blast_hits_output': bool(args.blast_hits_output),
+            'list_of_serovars': serovar_list}
+
+
+def cached_outputs(result_cache, keys, inputs, run_indices, outputs):
+    """Results of all input genomes in input order from the result cache or the analysis of uncached genomes
+
+    Args:
+        result_cache (sistr.src.result_cache.ResultCache or sistr.src.checkpoint.Checkpoint): stored results
+        keys (list of str): key of each input genome (None if not cacheable)
+        inputs (list of tuple): :func:`sistr_predict` arguments of each input genome
+        run_indices (list of int): indices of inputs analyzed in `outputs` (in order)
+        outputs (iterator): :func:`sistr_predict` results of inputs at `run_indices`
+
+    Yields:
+        (SerovarPrediction, dict): prediction and cgMLST results of each input genome
+    """
+    import copy
+    run_indices = set(run_indices)
+    remaining = Counter(keys)
+    results = {}
+    for i, (key, sistr_predict_args) in enumerate(zip(keys, inputs)):
+        if key is None:
+            yield next(outputs)
+            continue
+        if key in results:
+            result = results[key]
+        elif i in run_indices:
+            result = next(outputs)
+            result_cache.put(key, result)
+        else:
+            result = result_cache.get(key)
+            if result is None:
+                # evicted since scheduling
+                result = sistr_predict(*sistr_predict_args)
+                result_cache.put(key, result)
+        remaining[key] -= 1
+        if remaining[key] > 0:
+            results[key] = result
+        else:
+            results.pop(key, None)
+        prediction, cgmlst_results = result
+        input_fasta, genome_name = sistr_predict_args[:2]
+        if genome_name is None or genome_name == '':
+            genome_name = genome_name_from_fasta_path(input_fasta)
+        if prediction.genome != genome_name or getattr(prediction, 'fasta_filepath', None) != os.path.abspath(input_fasta):
+            prediction = copy.copy(prediction)
+            prediction.genome = genome_name
+            prediction.fasta_filepath = os.path.abspath(input_fasta)
+        yield prediction, cgmlst_results
+
+
+def uncached_indices(store, keys):
+    """Indices of inputs to analyze: the first of inputs with identical keys that have no stored results
+
+    Args:
+        store (sistr.src.result_cache.ResultCache or sistr.src.checkpoint.Checkpoint): stored results
+        keys (list of str): key of each input (None if results cannot be stored)
+
+    Returns:
+        list of int: input indices in input order
+    """
+    run_indices = []
+    scheduled = set()
+    for i, key in enumerate(keys):
+        if key is None:
+            run_indices.append(i)
+        elif key not in scheduled and key not in store:
+            run_indices.append(i)
+            scheduled.add(key)
+    return run_indices
+
+
+def sistr_predict_star(sistr_predict_args):
+    """:func:`sistr_predict` taking a single tuple of arguments for use with ``Pool.imap``"""
+    return sistr_predict(*sistr_predict_args)
+
+
+def indexed_call(func_index_args):
+    """Call ``func(args)`` on a ``(func, index, args)`` tuple returning ``(index, result)`` for
+    ``Pool.imap_unordered``"""
+    func, i, args = func_index_args
+    return i, func(args)
+
+
+def sistr_predict_checkpointed_star(checkpoint_args):
+    """:func:`sistr_predict` recording the results in a checkpoint directory as soon as the genome is finished
+
+    Results are recorded in the worker rather than when they are written to
+    the outputs in input order so that no finished work is lost if the run is
+    interrupted.
+
+    Args:
+        checkpoint_args (tuple): checkpoint directory, checkpoint key and :func:`sistr_predict` arguments
+
+    Returns:
+        (SerovarPrediction, dict): prediction and cgMLST results
+    """
+    from sistr.src.checkpoint import Checkpoint
+    checkpoint_dir, key, sistr_predict_args = checkpoint_args
+    result = sistr_predict(*sistr_predict_args)
+    Checkpoint(checkpoint_dir).put(key, result)
+    return result
+
+
+def preload_reference_data(args):
+    """Load reference data and serovar lookups needed for a run once per process
+
+    Called in the parent process before forking worker processes so that
+    workers inherit the loaded data, and as the worker Pool initializer so
+    that workers started without forking load it only once.
+
+    Args:
+        args (argparse.Namespace): sistr_cmd arguments
+    """
+    reference_data().preload(cgmlst=not args.no_cgmlst,
+                             serovar_list_path=args.list_of_serovars)
+    serovar_resolver()
+    if args.run_mash and args.native_mash and not args.from_artifacts:
+        from sistr.src.minhash import reference_sketch
+        reference_sketch()
+
+
 def genome_name_from_fasta_path(fasta_path):
     """Extract genome name from fasta filename
 
@@ -356,41 +891,523 @@ def genome_name_from_fasta_path(fasta_path):
 
 
 def write_cgmlst_profiles(fastas, cgmlst_results, output_path):
-    genome_marker_cgmlst_result = {}
-    for genome, res in zip(fastas, cgmlst_results):
-        tmp = {}
-        for marker, res_dict in res.items():
-            aname = res_dict['name']
-            tmp[marker] = int(aname) if aname is not None else None
-        genome_marker_cgmlst_result[genome] = tmp
-    import pandas as pd
-    df = pd.DataFrame(genome_marker_cgmlst_result).transpose()
-    df.to_csv(output_path, float_format='%.0f')
+    from sistr.src.writers import CgmlstProfilesWriter
+    with CgmlstProfilesWriter(output_path, reference_data().cgmlst_profiles.columns) as writer:
+        for genome, res in zip(fastas, cgmlst_results):
+            writer.write(genome, res)
 
 
 def write_cgmlst_results_json(input_fastas, cgmlst_results, output_path):
-    import json
-    with open(output_path, 'w') as fout:
-        json.dump({x:y for x,y in zip(input_fastas, cgmlst_results)}, fout)
+    from sistr.src.writers import AllelesJsonWriter
+    with AllelesJsonWriter(output_path) as writer:
+        for genome, res in zip(input_fastas, cgmlst_results):
+            writer.write(genome, res)
 
 
 def write_novel_alleles(cgmlst_results, output_path):
+    from sistr.src.writers import NovelAllelesWriter
+    with NovelAllelesWriter(output_path) as writer:
+        for res in cgmlst_results:
+            writer.write(res)
+    return writer.count
+
+
+#: tuple: fields of saved predictions kept as they are when re-predicting from allelic profiles
+REPROFILE_SAVED_FIELDS = ('genome',
+                          'fasta_filepath',
+                          'mash_genome',
+                          'mash_serovar',
+                          'mash_distance',
+                          'mash_match',
+                          'mash_subspecies',
+                          'mash_top_5',
+                          'qc_status',
+                          'qc_messages')
+
+
+def saved_genome_size(prediction):
+    """Genome size reported in a saved prediction's QC messages (only reported if outside the expected range)"""
+    m = re.search(r'Input genome size \((\d+) bp\)', getattr(prediction, 'qc_messages', None) or '')
+    return int(m.group(1)) if m else None
+
+
+def reprofile_predictions(df_profiles, saved_predictions, args):
+    """Re-predict serovars from cgMLST330 allelic profiles and saved antigen gene predictions
+
+    Args:
+        df_profiles (pandas.DataFrame): allelic profiles indexed by genome (see
+            :func:`sistr.src.readers.read_cgmlst_profiles`)
+        saved_predictions (dict): genome name to saved prediction output dict
+        args (argparse.Namespace): `sistr_cmd reprofile` arguments
+
+    Yields:
+        (SerovarPrediction, dict): prediction and cgMLST results of each genome with a saved prediction
+    """
+    from sistr.src.cgmlst import cgmlst_predictions_from_profiles
+    from sistr.src.serovar_prediction import SavedAntigenSerovarPredictor, SerovarPrediction, record_from_output_dict
+
+    serovars_selected_list = selected_serovars(args)
+    for genome_name, cgmlst_prediction, cgmlst_results in cgmlst_predictions_from_profiles(df_profiles):
+        if genome_name not in saved_predictions:
+            logging.warning('%s | No saved antigen predictions! Skipping genome', genome_name)
+            continue
+        saved = record_from_output_dict(SerovarPrediction, saved_predictions[genome_name])
+        serovar_predictor = SavedAntigenSerovarPredictor.from_prediction(cgmlst_prediction['subspecies'], saved)
+        serovar_predictor.predict_serovar_from_antigen_blast()
+        prediction = serovar_predictor.get_serovar_prediction()
+        for field in REPROFILE_SAVED_FIELDS:
+            if saved.has(field):
+                setattr(prediction, field, getattr(saved, field))
+        # saved Mash results are kept as they are
+        finalize_prediction(prediction, serovar_predictor, cgmlst_prediction, None, serovars_selected_list, args)
+        if args.qc:
+            qc_status, qc_msgs = qc(None, cgmlst_results, prediction, genome_size=saved_genome_size(saved))
+            prediction.qc_status = qc_status
+            prediction.qc_messages = ' | '.join(qc_msgs)
+        logging.info('%s | cgMLST serovar prediction: %s (%s/330 matching alleles to %s) | Overall serovar prediction: %s',
+                     genome_name,
+                     prediction.serovar_cgmlst,
+                     prediction.cgmlst_matching_alleles,
+                     prediction.cgmlst_genome_match,
+                     prediction.serovar)
+        yield prediction, cgmlst_results
+
+
+def main_reprofile(argv):
+    """`sistr_cmd reprofile`: re-predict serovars from existing allelic profiles and saved antigen predictions"""
+    from sistr.src.readers import read_cgmlst_profiles, read_predictions
+    from sistr.src.writers import PredictionWriter
+
+    parser = init_reprofile_parser()
+    args = parser.parse_args(argv)
+    init_console_logger(args.verbose)
+    logging.critical('Running sistr_cmd reprofile v{}'.format(__version__))
+    if not os.path.isfile(resource_filename('sistr', 'dbstatus.txt')):
+        setup_sistr_dbs()
+    df_profiles = read_cgmlst_profiles(args.cgmlst_profiles or args.alleles)
+    saved_predictions = {x['genome']: x for x in read_predictions(args.predictions)}
+    logging.info('Read %s saved predictions from %s', len(saved_predictions), args.predictions)
+    writers = []
+    if args.output_prediction:
+        prediction_writer = PredictionWriter(args.output_prediction, args.output_format, more_results=args.more_results)
+    else:
+        logging.warning('No prediction results output file written! Writing results summary to stdout as JSON')
+        prediction_writer = PredictionWriter('-', 'json', more_results=args.more_results)
+    writers.append(prediction_writer)
+    results_db = None
+    if args.results_db:
+        from sistr.src.results_db import ResultsDatabase
+        results_db = ResultsDatabase(args.results_db, args=args, more_results=args.more_results)
+        writers.append(results_db)
     count = 0
-    with open(output_path, 'w') as fout:
-        for x in cgmlst_results:
-            for marker, res in x.items():
-                name = res['name']
-                seq = res['seq']
-                br = res['blast_result']
-                if br is not None and isinstance(br, dict):
-                    trunc = br['trunc']
-                    if not trunc:
-                        fout.write('>{}|{}\n{}\n'.format(marker, name, seq))
-                        count += 1
-    return count
+    try:
+        for prediction, cgmlst_results in reprofile_predictions(df_profiles, saved_predictions, args):
+            prediction_writer.write(prediction)
+            if results_db:
+                results_db.write(prediction, cgmlst_results)
+            count += 1
+    finally:
+        for writer in writers:
+            writer.close()
+    logging.info('Re-predicted %s of %s genomes from allelic profiles', count, df_profiles.shape[0])
+
+
+def main_merge(argv):
+    """`sistr_cmd merge`: merge the outputs of runs on separate shards of a batch of genomes"""
+    import pandas as pd
+
+    from sistr.src.merge import merge_alleles, merge_cgmlst_profiles, merge_novel_alleles, merge_predictions
+    from sistr.src.writers import AllelesJsonWriter, CgmlstProfilesWriter, CompactAllelesWriter, PredictionWriter
+
+    parser = init_merge_parser()
+    args = parser.parse_args(argv)
+    init_console_logger(args.verbose)
+    logging.critical('Running sistr_cmd merge v{}'.format(__version__))
+    outputs = [(args.predictions, args.output_prediction, True),
+               (args.cgmlst_profiles, args.output_cgmlst_profiles, False),
+               (args.alleles, args.output_alleles, False),
+               (args.novel_alleles, args.output_novel_alleles, False)]
+    if not any(inputs for inputs, _dest, _optional_dest in outputs):
+        parser.error('No inputs to merge!')
+    for inputs, dest, optional_dest in outputs:
+        if inputs and not dest and not optional_dest:
+            parser.error('An output path is required for each type of input to merge')
+    if args.predictions:
+        predictions = merge_predictions(args.predictions)
+        if args.output_prediction:
+            # merged prediction output dicts may have been read from tabular outputs (string values)
+            prediction_writer = PredictionWriter(args.output_prediction, args.output_format,
+                                                 more_results=args.more_results, typed=False)
+        else:
+            logging.warning('No prediction results output file written! Writing merged predictions to stdout as JSON')
+            prediction_writer = PredictionWriter('-', 'json', more_results=args.more_results, typed=False)
+        with prediction_writer:
+            for prediction in predictions:
+                prediction_writer.write(prediction)
+        logging.info('Wrote %s merged predictions', len(predictions))
+    if args.cgmlst_profiles:
+        df_profiles = merge_cgmlst_profiles(args.cgmlst_profiles)
+        with CgmlstProfilesWriter(args.output_cgmlst_profiles, df_profiles.columns) as writer:
+            for genome, row in zip(df_profiles.index, df_profiles.values):
+                writer.write(genome, {marker: {'name': None if pd.isnull(x) else int(x)}
+                                      for marker, x in zip(df_profiles.columns, row)})
+        logging.info('Wrote %s merged cgMLST330 allelic profiles to %s', df_profiles.shape[0], args.output_cgmlst_profiles)
+    if args.alleles:
+        if args.alleles_format == 'compact':
+            alleles_writer = CompactAllelesWriter(args.output_alleles)
+        else:
+            alleles_writer = AllelesJsonWriter(args.output_alleles)
+        with alleles_writer:
+            count = merge_alleles(args.alleles, alleles_writer)
+        logging.info('Wrote merged allele results of %s genomes to %s', count, args.output_alleles)
+    if args.novel_alleles:
+        count = merge_novel_alleles(args.novel_alleles, args.output_novel_alleles)
+        logging.info('Wrote %s distinct novel alleles to %s', count, args.output_novel_alleles)
+
+
+def queue_worker(queue_path, args, worker_options):
+    """Analyze genomes claimed from a work queue until all jobs are finished
+
+    Args:
+        queue_path (str): work queue database path
+        args (argparse.Namespace): sistr_cmd arguments stored in the work queue
+        worker_options (dict): :func:`sistr.src.work_queue.run_worker` keyword arguments
+
+    Returns:
+        int: number of genomes analyzed
+    """
+    from sistr.src.work_queue import run_worker
+
+    def predict(fasta_path, genome_name):
+        return sistr_predict(fasta_path, genome_name, args.tmp_dir, args.keep_tmp, args)
+
+    return run_worker(queue_path, predict, **worker_options)
+
+
+def queue_worker_star(queue_worker_args):
+    """:func:`queue_worker` taking a single tuple of arguments for use with ``Pool.map``"""
+    return queue_worker(*queue_worker_args)
+
+
+def start_queue_workers(queue_path, args, n_workers, worker_options):
+    """Start worker processes analyzing genomes from a work queue in the background
+
+    Args:
+        queue_path (str): work queue database path
+        args (argparse.Namespace): sistr_cmd arguments stored in the work queue
+        n_workers (int): number of worker processes
+        worker_options (dict): :func:`sistr.src.work_queue.run_worker` keyword arguments
+
+    Returns:
+        (multiprocessing.pool.Pool, multiprocessing.pool.AsyncResult): worker pool and number of genomes analyzed
+            by each worker
+    """
+    from multiprocessing import Pool
+    preload_reference_data(args)
+    logging.info('Starting %s work queue worker processes', n_workers)
+    pool = Pool(processes=n_workers, initializer=preload_reference_data, initargs=(args,))
+    return pool, pool.map_async(queue_worker_star, [(queue_path, args, worker_options)] * n_workers, chunksize=1)
+
+
+def main_worker(argv):
+    """`sistr_cmd worker`: analyze genomes from a shared work queue"""
+    from sistr.src.work_queue import WorkQueue
+    parser = init_worker_parser()
+    worker_args = parser.parse_args(argv)
+    init_console_logger(worker_args.verbose)
+    logging.critical('Running sistr_cmd worker v{} on work queue {}'.format(__version__, worker_args.queue))
+    if not os.path.isfile(resource_filename('sistr', 'dbstatus.txt')):
+        setup_sistr_dbs()
+    with WorkQueue(worker_args.queue) as queue:
+        args = queue.args()
+    # analysis options of the queue with this host's working directory and parallelism
+    args.tmp_dir = worker_args.tmp_dir
+    args.keep_tmp = worker_args.keep_tmp
+    args.threads = worker_args.threads
+    worker_options = {'heartbeat_interval': worker_args.heartbeat_interval,
+                      'stale_after': worker_args.stale_after,
+                      'max_attempts': worker_args.max_attempts}
+    if worker_args.threads == 1:
+        count = queue_worker(worker_args.queue, args, worker_options)
+    else:
+        pool, counts = start_queue_workers(worker_args.queue, args, worker_args.threads, worker_options)
+        pool.close()
+        pool.join()
+        count = sum(counts.get())
+    logging.info('Analyzed %s genomes from work queue %s', count, worker_args.queue)
+
+
+#: dict: `sistr_cmd` subcommand name to main function taking the subcommand arguments
+SUBCOMMANDS = {'reprofile': main_reprofile,
+               'merge': main_merge,
+               'worker': main_worker}
+
+
+def write_outputs(args, outputs):
+    """Write each genome's results to all requested outputs as soon as they are available
+
+    Args:
+        args (argparse.Namespace): sistr_cmd arguments
+        outputs (iterator): prediction and cgMLST results of each genome
+    """
+    from sistr.src.writers import PredictionWriter, CgmlstProfilesWriter, AllelesJsonWriter, CompactAllelesWriter, \
+        NovelAllelesWriter, BlastHitsWriter, prediction_output_fields
+    writers = []
+    more_results = args.more_results
+    blast_hits_writer = None
+    if args.blast_hits_output:
+        # all antigen gene blastn results go to the hits table instead of the prediction output
+        more_results = min(more_results, 1)
+        blast_hits_writer = BlastHitsWriter(args.blast_hits_output)
+        writers.append(blast_hits_writer)
+    if args.output_prediction:
+        logging.info('Writing results with %s verbosity level (%s)',
+                     more_results, logging.getLevelName(logging.getLogger().level))
+        prediction_writer = PredictionWriter(args.output_prediction, args.output_format, more_results=more_results,
+                                             fields=prediction_output_fields(args))
+    else:
+        logging.warning('No prediction results output file written! Writing results summary to stdout as JSON')
+        prediction_writer = PredictionWriter('-', 'json', more_results=more_results)
+    writers.append(prediction_writer)
+    profiles_writer = None
+    if args.cgmlst_profiles:
+        profiles_writer = CgmlstProfilesWriter(args.cgmlst_profiles, reference_data().cgmlst_profiles.columns)
+        writers.append(profiles_writer)
+    alleles_writer = None
+    if args.alleles_output:
+        if args.alleles_format == 'compact':
+            alleles_writer = CompactAllelesWriter(args.alleles_output)
+        else:
+            alleles_writer = AllelesJsonWriter(args.alleles_output)
+        writers.append(alleles_writer)
+    novel_alleles_writer = None
+    if args.novel_alleles:
+        novel_alleles_writer = NovelAllelesWriter(args.novel_alleles)
+        writers.append(novel_alleles_writer)
+    results_db = None
+    if args.results_db:
+        from sistr.src.results_db import ResultsDatabase
+        results_db = ResultsDatabase(args.results_db, args=args, more_results=more_results)
+        writers.append(results_db)
+
+    try:
+        # write each genome's results as soon as they are available (in input order)
+        for prediction, cgmlst_results in outputs:
+            genome_name = prediction.genome
+            prediction_writer.write(prediction)
+            if blast_hits_writer:
+                blast_hits_writer.write(prediction)
+            if profiles_writer:
+                profiles_writer.write(genome_name, cgmlst_results)
+            if alleles_writer:
+                alleles_writer.write(genome_name, cgmlst_results)
+            if novel_alleles_writer:
+                novel_alleles_writer.write(cgmlst_results)
+            if results_db:
+                results_db.write(prediction, cgmlst_results)
+    finally:
+        for writer in writers:
+            writer.close()
+    if blast_hits_writer:
+        logging.info('Wrote %s antigen gene blastn results to %s', blast_hits_writer.count, args.blast_hits_output)
+    if profiles_writer:
+        logging.info('cgMLST allelic profiles written to %s', args.cgmlst_profiles)
+    if alleles_writer:
+        logging.info('JSON of allele data written to %s for %s cgMLST allele results', args.alleles_output, alleles_writer.count)
+    if novel_alleles_writer:
+        logging.info('Wrote %s alleles to %s', novel_alleles_writer.count, args.novel_alleles)
+    if results_db:
+        logging.info('Added %s genome results to SQLite database %s', results_db.count, args.results_db)
+
+
+def main_from_artifacts(parser, args):
+    """Rebuild and write predictions from search artifacts (`--from-artifacts`)"""
+    from sistr.src.artifacts import artifact_files
+    paths = artifact_files(args.fastas)
+    if len(paths) == 0:
+        logging.error('No search artifact files specified!')
+        parser.print_help()
+        sys.exit(-1)
+    pool = None
+    inputs = [(path, args) for path in paths]
+    if args.threads == 1:
+        logging.info('Serial single threaded run mode on %s genome artifacts', len(inputs))
+        outputs = (sistr_predict_from_artifacts(*x) for x in inputs)
+    else:
+        from multiprocessing import Pool
+        preload_reference_data(args)
+        logging.info('Initializing thread pool with %s threads', args.threads)
+        pool = Pool(processes=args.threads, initializer=preload_reference_data, initargs=(args,))
+        outputs = pool.imap(sistr_predict_from_artifacts_star, inputs)
+    completed = False
+    try:
+        write_outputs(args, outputs)
+        completed = True
+    finally:
+        if pool is not None:
+            shutdown_pool(pool, completed)
+    logging.info('Rebuilt predictions of %s genomes from search artifacts', len(paths))
+
+
+class PendingLimit:
+    """Limit the number of inputs dispatched to a worker pool ahead of the consumed outputs
+
+    Inputs are taken by the pool's task handler thread, which blocks in
+    :meth:`inputs` while `limit` inputs have no consumed output. If outputs
+    stop being consumed (e.g. a genome analysis failed), :meth:`abort` must be
+    called so that the task handler stops waiting and the pool can be
+    terminated (see :func:`shutdown_pool`).
+
+    Args:
+        limit (int): maximum number of pending inputs
+    """
+
+    def __init__(self, limit):
+        import threading
+        self._semaphore = threading.Semaphore(limit)
+        self.aborted = False
+
+    def inputs(self, inputs):
+        """Yield inputs, waiting before each until fewer than `limit` are pending"""
+        for x in inputs:
+            self._semaphore.acquire()
+            if self.aborted:
+                return
+            yield x
+
+    def outputs(self, outputs):
+        """Yield outputs, allowing another input to be dispatched for each"""
+        for x in outputs:
+            self._semaphore.release()
+            yield x
+
+    def abort(self):
+        """Stop dispatching inputs and wake up the task handler if it is waiting"""
+        self.aborted = True
+        self._semaphore.release()
+
+
+def shutdown_pool(pool, completed, limits=()):
+    """Wait for a worker pool to finish or terminate it if the run did not complete
+
+    If the run failed or was interrupted, outputs are no longer consumed, so
+    input `limits` (e.g. :class:`PendingLimit`) are aborted first so that the
+    pool's task handler thread is not left waiting for them and the pool can
+    be terminated instead of waiting for the remaining genomes.
+
+    Args:
+        pool (multiprocessing.pool.Pool): worker pool
+        completed (bool): were all outputs consumed?
+        limits (list): input limits with an ``abort()`` method (None entries are ignored)
+    """
+    if completed:
+        pool.close()
+    else:
+        for limit in limits:
+            if limit is not None:
+                limit.abort()
+        pool.terminate()
+    pool.join()
+
+
+def admission_controller(parser, args):
+    """Memory admission controller of worker processes for `--max-memory`
+
+    Returns:
+        sistr.src.admission.AdmissionController: admission controller or None if no memory budget is set
+    """
+    if not args.max_memory:
+        return None
+    from sistr.src.admission import AdmissionController
+    from sistr.src.result_cache import parse_size
+    try:
+        max_memory = parse_size(args.max_memory)
+    except ValueError as e:
+        parser.error(str(e))
+    logging.info('Admitting genomes to worker processes within a memory budget of %s MiB', max_memory >> 20)
+    return AdmissionController(max_memory)
+
+
+def main_multi_fasta(parser, args):
+    """Analyze and write results of each genome of a multi-genome FASTA file or stream (`--multi-fasta`)
+
+    Genomes are dispatched to workers as soon as all of their contigs have been
+    read. At most 2 genomes per worker are held in memory ahead of the
+    analysis.
+    """
+    from sistr.src.genome import genomes_from_multi_fasta
+    if args.fastas or args.input_fasta_genome_name:
+        logging.error('FASTA file inputs cannot be combined with --multi-fasta!')
+        parser.print_help()
+        sys.exit(-1)
+    controller = admission_controller(parser, args)
+    genomes = genomes_from_multi_fasta(args.multi_fasta,
+                                       delimiter=args.genome_id_delimiter,
+                                       regex=args.genome_id_regex)
+    inputs = ((None, genome.name, args.tmp_dir, args.keep_tmp, args, None, genome) for genome in genomes)
+    pool = None
+    pending = None
+    if args.threads == 1:
+        logging.info('Serial single threaded run mode on genomes from multi-genome FASTA %s', args.multi_fasta)
+        outputs = (sistr_predict(*x) for x in inputs)
+    else:
+        from multiprocessing import Pool
+        preload_reference_data(args)
+        logging.info('Initializing thread pool with %s threads', args.threads)
+        pool = Pool(processes=args.threads, initializer=preload_reference_data, initargs=(args,))
+        logging.info('Running SISTR analysis asynchronously on genomes from multi-genome FASTA %s', args.multi_fasta)
+        pending = PendingLimit(2 * args.threads)
+        inputs = pending.inputs(inputs)
+        if controller:
+            import itertools
+            from sistr.src.admission import estimate_genome_memory
+            inputs, estimate_inputs = itertools.tee(inputs)
+            estimates = (estimate_genome_memory(x[6].size, args) for x in estimate_inputs)
+            outputs = controller.released(pool.imap_unordered(indexed_call,
+                                                              ((sistr_predict_star, i, x)
+                                                               for i, x in controller.admitted(inputs, estimates))))
+        else:
+            outputs = pool.imap(sistr_predict_star, inputs)
+        outputs = pending.outputs(outputs)
+    completed = False
+    try:
+        write_outputs(args, outputs)
+        completed = True
+    finally:
+        if pool is not None:
+            shutdown_pool(pool, completed, [pending, controller])
+
+
+def main_queue(parser, args, input_fastas, genome_names):
+    """Analyze genomes through a shared work queue and write their results in input order (`--queue`)"""
+    from sistr.src.work_queue import WorkQueue, WorkQueueMismatchError, queue_outputs
+    for option in ['checkpoint_dir', 'result_cache']:
+        if getattr(args, option):
+            parser.error('--queue cannot be combined with --{}'.format(option.replace('_', '-')))
+    queue = WorkQueue(args.queue, create=True)
+    pool = None
+    try:
+        try:
+            queue.init_run(args, result_cache_options(args))
+        except WorkQueueMismatchError as e:
+            parser.error(str(e))
+        job_ids = queue.enqueue(input_fastas, genome_names)
+        logging.info('Added %s genomes to work queue %s (%s)', len(input_fastas), args.queue, queue.counts())
+        if args.threads == 1:
+            queue_worker(args.queue, args, {})
+        elif args.threads > 1:
+            pool, _counts = start_queue_workers(args.queue, args, args.threads, {})
+            pool.close()
+        write_outputs(args, queue_outputs(queue, job_ids))
+    finally:
+        if pool is not None:
+            pool.join()
+        queue.close()
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        return SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
 
     parser = init_parser()
     args = parser.parse_args()
@@ -400,6 +1417,21 @@ def main():
     logging.debug(f"Running on command-line arguments {args}")
     if not os.path.isfile(resource_filename('sistr', 'dbstatus.txt')):
         setup_sistr_dbs()
+    for option in ['shard', 'queue']:
+        if getattr(args, option) and (args.multi_fasta or args.from_artifacts):
+            parser.error('--{} requires FASTA file inputs'.format(option))
+    if args.run_mash and args.native_mash and not args.from_artifacts:
+        from sistr.src.minhash import UnsupportedSketchError, reference_sketch
+        try:
+            reference_sketch()
+        except UnsupportedSketchError as e:
+            parser.error('--native-mash cannot be used with the Mash reference sketch: {}'.format(e))
+    if args.from_artifacts:
+        main_from_artifacts(parser, args)
+        return
+    if args.multi_fasta:
+        main_multi_fasta(parser, args)
+        return
     input_fastas = args.fastas
     paths_names = args.input_fasta_genome_name
     if len(input_fastas) == 0 and (paths_names is None or len(paths_names) == 0):
@@ -423,58 +1455,135 @@ def main():
             parser.print_help()
             sys.exit(-1)
 
+    if args.shard:
+        from sistr.src.merge import parse_shard, shard_inputs
+        try:
+            shard, n_shards = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        input_fastas, genome_names = shard_inputs(input_fastas, genome_names, shard, n_shards)
+        if len(input_fastas) == 0:
+            logging.warning('No input genomes in shard %s', args.shard)
+
+    controller = admission_controller(parser, args)
+    # genome sizes and file SHA-256 digests of inputs (by absolute path) from the pre-flight check
+    genome_sizes = {}
+    file_sha256s = {}
+    if args.preflight or args.manifest:
+        from sistr.src.preflight import preflight_check, write_manifest
+        manifest = preflight_check(input_fastas, genome_names, threads=args.threads)
+        genome_sizes = {x['fasta_path']: x['genome_size'] for x in manifest if x['valid']}
+        file_sha256s = {x['fasta_path']: x['file_sha256'] for x in manifest if x['valid']}
+        if args.manifest:
+            write_manifest(manifest, args.manifest)
+        n_invalid = sum(1 for x in manifest if not x['valid'])
+        if n_invalid > 0:
+            logging.error('Rejected %s invalid input FASTA files (see errors above)', n_invalid)
+            genome_names = [x for x, entry in zip(genome_names, manifest) if entry['valid']]
+            input_fastas = [x for x, entry in zip(input_fastas, manifest) if entry['valid']]
+        if len(input_fastas) == 0:
+            logging.error('No valid FASTA files to analyze!')
+            sys.exit(-1)
+
+    if args.queue:
+        main_queue(parser, args, input_fastas, genome_names)
+        return
+
     tmp_dir = args.tmp_dir
     keep_tmp = args.keep_tmp
-    output_format = args.output_format
-    output_path = args.output_prediction
 
 
     n_threads = args.threads
+    pool = None
+    checkpoint = None
+    # indices of inputs without checkpointed results
+    todo_indices = list(range(len(input_fastas)))
+    if args.checkpoint_dir:
+        from sistr.src.checkpoint import Checkpoint, CheckpointMismatchError
+        try:
+            checkpoint = Checkpoint(args.checkpoint_dir, result_cache_options(args))
+        except CheckpointMismatchError as e:
+            parser.error(str(e))
+        checkpoint_keys = [checkpoint.key(x, y) if os.path.exists(x) else None
+                           for x, y in zip(input_fastas, genome_names)]
+        todo_indices = uncached_indices(checkpoint, checkpoint_keys)
+        logging.info('%s of %s genomes already completed in checkpoint directory %s',
+                     len(input_fastas) - len(todo_indices), len(input_fastas), args.checkpoint_dir)
+    todo_fastas = [input_fastas[i] for i in todo_indices]
+    result_cache = None
+    # indices into `todo_fastas` of inputs to analyze
+    run_indices = list(range(len(todo_fastas)))
+    if args.result_cache and args.artifacts_dir:
+        # cached results have no search artifacts to save
+        logging.warning('Not using result cache %s since --artifacts-dir is set', args.result_cache)
+    elif args.result_cache:
+        from sistr.src.result_cache import ResultCache, parse_size
+        result_cache = ResultCache(args.result_cache, max_size=parse_size(args.result_cache_max_size))
+        options = result_cache_options(args)
+        file_sha256s = input_sha256s(todo_fastas, threads=n_threads, known=file_sha256s)
+        cache_keys = [result_cache.key(file_sha256s[os.path.abspath(x)], options)
+                      if os.path.abspath(x) in file_sha256s else None
+                      for x in todo_fastas]
+        run_indices = uncached_indices(result_cache, cache_keys)
+        logging.info('%s of %s genomes to analyze after checking result cache %s',
+                     len(run_indices), len(todo_fastas), args.result_cache)
+    run_fastas = [todo_fastas[i] for i in run_indices]
+    mash_outs = {}
+    if args.run_mash and not args.native_mash and (len(run_fastas) > 1 or args.mash_sketch_cache):
+        mash_fastas = [x for x in run_fastas if os.path.exists(x)]
+        mash_outs = run_mash_batch(mash_fastas, args,
+                                   sha256s={x: file_sha256s[os.path.abspath(x)] for x in mash_fastas
+                                            if os.path.abspath(x) in file_sha256s})
+    inputs = [(input_fasta, genome_name, tmp_dir, keep_tmp, args, mash_outs.get(input_fasta))
+              for input_fasta, genome_name in zip(input_fastas, genome_names)]
+    todo_inputs = [inputs[i] for i in todo_indices]
+    run_inputs = [todo_inputs[i] for i in run_indices]
+    predict = sistr_predict_star
+    if checkpoint:
+        # checkpoint each genome in the worker as soon as it is finished
+        predict = sistr_predict_checkpointed_star
+        run_inputs = [(args.checkpoint_dir, checkpoint_keys[todo_indices[i]], x)
+                      for i, x in zip(run_indices, run_inputs)]
     if n_threads == 1:
-        logging.info('Serial single threaded run mode on %s genomes', len(input_fastas))
-        outputs = [sistr_predict(input_fasta, genome_name, tmp_dir, keep_tmp, args) for input_fasta, genome_name in zip(input_fastas, genome_names)]
+        logging.info('Serial single threaded run mode on %s genomes', len(run_inputs))
+        outputs = (predict(x) for x in run_inputs)
     else:
         from multiprocessing import Pool
+        # load shared reference data once in the parent so forked workers inherit it
+        preload_reference_data(args)
         logging.info('Initializing thread pool with %s threads', n_threads)
-        pool = Pool(processes=n_threads)
-        logging.info('Running SISTR analysis asynchronously on %s genomes', len(input_fastas))
-        res = [pool.apply_async(sistr_predict, (input_fasta, genome_name, tmp_dir, keep_tmp, args)) for input_fasta, genome_name in zip(input_fastas, genome_names)]
-
-        logging.info('Getting SISTR analysis results')
-        outputs = [x.get() for x in res]
-
-    prediction_outputs = [x for x,y in outputs]
-
-    cgmlst_results = [y for x,y in outputs]
-
-    if output_path:
-        from sistr.src.writers import write
-        logging.info('Writing results with %s verbosity level (%s)',
-                     args.more_results, logging.getLevelName(logging.getLogger().level))
-        write(output_path, output_format, prediction_outputs, more_results=args.more_results)
-    else:
-        import json
-        from sistr.src.writers import to_dict
-        logging.warning('No prediction results output file written! Writing results summary to stdout as JSON')
-        exclude_keys_in_output = {'blast_results', 'sseq'}
-        if args.more_results >= 2:
-            exclude_keys_in_output.remove('blast_results')
-            exclude_keys_in_output.remove('sseq')
-        elif args.more_results == 1:
-            exclude_keys_in_output.remove('sseq')
-        outs = [to_dict(x, 0, exclude_keys=exclude_keys_in_output) for x in prediction_outputs]
-        print(json.dumps(outs))
-    if args.cgmlst_profiles:
-        write_cgmlst_profiles(genome_names, cgmlst_results, args.cgmlst_profiles)
-        logging.info('cgMLST allelic profiles written to %s', args.cgmlst_profiles)
-    if args.alleles_output:
-        write_cgmlst_results_json(genome_names, cgmlst_results, args.alleles_output)
-        logging.info('JSON of allele data written to %s for %s cgMLST allele results', args.alleles_output, len(cgmlst_results))
-    if args.novel_alleles:
-        count = write_novel_alleles(cgmlst_results, args.novel_alleles)
-        logging.info('Wrote %s alleles to %s', count, args.novel_alleles)
-
+        pool = Pool(processes=n_threads, initializer=preload_reference_data, initargs=(args,))
+        logging.info('Running SISTR analysis asynchronously on %s genomes', len(run_inputs))
+        if controller:
+            from sistr.src.admission import estimate_genome_memory, input_genome_size
+            estimates = [estimate_genome_memory(genome_sizes.get(os.path.abspath(x)) or input_genome_size(x), args)
+                         for x in run_fastas]
+            outputs = controller.released(pool.imap_unordered(indexed_call,
+                                                              ((predict, i, x)
+                                                               for i, x in controller.admitted(run_inputs, estimates))))
+        else:
+            outputs = pool.imap(predict, run_inputs)
+    if result_cache:
+        outputs = cached_outputs(result_cache, cache_keys, todo_inputs, run_indices, iter(outputs))
+    if checkpoint:
+        outputs = cached_outputs(checkpoint, checkpoint_keys, inputs, todo_indices, iter(outputs))
 
+    completed = False
+    try:
+        write_outputs(args, outputs)
+        completed = True
+    finally:
+        if pool is not None:
+            shutdown_pool(pool, completed, [controller])
+    if result_cache:
+        logging.info('Result cache %s: %s genome results reused, %s genomes analyzed',
+                     args.result_cache, len(todo_fastas) - len(run_indices), len(run_indices))
+    if checkpoint:
+        logging.info('Checkpoint %s: %s genome results resumed, %s genomes completed in this run',
+                     args.checkpoint_dir, len(input_fastas) - len(todo_indices), len(todo_indices))
+    if controller:
+        logging.info('Memory admission control: genome starts delayed %s times to stay within %s MiB',
+                     controller.throttled, controller.max_memory >> 20)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+import logging
+import multiprocessing
+import os
+import threading
+
+from sistr.src.parsers import GZIP_MAGIC
+
+#: int: estimated peak memory (bytes) of a genome analysis independent of genome size and options
+GENOME_BASE_MEMORY = 100 << 20
+
+#: int: estimated memory (bytes) per bp of assembly: in-memory genome, extracted sequences and BLAST hit tables
+MEMORY_PER_BP = 10
+
+#: int: estimated memory (bytes) of the cgMLST330 BLAST hit tables and allele results with the centroid allele DB
+CGMLST_MEMORY = 150 << 20
+
+#: int: estimated memory (bytes) of the cgMLST330 BLAST hit tables and allele results with the full allele DB
+FULL_CGMLST_DB_MEMORY = 600 << 20
+
+#: int: estimated memory (bytes) of all antigen gene BLAST result dicts kept in the prediction with -MM
+ALL_BLAST_RESULTS_MEMORY = 100 << 20
+
+#: float: assumed compression ratio of gzipped FASTA inputs for estimating genome size from file size
+GZIP_RATIO = 3.5
+
+#: float: seconds between checks of worker memory use while a genome is waiting to be admitted
+POLL_INTERVAL = 1.0
+
+
+def input_genome_size(fasta_path):
+    """Approximate genome size of an input FASTA from its file size
+
+    Args:
+        fasta_path (str): genome FASTA path (optionally gzipped)
+
+    Returns:
+        int: approximate genome size in bp; 0 if the file cannot be read
+    """
+    try:
+        size = os.path.getsize(fasta_path)
+        with open(fasta_path, 'rb') as fh:
+            if fh.read(len(GZIP_MAGIC)) == GZIP_MAGIC:
+                size = int(size * GZIP_RATIO)
+    except OSError:
+        return 0
+    return size
+
+
+def estimate_genome_memory(genome_size, args):
+    """Estimated peak memory of analyzing a genome with the selected analysis options
+
+    Args:
+        genome_size (int): genome size in bp
+        args (argparse.Namespace): sistr_cmd arguments
+
+    Returns:
+        int: estimated memory in bytes
+    """
+    memory = GENOME_BASE_MEMORY + MEMORY_PER_BP * genome_size
+    if not args.no_cgmlst:
+        memory += FULL_CGMLST_DB_MEMORY if args.use_full_cgmlst_db else CGMLST_MEMORY
+    if args.more_results >= 2 and not args.blast_hits_output:
+        memory += ALL_BLAST_RESULTS_MEMORY
+    return memory
+
+
+def process_memory(pid):
+    """Memory use of a process
+
+    The proportional set size (PSS) is used where available so that
+    reference data shared by forked worker processes is not counted once per
+    worker; otherwise the resident set size (RSS).
+
+    Args:
+        pid (int): process ID
+
+    Returns:
+        int: memory use in bytes or None if not available (e.g. not Linux or process has exited)
+    """
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid)) as fh:
+            for line in fh:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) << 10
+    except OSError:
+        pass
+    try:
+        with open('/proc/{}/statm'.format(pid)) as fh:
+            return int(fh.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def workers_memory():
+    """Total memory use of this process and its child (e.g. worker pool) processes
+
+    Returns:
+        int: memory use in bytes or None if not available
+    """
+    pids = [os.getpid()] + [p.pid for p in multiprocessing.active_children()]
+    usage = [process_memory(pid) for pid in pids]
+    if usage[0] is None:
+        return None
+    return sum(x for x in usage if x is not None)
+
+
+class AdmissionController:
+    """Admit genomes to worker processes only while their memory use stays within a budget
+
+    A genome is admitted when the projected memory use with it stays within
+    `max_memory`. The projected memory use is the larger of the measured
+    memory use of this process and its worker processes (see
+    :func:`workers_memory`) and the memory use measured before the first
+    genome plus the estimated memory of all admitted but unfinished genomes,
+    so that genomes that have not reached their peak memory yet are
+    accounted for. Admission blocks until enough genomes have finished. A
+    genome is always admitted if no other genome is in progress, so a genome
+    exceeding the budget by itself is analyzed alone rather than never.
+
+    Use :meth:`admitted` on the inputs of ``Pool.imap_unordered`` and
+    :meth:`released` on its outputs, so that the memory of each genome is
+    released as soon as it finishes rather than in input order (where one
+    slow genome would keep the estimates of all later genomes reserved).
+    :meth:`admit` runs in the pool's task handler thread, so :meth:`abort`
+    must be called if the outputs stop being consumed (e.g. a genome failed).
+
+    Args:
+        max_memory (int): memory budget in bytes
+        poll_interval (float): seconds between checks of memory use while waiting to admit a genome
+    """
+
+    def __init__(self, max_memory, poll_interval=POLL_INTERVAL):
+        self.max_memory = max_memory
+        self.poll_interval = poll_interval
+        self.baseline = None
+        self.in_progress = 0
+        self.reserved = 0
+        self.throttled = 0
+        self.aborted = False
+        self._estimates = {}
+        self._cond = threading.Condition()
+
+    def used_memory(self):
+        """Projected memory use of the admitted genomes in bytes"""
+        measured = workers_memory() or 0
+        if self.baseline is None:
+            self.baseline = measured
+        return max(measured, self.baseline + self.reserved)
+
+    def admit(self, estimate):
+        """Wait until a genome with an estimated peak memory use of `estimate` bytes fits within the budget
+
+        Args:
+            estimate (int): estimated memory of the genome in bytes
+        """
+        with self._cond:
+            used = self.used_memory()
+            if self.in_progress > 0 and used + estimate > self.max_memory:
+                self.throttled += 1
+                logging.info('Waiting for memory to start the next genome (%s MiB estimated, %s of %s MiB in use by '
+                             '%s genomes)', estimate >> 20, used >> 20, self.max_memory >> 20, self.in_progress)
+                while not self.aborted and self.in_progress > 0 and used + estimate > self.max_memory:
+                    self._cond.wait(self.poll_interval)
+                    used = self.used_memory()
+            if self.aborted:
+                return
+            if estimate > self.max_memory:
+                logging.warning('Estimated memory of genome (%s MiB) exceeds --max-memory (%s MiB). Analyzing it alone',
+                                estimate >> 20, self.max_memory >> 20)
+            self.in_progress += 1
+            self.reserved += estimate
+
+    def release(self, estimate):
+        """Record that a genome admitted with :meth:`admit` has finished
+
+        Args:
+            estimate (int): estimated memory of the genome in bytes
+        """
+        with self._cond:
+            self.in_progress -= 1
+            self.reserved -= estimate
+            self._cond.notify_all()
+
+    def abort(self):
+        """Stop admitting genomes and wake up a waiting :meth:`admit` (e.g. when the run failed)"""
+        with self._cond:
+            self.aborted = True
+            self._cond.notify_all()
+
+    def admitted(self, inputs, estimates):
+        """Yield (index, input) tuples as inputs are admitted until aborted
+
+        Args:
+            inputs (iterable): worker inputs
+            estimates (iterable of int): estimated memory of each input in bytes
+        """
+        for i, (x, estimate) in enumerate(zip(inputs, estimates)):
+            self.admit(estimate)
+            if self.aborted:
+                return
+            self._estimates[i] = estimate
+            yield i, x
+
+    def released(self, outputs):
+        """Yield outputs in input order, releasing the memory of each genome as soon as it finishes
+
+        Args:
+            outputs (iterable): (index, output) tuples of admitted inputs (see :meth:`admitted`) in completion order
+
+        Yields:
+            output of each input in input order
+        """
+        finished = {}
+        next_index = 0
+        for i, x in outputs:
+            self.release(self._estimates.pop(i))
+            finished[i] = x
+            while next_index in finished:
+                yield finished.pop(next_index)
+                next_index += 1
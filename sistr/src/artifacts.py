@@ -0,0 +1,235 @@
+import gzip
+import hashlib
+import io
+import os
+import pickle
+import re
+import tempfile
+from functools import lru_cache
+
+from sistr.src.blast_wrapper import BLAST_TABLE_COLS
+from sistr.src.parsers import file_sha256
+from sistr.version import __version__
+
+#: int: artifact format version; artifacts with a different version cannot be replayed
+ARTIFACT_VERSION = 1
+
+#: str: file extension of per-genome artifact files
+ARTIFACT_FILE_EXT = '.sistr-artifacts.pickle.gz'
+
+
+class ArtifactsMismatchError(Exception):
+    """Artifacts cannot be replayed with the installed SISTR version or query databases"""
+    pass
+
+
+@lru_cache(maxsize=None)
+def query_sha256(query_fasta_path):
+    """SHA-256 of a query FASTA (e.g. antigen gene or cgMLST allele FASTA) computed once per process"""
+    return file_sha256(query_fasta_path)
+
+
+def artifacts_path(artifacts_dir, genome_name):
+    """Artifact file path for a genome in an artifacts directory
+
+    The filename is the genome name with non-word characters replaced by "_"
+    followed by a short hash of the genome name so that genomes whose names
+    only differ in replaced characters (e.g. "S.1" and "S_1") get different
+    files.
+    """
+    name_hash = hashlib.sha256(genome_name.encode()).hexdigest()[:12]
+    return os.path.join(artifacts_dir, '{}-{}{}'.format(re.sub(r'\W', '_', genome_name), name_hash, ARTIFACT_FILE_EXT))
+
+
+def artifact_files(paths):
+    """Artifact file paths from a list of artifact files and/or directories of artifact files
+
+    Args:
+        paths (list of str): artifact file or directory paths
+
+    Returns:
+        list of str: artifact file paths; files in directories are sorted by name
+    """
+    out = []
+    for path in paths:
+        if os.path.isdir(path):
+            out += sorted(os.path.join(path, x) for x in os.listdir(path) if x.endswith(ARTIFACT_FILE_EXT))
+        else:
+            out.append(path)
+    return out
+
+
+class GenomeArtifacts:
+    """Raw search products of a genome's SISTR analysis for re-scoring without re-searching
+
+    Records the full `blastn` tabular output of each query FASTA (antigen
+    genes and cgMLST330 alleles) against the genome, the cgMLST330 allele
+    sequences extracted from the genome, the `mash dist` output (or parsed Mash
+    results if computed for a batch of genomes) and the genome size so that
+    predictions can be rebuilt from the artifacts alone (e.g. with different
+    output levels, serovar lists or QC) without the genome FASTA, BLAST or
+    Mash.
+
+    `blastn` outputs are stored with the SHA-256 of their query FASTA and can
+    only be replayed while the installed query FASTA is unchanged.
+
+    Args:
+        genome (str): genome name
+        fasta_filepath (str): genome FASTA path
+        fasta_sha256 (str): SHA-256 of the genome FASTA file (None for an in-memory genome)
+        genome_size (int): total genome sequence length
+    """
+
+    def __init__(self, genome, fasta_filepath=None, fasta_sha256=None, genome_size=None):
+        self.version = ARTIFACT_VERSION
+        self.sistr_version = __version__
+        self.genome = genome
+        self.fasta_filepath = fasta_filepath
+        self.fasta_sha256 = fasta_sha256
+        self.genome_size = genome_size
+        self.blast_outputs = {}
+        self.allele_sequences = {}
+        self.mash_out = None
+
+    def _query_key(self, query_fasta_path):
+        return os.path.basename(query_fasta_path)
+
+    def add_blast_output(self, query_fasta_path, columns, blast_outfile):
+        """Record the `blastn` tabular output of a query FASTA
+
+        Args:
+            query_fasta_path (str): query FASTA path
+            columns (list of str): `blastn` output columns
+            blast_outfile (str): `blastn` tabular output file path
+        """
+        with open(blast_outfile, 'rb') as fh:
+            data = fh.read()
+        self.blast_outputs[self._query_key(query_fasta_path)] = {'query_sha256': query_sha256(query_fasta_path),
+                                                                 'columns': list(columns),
+                                                                 'data': data}
+
+    def blast_output(self, query_fasta_path, columns=None):
+        """Recorded `blastn` tabular output of a query FASTA
+
+        Args:
+            query_fasta_path (str): query FASTA path
+            columns (list of str): output columns to return (subset of the recorded columns); all
+                `BLAST_TABLE_COLS` by default
+
+        Returns:
+            bytes: `blastn` tabular output with `columns`
+
+        Raises:
+            KeyError: No output recorded for the query FASTA
+            ArtifactsMismatchError: Query FASTA changed since the output was recorded
+        """
+        if columns is None:
+            columns = BLAST_TABLE_COLS
+        key = self._query_key(query_fasta_path)
+        if key not in self.blast_outputs:
+            raise KeyError('No blastn output of "{}" in artifacts of genome "{}"'.format(key, self.genome))
+        record = self.blast_outputs[key]
+        if record['query_sha256'] != query_sha256(query_fasta_path):
+            raise ArtifactsMismatchError('Query FASTA "{}" changed since the artifacts of genome "{}" were created'.format(
+                query_fasta_path, self.genome))
+        if list(columns) == record['columns']:
+            return record['data']
+        idx = [record['columns'].index(c) for c in columns]
+        lines = []
+        for line in record['data'].splitlines():
+            if not line:
+                continue
+            fields = line.split(b'\t')
+            lines.append(b'\t'.join(fields[i] for i in idx))
+        return b'\n'.join(lines) + b'\n' if lines else b''
+
+    def add_allele_sequences(self, cgmlst_fasta_path, allele_sequences):
+        """Record the cgMLST330 allele sequences extracted from the genome for a cgMLST allele FASTA"""
+        self.allele_sequences[self._query_key(cgmlst_fasta_path)] = allele_sequences
+
+    def get_allele_sequences(self, cgmlst_fasta_path):
+        """Recorded cgMLST330 allele sequences extracted from the genome for a cgMLST allele FASTA"""
+        return self.allele_sequences[self._query_key(cgmlst_fasta_path)]
+
+    def save(self, path):
+        """Write artifacts to a gzipped pickle file (atomically)
+
+        Artifacts of the same genome (e.g. from an earlier run) are replaced.
+
+        Args:
+            path (str): output path
+
+        Raises:
+            FileExistsError: `path` has artifacts of a different genome
+        """
+        if os.path.exists(path):
+            try:
+                saved_genome = self.load(path).genome
+            except ArtifactsMismatchError:
+                # artifacts of an older format version cannot be replayed anyway
+                saved_genome = self.genome
+            if saved_genome != self.genome:
+                raise FileExistsError('Artifacts "{}" of genome "{}" cannot be overwritten with artifacts of '
+                                      'genome "{}"'.format(path, saved_genome, self.genome))
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as fh:
+                pickle.dump(self, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Read artifacts written by :meth:`save`
+
+        Args:
+            path (str): artifact file path
+
+        Returns:
+            GenomeArtifacts: genome artifacts
+
+        Raises:
+            ArtifactsMismatchError: Artifact format version differs from `ARTIFACT_VERSION`
+        """
+        with gzip.open(path, 'rb') as fh:
+            artifacts = pickle.load(fh)
+        version = getattr(artifacts, 'version', None)
+        if version != ARTIFACT_VERSION:
+            raise ArtifactsMismatchError('Artifacts "{}" have format version {} (expected {})'.format(
+                path, version, ARTIFACT_VERSION))
+        return artifacts
+
+
+class ArtifactBlastRunner:
+    """Stand-in for :class:`sistr.src.blast_wrapper.BlastRunner` serving `blastn` outputs from artifacts
+
+    :meth:`blast_against_query` returns the recorded `blastn` output as an
+    in-memory file for :class:`sistr.src.blast_wrapper.BlastReader`.
+    cgMLST330 allele sequences are read from the artifacts instead of the
+    genome FASTA (see :func:`sistr.src.cgmlst.run_cgmlst`).
+
+    Args:
+        artifacts (GenomeArtifacts): genome artifacts
+    """
+    replay = True
+    genome = None
+
+    def __init__(self, artifacts):
+        self.artifacts = artifacts
+        self.fasta_path = artifacts.fasta_filepath
+        self.tmp_fasta_path = None
+        self.tmp_work_dir = None
+
+    def blast_against_query(self, query_fasta_path, blast_task='megablast', evalue=1e-20, min_pid=85, columns=None):
+        return io.BytesIO(self.artifacts.blast_output(query_fasta_path, columns))
+
+    def prep_blast(self):
+        pass
+
+    def cleanup(self):
+        pass
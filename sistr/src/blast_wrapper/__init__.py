@@ -1,3 +1,4 @@
+import copy
 from datetime import datetime
 import logging
 import shutil
@@ -28,13 +29,45 @@ slen
 sseq
 '''.strip().split('\n')
 
+#: dict: explicit column dtypes for parsing `blastn` tabular output with `BLAST_TABLE_COLS`
+BLAST_TABLE_DTYPES = {'qseqid': str,
+                      'stitle': str,
+                      'pident': np.float64,
+                      'length': np.int64,
+                      'mismatch': np.int64,
+                      'gapopen': np.int64,
+                      'qstart': np.int64,
+                      'qend': np.int64,
+                      'sstart': np.int64,
+                      'send': np.int64,
+                      'evalue': np.float64,
+                      'bitscore': np.float64,
+                      'qlen': np.int64,
+                      'slen': np.int64,
+                      'sseq': str, }
+
+#: dict: column dtypes of parsed `blastn` results (see :class:`BlastReader`), including derived columns
+BLAST_RESULT_DTYPES = dict(BLAST_TABLE_DTYPES,
+                           coverage=np.float64,
+                           is_trunc=np.bool_)
+
+#: list: `BLAST_TABLE_COLS` without the subject sequence for when aligned sequences are not needed
+BLAST_TABLE_COLS_NO_SSEQ = [x for x in BLAST_TABLE_COLS if x != 'sseq']
+
 
 class BlastRunner:
     blast_db_created = False
-
-    def __init__(self, fasta_path, tmp_work_dir):
+    #: bool: `blastn` outputs are replayed from artifacts instead of searched (see `sistr.src.artifacts`)
+    replay = False
+    #: sistr.src.artifacts.GenomeArtifacts: records `blastn` outputs if set
+    artifacts = None
+    #: sistr.src.genome.Genome: genome loaded into memory; staged for `makeblastdb` from memory if set
+    genome = None
+
+    def __init__(self, fasta_path, tmp_work_dir, genome=None):
         self.tmp_work_dir = tmp_work_dir
         self.fasta_path = fasta_path
+        self.genome = genome
 
 
     def _create_tmp_folder(self):
@@ -58,13 +91,20 @@ class BlastRunner:
         return self.tmp_work_dir
 
     def _copy_fasta_to_work_dir(self):
-        filename = os.path.basename(self.fasta_path)
+        if self.fasta_path is None:
+            # genome only in memory (e.g. from a multi-genome FASTA stream)
+            filename = self.genome.name + '.fasta'
+        else:
+            filename = os.path.basename(self.fasta_path)
         filename_no_spaces = re.sub(r'\W', '_', filename)
         dest_path = os.path.join(self.tmp_work_dir, filename_no_spaces)
         if self.fasta_path == dest_path:
             self.tmp_fasta_path = dest_path
             return dest_path
-        shutil.copyfile(self.fasta_path, dest_path)
+        if self.genome is not None:
+            self.genome.write_fasta(dest_path)
+        else:
+            shutil.copyfile(self.fasta_path, dest_path)
         self.tmp_fasta_path = dest_path
         return dest_path
 
@@ -97,7 +137,26 @@ class BlastRunner:
             logging.error(ex_msg)
             raise Exception(ex_msg)
 
-    def blast_against_query(self, query_fasta_path, blast_task='megablast', evalue=1e-20, min_pid=85):
+    def blast_against_query(self, query_fasta_path, blast_task='megablast', evalue=1e-20, min_pid=85, columns=None):
+        """Run `blastn` of a query FASTA against the genome BLAST DB
+
+        Args:
+            query_fasta_path (str): query FASTA path
+            blast_task (str): `blastn` task
+            evalue (float): max e-value
+            min_pid (float): min percent identity
+            columns (list of str): `blastn` tabular output columns (subset of `BLAST_TABLE_COLS`); all of
+                `BLAST_TABLE_COLS` by default. Parse the output with the same `file_columns` in :class:`BlastReader`.
+
+        Returns:
+            str: `blastn` tabular output file path
+        """
+        if columns is None:
+            columns = BLAST_TABLE_COLS
+        output_columns = columns
+        if self.artifacts is not None:
+            # record all columns so that the results can be re-scored at any output level
+            columns = BLAST_TABLE_COLS
 
         if not self.blast_db_created:
             self.prep_blast()
@@ -116,7 +175,7 @@ class BlastRunner:
                    '-dust', 'no',
                    '-perc_identity', '{}'.format(min_pid),
                    '-out', outfile,
-                   '-outfmt', '6 {}'.format(' '.join(BLAST_TABLE_COLS))],
+                   '-outfmt', '6 {}'.format(' '.join(columns))],
                   stdout=PIPE,
                   stderr=PIPE)
 
@@ -130,6 +189,11 @@ class BlastRunner:
             logging.debug('blastn on db {} and query {} STDERR: {}'.format(genome_filename, gene_filename, stderr))
 
         if os.path.exists(outfile):
+            if self.artifacts is not None:
+                self.artifacts.add_blast_output(query_fasta_path, columns, outfile)
+                if list(output_columns) != list(columns):
+                    with open(outfile, 'wb') as fh:
+                        fh.write(self.artifacts.blast_output(query_fasta_path, output_columns))
             return outfile
         else:
             ex_msg = 'blastn on db {} and query {} did not produce expected output file at {}'.format(genome_filename,
@@ -153,28 +217,113 @@ class BlastRunner:
         return blast_outfile
 
 
+class BlastHits:
+    """Lightweight columnar table of `blastn` results
+
+    Columns are numpy arrays keyed by column name in output column order.
+    Row selection and sorting mirror the equivalent pandas operations so that
+    hit selection decisions are the same as with a DataFrame.
+    """
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns (dict): column name to numpy array of equal length
+        """
+        self.columns = columns
+
+    @classmethod
+    def from_df(cls, df):
+        return cls({c: df[c].to_numpy() for c in df.columns})
+
+    def __len__(self):
+        for arr in self.columns.values():
+            return len(arr)
+        return 0
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def take(self, idx):
+        """Select rows by boolean mask or integer indices
+
+        Args:
+            idx (numpy.ndarray): boolean mask or integer row indices
+
+        Returns:
+            BlastHits: selected rows
+        """
+        return BlastHits({c: arr[idx] for c, arr in self.columns.items()})
+
+    def argsort(self, column, ascending=True):
+        """Row indices sorted by a column the same way as `pandas.DataFrame.sort_values`
+
+        Args:
+            column (str): column name
+            ascending (bool): sort ascending or descending
+
+        Returns:
+            numpy.ndarray: sorted row indices
+        """
+        values = self.columns[column]
+        idx = np.arange(len(values))
+        if not ascending:
+            values = values[::-1]
+            idx = idx[::-1]
+        indexer = idx[values.argsort(kind='quicksort')]
+        if not ascending:
+            indexer = indexer[::-1]
+        return indexer
+
+    def sort_by(self, column, ascending=True):
+        return self.take(self.argsort(column, ascending=ascending))
+
+    def row(self, i=0):
+        """Row as a dict of Python scalar values or None if there is no such row"""
+        if i >= len(self):
+            return None
+        return {c: (arr[i].item() if isinstance(arr[i], np.generic) else arr[i]) for c, arr in self.columns.items()}
+
+
 class BlastReader:
     is_missing = True
     is_perfect_match = False
     is_trunc = False
     df = None
+    df_unfiltered = None
+    _hits = None
 
 
-    def __init__(self, blast_outfile,filter=[]):
+    def __init__(self, blast_outfile,filter=[], columns=None, file_columns=None):
         """Read BLASTN output file into a pandas DataFrame
         Sort the DataFrame by BLAST bitscore.
         If there are no BLASTN results, then no results can be returned.
 
         Args:
             blast_outfile (str): `blastn` output file path
+            filter (list of str): `qseqid` regex patterns of results to exclude
+            columns (list of str): subset of `file_columns` to parse (e.g. `BLAST_TABLE_COLS_NO_SSEQ`);
+                all columns are parsed by default
+            file_columns (list of str): columns in the `blastn` output file (see
+                :meth:`BlastRunner.blast_against_query`); `BLAST_TABLE_COLS` by default
 
         Raises:
             EmptyDataError: No data could be parsed from the `blastn` output file
         """
         self.blast_outfile = blast_outfile
+        if file_columns is None:
+            file_columns = BLAST_TABLE_COLS
+        if columns is None:
+            columns = file_columns
         try:
-            self.df = pd.read_csv(self.blast_outfile, header=None, sep='\t')
-            self.df.columns = BLAST_TABLE_COLS
+            self.df = pd.read_csv(self.blast_outfile,
+                                  header=None,
+                                  sep='\t',
+                                  names=file_columns,
+                                  usecols=columns,
+                                  dtype={c: BLAST_TABLE_DTYPES[c] for c in columns})
+            if self.df.shape[0] == 0:
+                raise EmptyDataError('No columns to parse from file')
             # calculate the coverage for when results need to be validated
             self.df.loc[:, 'coverage'] = self.df.length / self.df.qlen
             self.df.sort_values(by='bitscore', ascending=False, inplace=True)
@@ -187,15 +336,51 @@ class BlastReader:
 
             logging.debug(self.df.head())
             self.is_missing = False
+            self.df_unfiltered = self.df
             self.filter_rows(filter)
         except EmptyDataError as exc:
             logging.warning('No BLASTN results to parse from file %s', blast_outfile)
+            self.df = None
             self.is_missing = True
 
     def filter_rows(self,filter):
+        """Remove results with a `qseqid` matching any of the `filter` regex patterns"""
+        if len(filter) == 0:
+            return
+        regex = re.compile('|'.join('(?:{})'.format(f) for f in filter))
+        is_excluded = np.array([regex.search(x) is not None for x in self.df['qseqid']], dtype=bool)
+        self.df = self.df[~is_excluded]
+        self._hits = None
+
+    @property
+    def hits(self):
+        """BlastHits: results as a columnar table in the same (bitscore descending) order as `df`"""
+        if self.is_missing:
+            return None
+        if self._hits is None:
+            self._hits = BlastHits.from_df(self.df)
+        return self._hits
+
+    def refilter(self, filter):
+        """Copy of this reader with a different set of `qseqid` exclusion filters applied
+
+        The filters are applied to the full set of parsed `blastn` results so
+        results can be re-evaluated without re-running `blastn`.
 
-        for f in filter:
-            self.df = self.df[~self.df['qseqid'].str.contains(f)]
+        Args:
+            filter (list of str): `qseqid` patterns of results to exclude
+
+        Returns:
+            BlastReader: new reader over the filtered results
+        """
+        reader = copy.copy(self)
+        reader.is_perfect_match = False
+        reader.is_trunc = False
+        if not self.is_missing:
+            reader.df = self.df_unfiltered
+            reader._hits = None
+            reader.filter_rows(filter)
+        return reader
 
     def df_dict(self):
         if not self.is_missing:
@@ -4,7 +4,11 @@ import numpy as np
 NT_SUB = {x:y for x,y in zip('acgtrymkswhbvdnxACGTRYMKSWHBVDNX', 'tgcayrkmswdvbhnxTGCAYRKMSWDVBHNX')}
 
 
-revcomp = lambda s: ''.join([NT_SUB[c] for c in s[::-1]])
+#: dict: `str.translate` table complementing IUPAC nucleotide characters
+NT_COMPLEMENT = str.maketrans(NT_SUB)
+
+
+revcomp = lambda s: s[::-1].translate(NT_COMPLEMENT)
 
 
 def extend_subj_match_vec(df):
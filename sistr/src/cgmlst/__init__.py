@@ -5,10 +5,12 @@ from collections import Counter, defaultdict
 import numpy as np
 import pandas as pd
 from sistr.src.blast_wrapper import BlastReader
-from sistr.src.blast_wrapper.helpers import extend_subj_match_vec, retrieve_seq
+from sistr.src.blast_wrapper.helpers import extend_subj_match_vec
+from sistr.src.genome import Genome
 from sistr.src.cgmlst.msa import msa_ref_vs_novel, number_gapped_ungapped, MSA_GAP_PROP_THRESHOLD
 from sistr.src.parsers import parse_fasta
-from sistr.src.serovar_prediction.constants import CGMLST_SUBSPECIATION_DISTANCE_THRESHOLD, genomes_to_subspecies
+from sistr.src.reference_data import reference_data
+from sistr.src.serovar_prediction.constants import CGMLST_SUBSPECIATION_DISTANCE_THRESHOLD
 
 
 CGMLST_CENTROID_FASTA_PATH = resource_filename('sistr', 'data/cgmlst/cgmlst-centroid.fasta')
@@ -113,23 +115,55 @@ def allele_result_dict(name, seq, blast_result):
             'blast_result': blast_result, }
 
 
-def get_allele_sequences(genome_fasta_path, contig_blastn_records, full=False):
+def ref_allele_sequences(cgmlst_fasta_path, seqids):
+    """Sequences of cgMLST330 reference alleles read with a single scan of the allele FASTA
+
+    Args:
+        cgmlst_fasta_path (str): cgMLST330 allele FASTA path
+        seqids (set of str): allele FASTA headers
+
+    Returns:
+        dict: allele FASTA header to sequence
+    """
+    out = {}
+    if not seqids:
+        return out
+    for h, s in parse_fasta(cgmlst_fasta_path):
+        if h in seqids and h not in out:
+            out[h] = s
+            if len(out) == len(seqids):
+                break
+    return out
+
+
+def get_allele_sequences(genome, contig_blastn_records, full=False):
+    """Extract and align cgMLST330 alleles truncated or partially matched in the BLAST results
+
+    Args:
+        genome (sistr.src.genome.Genome or str): loaded genome or genome FASTA path
+        contig_blastn_records (dict): contig header to BLAST result rows of alleles to retrieve
+            (see :func:`alleles_to_retrieve`)
+        full (bool): use the full cgMLST330 allele FASTA instead of the centroid alleles
+
+    Returns:
+        dict: marker to allele results dict of each retrieved allele
+    """
     cgmlst_fasta_path = CGMLST_CENTROID_FASTA_PATH if not full else CGMLST_FULL_FASTA_PATH
+    if not isinstance(genome, Genome):
+        genome = Genome.from_fasta(genome)
+    ref_seqs = ref_allele_sequences(cgmlst_fasta_path,
+                                    {r['qseqid'] for records in contig_blastn_records.values() for r in records})
     out = {}
-    for header, seq in parse_fasta(genome_fasta_path):
+    for header in genome.headers:
         if header in contig_blastn_records:
             for r in contig_blastn_records[header]:
                 start_idx = r['start_idx']
                 end_idx = r['end_idx']
                 needs_revcomp = r['needs_revcomp']
-                logging.debug('seq len {}| start {}| end {}| revcomp? {}'.format(len(seq), start_idx, end_idx, needs_revcomp))
-                allele_seq = retrieve_seq(seq, start_idx, end_idx, needs_revcomp)
+                logging.debug('contig {}| start {}| end {}| revcomp? {}'.format(header, start_idx, end_idx, needs_revcomp))
+                allele_seq = genome.retrieve_seq(header, start_idx, end_idx, needs_revcomp)
                 ref_seqid = r['qseqid']
-                ref_seq = None
-                for h, s in parse_fasta(cgmlst_fasta_path):
-                    if h == ref_seqid:
-                        ref_seq = s
-                        break
+                ref_seq = ref_seqs.get(ref_seqid)
                 if ref_seq is None:
                     raise Exception('Could not retrieve allele %s from %s', ref_seqid, cgmlst_fasta_path)
                 msa_ref, msa_novel = msa_ref_vs_novel(ref_seq, allele_seq)
@@ -235,11 +269,31 @@ def matches_to_marker_results(df):
     return marker_results
 
 
-def find_closest_related_genome(marker_results, df_genome_profiles):
+def profiles_matching_counts(query_profiles, profiles_matrix):
+    """Number of matching alleles between each query and each reference cgMLST330 allelic profile
+
+    Missing alleles (NaN) never match.
+
+    Args:
+        query_profiles (numpy.ndarray): float64 query allelic profiles (queries x markers)
+        profiles_matrix (numpy.ndarray): float64 reference allelic profiles (genomes x markers) with the same
+            marker columns as `query_profiles`
+
+    Returns:
+        numpy.ndarray: int matching allele counts (queries x genomes)
+    """
+    counts = np.zeros((query_profiles.shape[0], profiles_matrix.shape[0]), dtype=np.int64)
+    for query_alleles, ref_alleles in zip(query_profiles.T, profiles_matrix.T):
+        counts += query_alleles[:, np.newaxis] == ref_alleles[np.newaxis, :]
+    return counts
+
+
+def find_closest_related_genome(marker_results, df_genome_profiles, profiles_matrix=None):
     """
 
     Args:
         df_genome_profiles (pandas.DataFrame):
+        profiles_matrix (numpy.ndarray): `df_genome_profiles` as a float64 matrix if already computed
 
     Returns:
         (dict, list): Most closely related Genome and list of other related Genomes_ in order of relatedness
@@ -249,8 +303,9 @@ def find_closest_related_genome(marker_results, df_genome_profiles):
 
     profile = [marker_results[marker_name] if marker_name in marker_results else None for marker_name in marker_names]
     genome_profile = np.array(profile, dtype=np.float64)
-    profiles_matrix = np.array(df_genome_profiles, dtype=np.float64)
-    genome_profile_similarity_counts = np.apply_along_axis(lambda x: (x == genome_profile).sum(), 1, profiles_matrix)
+    if profiles_matrix is None:
+        profiles_matrix = np.array(df_genome_profiles, dtype=np.float64)
+    genome_profile_similarity_counts = profiles_matching_counts(genome_profile[np.newaxis, :], profiles_matrix)[0]
 
     df_relatives = pd.DataFrame()
     df_relatives['matching'] = genome_profile_similarity_counts
@@ -293,14 +348,88 @@ def cgmlst_subspecies_call(df_relatives):
         df_relatives = df_relatives.loc[df_relatives.distance <= CGMLST_SUBSPECIATION_DISTANCE_THRESHOLD, :]
         df_relatives = df_relatives.sort_values('distance', ascending=True)
         logging.debug('df_relatives by cgmlst %s', df_relatives.head())
-        genome_spp = genomes_to_subspecies()
-        subspecies_below_threshold = [genome_spp[member_genome] if member_genome in genome_spp else None for member_genome in df_relatives.index]
+        subspecies_below_threshold = reference_data().genome_subspecies.lookup(list(df_relatives.index))
         subspecies_below_threshold = filter(None, subspecies_below_threshold)
         subspecies_counter = Counter(subspecies_below_threshold)
         logging.debug('Subspecies counter: %s', subspecies_counter)
         return (subspecies_counter.most_common(1)[0][0], closest_distance, dict(subspecies_counter))
 
 
+#: int: number of query allelic profiles compared to the reference profiles at a time in `cgmlst_predictions_from_profiles`
+PROFILE_CHUNK_SIZE = 64
+
+
+def cgmlst_profile_st(profile):
+    """cgMLST330 Sequence Type of an allelic profile or None if any allele is missing
+
+    Args:
+        profile (dict): marker name to allele name (None if missing)
+
+    Returns:
+        int: CRC32 of the allele names of all markers in marker name order
+    """
+    allele_names = []
+    for marker in sorted(profile.keys()):
+        aname = profile[marker]
+        if not aname:
+            return None
+        allele_names.append(str(aname))
+    return allele_name('-'.join(allele_names))
+
+
+def cgmlst_predictions_from_profiles(df_query_profiles, chunk_size=PROFILE_CHUNK_SIZE):
+    """cgMLST330 serovar, subspecies and closest reference genome predictions from existing allelic profiles
+
+    Re-predicts genomes from allelic profiles (e.g. from a previous run's
+    ``--cgmlst-profiles`` output) without BLAST. Profiles are compared to the
+    reference profiles `chunk_size` genomes at a time, giving the same
+    results as :func:`run_cgmlst` on the genomes.
+
+    Args:
+        df_query_profiles (pandas.DataFrame): allelic profiles indexed by genome name with a column per marker
+            (missing alleles are NaN)
+        chunk_size (int): query profiles compared at a time
+
+    Yields:
+        (str, dict, dict): genome name, cgMLST prediction and marker allele results as returned by
+        :func:`run_cgmlst` (without allele sequences or BLAST results)
+    """
+    ref = reference_data()
+    df_cgmlst_profiles = ref.cgmlst_profiles
+    markers = list(df_cgmlst_profiles.columns)
+    n_markers = len(markers)
+    ref_genomes = np.asarray(df_cgmlst_profiles.index)
+    ref_serovars = np.array([ref.genome_serovar[genome] for genome in ref_genomes], dtype=object)
+    df_query_profiles = df_query_profiles.reindex(columns=markers)
+    query_matrix = df_query_profiles.to_numpy(dtype=np.float64)
+    genomes = list(df_query_profiles.index)
+    for start in range(0, len(genomes), chunk_size):
+        counts = profiles_matching_counts(query_matrix[start:start + chunk_size], ref.cgmlst_profiles_matrix)
+        for i, matching in enumerate(counts):
+            query_profile = query_matrix[start + i]
+            distances = 1.0 - (matching / float(n_markers))
+            # first of the closest genomes as in the stable sort of `find_closest_related_genome`
+            top = int(np.argmax(matching))
+            close = np.flatnonzero(distances <= CGMLST_SUBSPECIATION_DISTANCE_THRESHOLD)
+            if len(close) == 0:
+                close = np.array([top])
+            close = close[np.argsort(distances[close], kind='stable')]
+            df_relatives = pd.DataFrame({'matching': matching[close], 'distance': distances[close]},
+                                        index=ref_genomes[close])
+            subspeciation_tuple = cgmlst_subspecies_call(df_relatives)
+            spp = subspeciation_tuple[0] if subspeciation_tuple is not None else None
+            is_found = ~np.isnan(query_profile)
+            profile = {marker: (int(x) if found else None) for marker, x, found in zip(markers, query_profile, is_found)}
+            marker_results = {marker: allele_result_dict(aname, None, None) for marker, aname in profile.items()}
+            yield genomes[start + i], {'distance': float(distances[top]),
+                                       'genome_match': ref_genomes[top],
+                                       'serovar': ref_serovars[top],
+                                       'matching_alleles': int(matching[top]),
+                                       'found_loci': int(is_found.sum()),
+                                       'subspecies': spp,
+                                       'cgmlst330_ST': cgmlst_profile_st(profile), }, marker_results
+
+
 def run_cgmlst(blast_runner, full=False):
     """Perform in silico cgMLST on an input genome
 
@@ -311,9 +440,8 @@ def run_cgmlst(blast_runner, full=False):
         dict: cgMLST ref genome match, distance to closest ref genome, subspecies and serovar predictions
         dict: marker allele match results (seq, allele name, blastn results)
     """
-    from sistr.src.serovar_prediction.constants import genomes_to_serovar
-
-    df_cgmlst_profiles = ref_cgmlst_profiles()
+    ref = reference_data()
+    df_cgmlst_profiles = ref.cgmlst_profiles
 
     logging.debug('{} distinct cgMLST330 profiles'.format(df_cgmlst_profiles.shape[0]))
 
@@ -338,9 +466,15 @@ def run_cgmlst(blast_runner, full=False):
 
     marker_match_results = matches_to_marker_results(df_cgmlst_blastn[df_cgmlst_blastn.is_match])
     contig_blastn_records = alleles_to_retrieve(df_cgmlst_blastn)
-    retrieved_marker_alleles = get_allele_sequences(blast_runner.fasta_path,
-                                                    contig_blastn_records,
-                                                    full=full)
+    if getattr(blast_runner, 'replay', False):
+        retrieved_marker_alleles = blast_runner.artifacts.get_allele_sequences(cgmlst_fasta_path)
+    else:
+        genome = blast_runner.genome if blast_runner.genome is not None else blast_runner.fasta_path
+        retrieved_marker_alleles = get_allele_sequences(genome,
+                                                        contig_blastn_records,
+                                                        full=full)
+        if getattr(blast_runner, 'artifacts', None) is not None:
+            blast_runner.artifacts.add_allele_sequences(cgmlst_fasta_path, retrieved_marker_alleles)
     logging.info('Type retrieved_marker_alleles %s', type(retrieved_marker_alleles))
     all_marker_results = marker_match_results.copy()
     found_cgmlst_genes = 0
@@ -361,9 +495,8 @@ def run_cgmlst(blast_runner, full=False):
             logging.error('Missing cgmlst_results for %s', marker)
             logging.debug(res)
     logging.info('Calculating number of matching alleles to serovar predictive cgMLST330 profiles')
-    df_relatives = find_closest_related_genome(cgmlst_results, df_cgmlst_profiles)
-    genome_serovar_dict = genomes_to_serovar()
-    df_relatives['serovar'] = [genome_serovar_dict[genome] for genome in df_relatives.index]
+    df_relatives = find_closest_related_genome(cgmlst_results, df_cgmlst_profiles, ref.cgmlst_profiles_matrix)
+    df_relatives['serovar'] = [ref.genome_serovar[genome] for genome in df_relatives.index]
     logging.debug('Top 5 serovar predictive cgMLST profiles:\n{}'.format(df_relatives.head()))
     spp = None
     subspeciation_tuple = cgmlst_subspecies_call(df_relatives)
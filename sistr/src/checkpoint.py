@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+
+from sistr.version import __version__
+
+#: str: file extension of checkpointed genome results
+CHECKPOINT_FILE_EXT = '.pickle'
+
+#: str: name of the file recording the run options of a checkpoint directory
+CHECKPOINT_OPTIONS_FILE = 'checkpoint.json'
+
+
+class CheckpointMismatchError(Exception):
+    """Checkpoint directory was created by a run with different analysis options or SISTR version"""
+    pass
+
+
+def _fsync_write(path, dirname, write):
+    """Durably and atomically write a file with `write(fh)`"""
+    fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            write(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class Checkpoint:
+    """Durable record of completed genome results of a batch run for resuming after interruption
+
+    Each completed genome's ``(prediction, cgmlst_results)`` is written to
+    its own file (atomically and fsynced) as soon as the genome is finished,
+    keyed by genome name, FASTA path, size and modification time (see
+    :meth:`key`). A restarted run with the same checkpoint directory skips
+    inputs with a checkpointed result and only analyzes the rest.
+
+    The run options and SISTR version are recorded in the checkpoint
+    directory on first use; resuming with different result-affecting options
+    raises :class:`CheckpointMismatchError`.
+
+    Has the same ``key``/``in``/``get``/``put`` interface as
+    :class:`sistr.src.result_cache.ResultCache`.
+
+    Args:
+        checkpoint_dir (str): checkpoint directory; created if it does not exist
+        options (dict): result-affecting analysis options (JSON serializable)
+    """
+
+    def __init__(self, checkpoint_dir, options=None):
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        if options is not None:
+            self._check_options(options)
+
+    def _check_options(self, options):
+        run = {'sistr_version': __version__, 'options': options}
+        path = os.path.join(self.checkpoint_dir, CHECKPOINT_OPTIONS_FILE)
+        if os.path.exists(path):
+            with open(path) as fh:
+                saved = json.load(fh)
+            if saved != json.loads(json.dumps(run)):
+                raise CheckpointMismatchError(
+                    'Checkpoint directory "{}" was created with different analysis options or SISTR version: {} '
+                    '(current: {})'.format(self.checkpoint_dir, saved, run))
+            return
+        _fsync_write(path, self.checkpoint_dir, lambda fh: fh.write(json.dumps(run, sort_keys=True).encode()))
+
+    def _path(self, key):
+        return os.path.join(self.checkpoint_dir, key + CHECKPOINT_FILE_EXT)
+
+    def key(self, fasta_path, genome_name):
+        """Checkpoint key of an input genome
+
+        Args:
+            fasta_path (str): genome FASTA path
+            genome_name (str): genome name
+
+        Returns:
+            str: SHA-256 hex digest key; changes if the FASTA file is modified
+        """
+        stat = os.stat(fasta_path)
+        key_data = {'fasta_path': os.path.abspath(fasta_path),
+                    'genome': genome_name,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Checkpointed results for a key or None if not completed
+
+        Args:
+            key (str): checkpoint key
+
+        Returns:
+            tuple: ``(prediction, cgmlst_results)`` or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                return pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logging.warning('Could not read checkpointed result %s: %s', path, ex)
+            return None
+
+    def put(self, key, result):
+        """Durably record the results of a completed genome (no-op if already recorded)
+
+        Args:
+            key (str): checkpoint key
+            result (tuple): ``(prediction, cgmlst_results)``
+        """
+        if key in self:
+            return
+        _fsync_write(self._path(key), self.checkpoint_dir,
+                     lambda fh: pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL))
+
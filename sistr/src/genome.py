@@ -0,0 +1,209 @@
+import hashlib
+import logging
+import os
+import re
+
+import numpy as np
+
+from sistr.src.blast_wrapper.helpers import revcomp
+from sistr.src.parsers import parse_fasta
+
+
+class Genome:
+    """Genome assembly loaded into memory once and shared by all analysis stages
+
+    Contig sequences are stored concatenated in a single string with an index
+    of each contig's offset and length so that subsequences (e.g. cgMLST330
+    alleles) can be retrieved without copying whole contigs. Genome size,
+    N count and contig stats are computed when the genome is loaded.
+
+    Args:
+        name (str): genome name
+        contigs (list of (str, str)): (header, sequence) of each contig in FASTA order
+        fasta_path (str): genome FASTA path
+
+    Attributes:
+        headers (list of str): contig headers in FASTA order
+        offsets (numpy.ndarray): start offset of each contig in the concatenated sequence
+        lengths (numpy.ndarray): length of each contig
+        size (int): total sequence length
+        n_count (int): number of N (unknown) nucleotides
+        sha256 (str): SHA-256 hex digest of the FASTA file computed while reading it by :meth:`from_fasta`;
+            None for genomes not read from a file
+    """
+
+    def __init__(self, name, contigs, fasta_path=None):
+        self.name = name
+        self.fasta_path = fasta_path
+        self.sha256 = None
+        self.headers = [header for header, _seq in contigs]
+        self.lengths = np.array([len(seq) for _header, seq in contigs], dtype=np.int64)
+        self.offsets = np.zeros(len(contigs), dtype=np.int64)
+        if len(contigs) > 1:
+            self.offsets[1:] = np.cumsum(self.lengths[:-1])
+        self.seq = ''.join(seq for _header, seq in contigs)
+        self.size = len(self.seq)
+        self.n_count = self.seq.count('N') + self.seq.count('n')
+        # the last contig wins for duplicate headers as with a dict of `parse_fasta` output
+        self._index = {header: i for i, header in enumerate(self.headers)}
+
+    @classmethod
+    def from_fasta(cls, fasta_path, name=None):
+        """Read a genome FASTA (optionally gzip compressed) into memory
+
+        The SHA-256 digest of the file (see :func:`sistr.src.parsers.file_sha256`)
+        is computed from the bytes read for parsing and stored as `sha256`.
+
+        Args:
+            fasta_path (str): genome FASTA path
+            name (str): genome name; FASTA filename without extension if None
+
+        Returns:
+            Genome: loaded genome
+        """
+        if name is None:
+            name = os.path.basename(fasta_path).split('.')[0]
+        sha = hashlib.sha256()
+        genome = cls(name, list(parse_fasta(fasta_path, sha=sha)), fasta_path=fasta_path)
+        genome.sha256 = sha.hexdigest()
+        logging.info('%s | Loaded genome with %s contigs (%s bp, %s Ns) from %s',
+                     name, genome.contig_count, genome.size, genome.n_count, fasta_path)
+        return genome
+
+    @property
+    def contig_count(self):
+        return len(self.headers)
+
+    def __contains__(self, header):
+        return header in self._index
+
+    def contig(self, header):
+        """Sequence of a contig by FASTA header"""
+        i = self._index[header]
+        offset = int(self.offsets[i])
+        return self.seq[offset:offset + int(self.lengths[i])]
+
+    def contigs(self):
+        """Generator of (header, sequence) of each contig in FASTA order"""
+        for header, offset, length in zip(self.headers, self.offsets.tolist(), self.lengths.tolist()):
+            yield header, self.seq[offset:offset + length]
+
+    def retrieve_seq(self, header, start, end, needs_revcomp):
+        """Subsequence of a contig (see :func:`sistr.src.blast_wrapper.helpers.retrieve_seq`)
+
+        Args:
+            header (str): contig FASTA header
+            start (int): 0-based start index
+            end (int): 0-based inclusive end index
+            needs_revcomp (bool): reverse complement the subsequence?
+
+        Returns:
+            str: contig subsequence
+        """
+        i = self._index[header]
+        offset = int(self.offsets[i])
+        length = int(self.lengths[i])
+        start = min(max(int(start), 0), length)
+        end = min(max(int(end) + 1, start), length)
+        out_seq = self.seq[offset + start:offset + end]
+        if needs_revcomp:
+            out_seq = revcomp(out_seq)
+        return out_seq
+
+    def stats(self):
+        """Genome size, N count and contig length stats
+
+        Returns:
+            dict: genome size, N count, number of contigs, N50 and min/max contig length
+        """
+        n50 = 0
+        if self.contig_count:
+            lengths = np.sort(self.lengths)[::-1]
+            n50 = int(lengths[np.searchsorted(np.cumsum(lengths), self.size / 2.0)])
+        return {'size': self.size,
+                'n_count': self.n_count,
+                'contig_count': self.contig_count,
+                'n50': n50,
+                'min_contig_length': int(self.lengths.min()) if self.contig_count else 0,
+                'max_contig_length': int(self.lengths.max()) if self.contig_count else 0, }
+
+    def write_fasta(self, path):
+        """Write the genome as a plain FASTA file (e.g. to stage it for `makeblastdb`)
+
+        Args:
+            path (str): output FASTA path
+        """
+        with open(path, 'w') as fh:
+            for header, seq in self.contigs():
+                fh.write('>{}\n{}\n'.format(header, seq))
+
+
+def genome_id_from_header(header, delimiter='|', regex=None):
+    """Genome ID of a contig in a multi-genome FASTA from its header
+
+    Args:
+        header (str): contig FASTA header
+        delimiter (str): genome ID is the header text before the first `delimiter` (the first word of the header if
+            `delimiter` is not found)
+        regex (re.Pattern): if set, genome ID is the first group (or whole match) of this pattern matched at the
+            start of the header instead
+
+    Returns:
+        str: genome ID
+
+    Raises:
+        ValueError: `regex` does not match the header
+    """
+    if regex is not None:
+        m = regex.match(header)
+        if m is None:
+            raise ValueError('Genome ID pattern "{}" does not match FASTA header "{}"'.format(regex.pattern, header))
+        return m.group(1) if regex.groups else m.group(0)
+    if delimiter and delimiter in header:
+        return header.split(delimiter, 1)[0]
+    words = header.split()
+    return words[0] if words else header
+
+
+def genomes_from_multi_fasta(fasta_path, delimiter='|', regex=None):
+    """Genomes from a FASTA of the contigs of multiple genomes, yielded as soon as each genome is complete
+
+    The contigs of each genome must be contiguous in the FASTA. A genome is
+    complete when a contig of a different genome (or the end of the input) is
+    reached, so genomes can be analyzed while the rest of the input is still
+    being read (e.g. from standard input).
+
+    Args:
+        fasta_path (str): multi-genome FASTA path (optionally gzip compressed) or "-" for standard input
+        delimiter (str): genome ID delimiter in contig headers (see :func:`genome_id_from_header`)
+        regex (str): genome ID pattern (see :func:`genome_id_from_header`)
+
+    Yields:
+        Genome: each genome in FASTA order with `fasta_path` set to the absolute multi-genome FASTA path (or "-")
+
+    Raises:
+        ValueError: contigs of a genome are not contiguous in the FASTA
+    """
+    if regex is not None:
+        regex = re.compile(regex)
+    source = fasta_path if fasta_path == '-' else os.path.abspath(fasta_path)
+    seen = set()
+    genome_id = None
+    contigs = []
+    for header, seq in parse_fasta(fasta_path):
+        if header == '' and seq == '':
+            # empty input
+            continue
+        contig_genome_id = genome_id_from_header(header, delimiter, regex)
+        if contig_genome_id != genome_id:
+            if contigs:
+                yield Genome(genome_id, contigs, fasta_path=source)
+            if contig_genome_id in seen:
+                raise ValueError('Contigs of genome "{}" are not contiguous in multi-genome FASTA "{}"'.format(
+                    contig_genome_id, fasta_path))
+            seen.add(contig_genome_id)
+            genome_id = contig_genome_id
+            contigs = []
+        contigs.append((header, seq))
+    if contigs:
+        yield Genome(genome_id, contigs, fasta_path=source)
@@ -1,9 +1,15 @@
+import heapq
 import logging
 import re, os
+import shutil
+import tempfile
+from collections import Counter
+from functools import lru_cache
 from pkg_resources import resource_filename
 from subprocess import Popen, PIPE
 import pandas as pd
-from sistr.src.serovar_prediction.constants import genomes_to_serovar, genomes_to_subspecies
+from sistr.src.parsers import file_sha256
+from sistr.src.reference_data import reference_data
 from sistr.src.serovar_prediction.constants import MASH_SUBSPECIATION_DISTANCE_THRESHOLD
 
 
@@ -34,6 +40,138 @@ def mash_dist_trusted(fasta_path):
     return stdout
 
 
+def _run_mash(args, cwd=None):
+    p = Popen(args, stderr=PIPE, stdout=PIPE, cwd=cwd)
+    (stdout, stderr) = p.communicate()
+    if p.returncode != 0:
+        raise Exception('Could not run Mash {} {}'.format(args[1], stderr))
+    return stdout
+
+
+def mash_sketch_params(sketch_path=MASH_SKETCH_FILE):
+    """k-mer size and sketch size of a Mash sketch file
+
+    Query sketches must be created with the same parameters as the reference
+    sketch to compute distances between them.
+
+    Args:
+        sketch_path (str): Mash sketch file path
+
+    Returns:
+        (int, int): k-mer size, sketch size
+    """
+    stdout = _run_mash([MASH_BIN, 'info', '-H', sketch_path]).decode()
+    kmer_size = int(re.search(r'K-mer size:\s+(\d+)', stdout).group(1))
+    sketch_size = int(re.search(r'Sketch size:\s+(\d+)', stdout).group(1))
+    return kmer_size, sketch_size
+
+
+def mash_sketch_cached(fasta_path, cache_dir, kmer_size, sketch_size, sha256=None):
+    """Mash sketch of a genome FASTA cached by FASTA content hash
+
+    The sketch is written to ``{cache_dir}/{sha256}.msh`` and its query name is
+    ``{sha256}.fa`` regardless of the FASTA file path so that sketches can be
+    reused for identical inputs across runs. Sketching happens in a private
+    temporary directory and the finished sketch is moved into place, so
+    concurrent runs (possibly on other hosts) sharing the cache directory do
+    not collide.
+
+    Args:
+        fasta_path (str): genome FASTA path
+        cache_dir (str): sketch cache directory
+        kmer_size (int): k-mer size
+        sketch_size (int): sketch size
+        sha256 (str): SHA-256 of the FASTA file if already computed
+
+    Returns:
+        str: sketch file path
+    """
+    if sha256 is None:
+        sha256 = file_sha256(fasta_path)
+    sketch_path = os.path.join(cache_dir, sha256 + '.msh')
+    if os.path.exists(sketch_path):
+        logging.debug('Using cached Mash sketch %s for %s', sketch_path, fasta_path)
+        return sketch_path
+    work_dir = tempfile.mkdtemp(prefix=sha256 + '.', suffix='.tmp', dir=cache_dir)
+    link_name = sha256 + '.fa'
+    try:
+        os.symlink(os.path.abspath(fasta_path), os.path.join(work_dir, link_name))
+        _run_mash([MASH_BIN, 'sketch',
+                   '-k', str(kmer_size),
+                   '-s', str(sketch_size),
+                   '-o', 'sketch',
+                   link_name],
+                  cwd=work_dir)
+        os.replace(os.path.join(work_dir, 'sketch.msh'), sketch_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return sketch_path
+
+
+def mash_dist_batch(fasta_paths, cache_dir, threads=1, top_k=5, sha256s=None):
+    """Mash results of many genome FASTA files against the reference sketch DB with a single `mash dist`
+
+    Each distinct input FASTA (by content) is sketched once in parallel (see
+    :func:`mash_sketch_cached`), the query sketches are combined and `mash dist`
+    is run once against the reference sketch. The output (all genomes x all
+    reference genomes) is parsed by query as it is streamed from `mash dist`
+    (see :class:`MashDistParser`) so that only the closest reference genomes
+    and subspecies counts of each genome are kept in memory.
+
+    Args:
+        fasta_paths (list of str): genome FASTA paths
+        cache_dir (str): query sketch cache directory
+        threads (int): number of parallel sketching processes and `mash dist` threads
+        top_k (int): number of closest reference genomes to keep per genome
+        sha256s (dict): FASTA path to SHA-256 of files already hashed (e.g. for result cache keys); other files
+            are hashed in parallel
+
+    Returns:
+        dict: FASTA path to :class:`MashResults` (same as :func:`parse_mash_dist` of :func:`mash_dist_trusted`)
+    """
+    from multiprocessing.pool import ThreadPool
+    os.makedirs(cache_dir, exist_ok=True)
+    kmer_size, sketch_size = mash_sketch_params()
+    unique_paths = list(dict.fromkeys(fasta_paths))
+    path_sha256 = {path: sha256s[path] for path in unique_paths if sha256s and path in sha256s}
+    with ThreadPool(max(1, threads)) as pool:
+        unhashed = [path for path in unique_paths if path not in path_sha256]
+        path_sha256.update(zip(unhashed, pool.map(file_sha256, unhashed)))
+        unique_sha256s = list(dict.fromkeys(path_sha256[path] for path in unique_paths))
+        sha256_path = {path_sha256[path]: path for path in unique_paths}
+        sketch_paths = pool.starmap(mash_sketch_cached,
+                                    [(sha256_path[sha256], cache_dir, kmer_size, sketch_size, sha256)
+                                     for sha256 in unique_sha256s])
+    logging.info('Sketched %s distinct genomes (of %s) for Mash in %s', len(unique_sha256s), len(fasta_paths), cache_dir)
+    work_dir = tempfile.mkdtemp(prefix='queries-', dir=cache_dir)
+    combined_prefix = os.path.join(work_dir, 'queries')
+    list_path = combined_prefix + '.txt'
+    parsers = {}
+    try:
+        with open(list_path, 'w') as fout:
+            fout.write('\n'.join(sketch_paths) + '\n')
+        _run_mash([MASH_BIN, 'paste', '-l', combined_prefix, list_path])
+        with tempfile.TemporaryFile() as stderr:
+            p = Popen([MASH_BIN, 'dist', '-p', str(max(1, threads)), MASH_SKETCH_FILE, combined_prefix + '.msh'],
+                      stdout=PIPE, stderr=stderr)
+            with p.stdout:
+                for line in p.stdout:
+                    query = line.split(b'\t', 2)[1]
+                    if query not in parsers:
+                        parsers[query] = MashDistParser(top_k=top_k)
+                    parsers[query].add(line.rstrip(b'\r\n'))
+            if p.wait() != 0:
+                stderr.seek(0)
+                raise Exception('Could not run Mash dist {}'.format(stderr.read()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    results = {}
+    for path in unique_paths:
+        query = (path_sha256[path] + '.fa').encode()
+        results[path] = parsers.get(query, MashDistParser(top_k=top_k)).results()
+    return results
+
+
 def mash_output_to_pandas_df(mash_out):
     from io import BytesIO
     df = pd.read_csv(BytesIO(mash_out), header=None, sep="\t")
@@ -44,38 +182,224 @@ def mash_output_to_pandas_df(mash_out):
     df = df[df['dist'] < MASH_SUBSPECIATION_DISTANCE_THRESHOLD]
     if df.empty:
         logging.warning(f"Empty MASH results dataframe. All hits above the MASH_SUBSPECIATION_DISTANCE_THRESHOLD = {MASH_SUBSPECIATION_DISTANCE_THRESHOLD}")
-    refs = df['ref']
-    serovars = []
-    genome_serovar_dict = genomes_to_serovar()
-    for genome in refs:
-        if genome in genome_serovar_dict:
-            serovars.append(genome_serovar_dict[genome])
-        else:
-            serovars.append('nan')
-
-    df['serovar'] = serovars
+    df['serovar'] = reference_data().genome_serovar.lookup(list(df['ref']), default='nan')
     df['n_match'] = [int(x.split('/')[0]) for x in df['matching']]
     df.sort_values(by='dist', inplace=True)
     
     return df
 
 
-def mash_subspeciation(df_mash):
-    if df_mash.empty:
+class MashReferenceIndex:
+    """Reference sketch name to (genome, serovar, subspecies) index
+
+    Reference sketch names in `mash dist` output are genome FASTA paths. Each
+    distinct name is resolved to the genome name and its reference serovar
+    and subspecies designations once per process and then looked up directly
+    for every subsequent query genome.
+    """
+
+    def __init__(self):
+        self._refs = {}
+
+    def __len__(self):
+        return len(self._refs)
+
+    def __getitem__(self, ref):
+        """
+        Args:
+            ref (bytes): reference sketch name from `mash dist` output
+
+        Returns:
+            (str, str, str): genome name, serovar ("nan" if unknown) and subspecies (None if unknown)
+        """
+        try:
+            return self._refs[ref]
+        except KeyError:
+            genome = re.sub(r'(\.fa$)|(\.fas$)|(\.fasta$)|(\.fna$)', '', os.path.basename(ref.decode()))
+            ref_data = reference_data()
+            self._refs[ref] = (genome,
+                               ref_data.genome_serovar.get(genome, 'nan'),
+                               ref_data.genome_subspecies.get(genome))
+            return self._refs[ref]
+
+
+@lru_cache(maxsize=None)
+def mash_reference_index():
+    """Process-wide :class:`MashReferenceIndex`"""
+    return MashReferenceIndex()
+
+
+class MashResults:
+    """Closest Mash reference genomes and subspecies counts for a query genome
+
+    Attributes:
+        top (list of dict): up to `top_k` closest reference genomes (`row`, `ref`, `dist`, `n_match`, `serovar`)
+            sorted by distance and then `mash dist` output row
+        n_hits (int): number of reference genomes below the distance threshold
+        closest_distance (float): closest reference genome distance or None if no hits
+        subspecies_counter (collections.Counter): subspecies of reference genomes below the distance threshold
+            in order of closest reference genome of each subspecies
+    """
+
+    def __init__(self, top, n_hits, closest_distance, subspecies_counter):
+        self.top = top
+        self.n_hits = n_hits
+        self.closest_distance = closest_distance
+        self.subspecies_counter = subspecies_counter
+
+    @property
+    def empty(self):
+        return self.n_hits == 0
+
+    def top_to_dict(self):
+        """Top reference genome results as a dict of field to dict of `mash dist` output row to value
+
+        Same format as ``pandas.DataFrame.to_dict()`` of the top results of
+        :func:`mash_output_to_pandas_df`.
+        """
+        return {field: {x['row']: x[field] for x in self.top} for field in ('ref', 'dist', 'n_match', 'serovar')}
+
+    @classmethod
+    def from_dataframe(cls, df_mash, top_k=5, threshold=MASH_SUBSPECIATION_DISTANCE_THRESHOLD):
+        """Mash results from a DataFrame of :func:`mash_output_to_pandas_df`
+
+        The DataFrame index is taken as the `mash dist` output row.
+
+        Args:
+            df_mash (pandas.DataFrame): `mash dist` results with `ref`, `dist`, `n_match` and `serovar` columns
+            top_k (int): number of closest reference genomes to keep
+            threshold (float): reference genome distance threshold
+
+        Returns:
+            MashResults: same results as :func:`parse_mash_dist` of the `mash dist` output
+        """
+        genome_subspecies = reference_data().genome_subspecies
+        hits = sorted((dist, row, ref, n_match, serovar)
+                      for row, ref, dist, n_match, serovar in zip(df_mash.index,
+                                                                  df_mash['ref'],
+                                                                  df_mash['dist'],
+                                                                  df_mash['n_match'],
+                                                                  df_mash['serovar'])
+                      if dist < threshold)
+        subspecies_counter = Counter()
+        for _dist, _row, ref, _n_match, _serovar in hits:
+            subspecies = genome_subspecies.get(ref)
+            if subspecies:
+                subspecies_counter[subspecies] += 1
+        top = [{'row': row, 'ref': ref, 'dist': dist, 'n_match': n_match, 'serovar': serovar}
+               for dist, row, ref, n_match, serovar in hits[:top_k]]
+        return cls(top, len(hits), hits[0][0] if hits else None, subspecies_counter)
+
+
+class MashDistParser:
+    """Incremental parser of the `mash dist` output lines of a query genome
+
+    Reference genomes at a distance below `threshold` are counted by
+    subspecies and only the `top_k` closest are kept in a bounded heap, so
+    memory use and post-processing do not depend on the reference sketch DB
+    size.
+
+    Args:
+        top_k (int): number of closest reference genomes to keep
+        threshold (float): reference genome distance threshold
+    """
+
+    def __init__(self, top_k=5, threshold=MASH_SUBSPECIATION_DISTANCE_THRESHOLD):
+        self.top_k = top_k
+        self.threshold = threshold
+        self.ref_index = mash_reference_index()
+        self.row = 0
+        self.n_hits = 0
+        self.closest_distance = None
+        self._heap = []
+        self._subspecies_closest = {}
+        self._subspecies_counts = Counter()
+
+    def add(self, line):
+        """Add a `mash dist` output line (without line terminator) of the query genome"""
+        row = self.row
+        self.row += 1
+        if not line:
+            return
+        ref, _query, dist, _pval, matching = line.split(b'\t')
+        dist = float(dist)
+        if not dist < self.threshold:
+            return
+        self.n_hits += 1
+        if self.closest_distance is None or dist < self.closest_distance:
+            self.closest_distance = dist
+        genome, serovar, subspecies = self.ref_index[ref]
+        if subspecies:
+            self._subspecies_counts[subspecies] += 1
+            key = (dist, row)
+            if subspecies not in self._subspecies_closest or key < self._subspecies_closest[subspecies]:
+                self._subspecies_closest[subspecies] = key
+        item = (-dist, -row, genome, serovar, matching)
+        if len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def results(self):
+        """Closest reference genomes and subspecies counts of the lines added so far
+
+        Returns:
+            MashResults: parsed results
+        """
+        top = [{'row': -neg_row,
+                'ref': genome,
+                'dist': -neg_dist,
+                'n_match': int(matching.split(b'/')[0]),
+                'serovar': serovar}
+               for neg_dist, neg_row, genome, serovar, matching in sorted(self._heap, reverse=True)]
+        subspecies_counter = Counter({spp: self._subspecies_counts[spp]
+                                      for spp in sorted(self._subspecies_closest, key=self._subspecies_closest.get)})
+        if self.n_hits == 0:
+            logging.warning(f"Empty MASH results. All hits above the MASH_SUBSPECIATION_DISTANCE_THRESHOLD = {self.threshold}")
+        return MashResults(top, self.n_hits, self.closest_distance, subspecies_counter)
+
+
+def parse_mash_dist(mash_out, top_k=5, threshold=MASH_SUBSPECIATION_DISTANCE_THRESHOLD):
+    """Parse `mash dist` output keeping only the closest reference genomes and subspecies counts
+
+    Args:
+        mash_out (bytes): `mash dist` STDOUT
+        top_k (int): number of closest reference genomes to keep
+        threshold (float): reference genome distance threshold
+
+    Returns:
+        MashResults: closest reference genomes and subspecies counts (see :class:`MashDistParser`)
+    """
+    parser = MashDistParser(top_k=top_k, threshold=threshold)
+    for line in mash_out.splitlines():
+        parser.add(line)
+    return parser.results()
+
+
+def mash_subspeciation(mash_results):
+    """Majority subspecies of reference genomes below the Mash subspeciation distance threshold
+
+    Args:
+        mash_results (MashResults or pandas.DataFrame): parsed `mash dist` results (see :func:`parse_mash_dist`)
+            or a DataFrame of :func:`mash_output_to_pandas_df`
+
+    Returns:
+        None: if no reference genomes with a subspecies designation below the distance threshold
+        (string, float, dict): most common subspecies, closest reference genome distance, subspecies frequencies
+    """
+    if isinstance(mash_results, pd.DataFrame):
+        mash_results = MashResults.from_dataframe(mash_results)
+    if mash_results.empty:
         return None
-    closest_distance = df_mash['dist'].min()
+    closest_distance = mash_results.closest_distance
     if closest_distance > MASH_SUBSPECIATION_DISTANCE_THRESHOLD:
         logging.warning('Min Mash distance (%s) above subspeciation distance threshold (%s)',
                         closest_distance,
                         MASH_SUBSPECIATION_DISTANCE_THRESHOLD)
         return None
     else:
-        df_mash_spp = df_mash[df_mash['dist'] <= MASH_SUBSPECIATION_DISTANCE_THRESHOLD]
-        genomes = df_mash_spp['ref']
-        from collections import Counter
-        genome_spp = genomes_to_subspecies()
-        subspecies_below_threshold = [genome_spp[g] if g in genome_spp else None for g in genomes]
-        subspecies_below_threshold = filter(None, subspecies_below_threshold)
-        subspecies_counter = Counter(subspecies_below_threshold)
+        subspecies_counter = mash_results.subspecies_counter
         logging.info('Mash subspecies counter: %s', subspecies_counter)
+        if not subspecies_counter:
+            return None
         return (subspecies_counter.most_common(1)[0][0], closest_distance, dict(subspecies_counter))
@@ -0,0 +1,162 @@
+import logging
+
+import pandas as pd
+
+from sistr.src.parsers import parse_fasta
+from sistr.src.readers import read_alleles, read_cgmlst_profiles, read_predictions
+from sistr.src.writers import open_output
+
+
+def parse_shard(spec):
+    """Parse a shard specification "i/N" (1-based shard `i` of `N`)
+
+    Args:
+        spec (str): shard specification, e.g. "2/8"
+
+    Returns:
+        (int, int): shard number (1-based) and number of shards
+
+    Raises:
+        ValueError: Invalid shard specification
+    """
+    try:
+        i, n = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError('Invalid shard "{}". Expected "i/N", e.g. "1/4"'.format(spec))
+    if n < 1 or not 1 <= i <= n:
+        raise ValueError('Invalid shard "{}". Expected 1 <= i <= N'.format(spec))
+    return i, n
+
+
+def shard_inputs(input_fastas, genome_names, shard, n_shards):
+    """Inputs of one shard of a batch split across nodes
+
+    Inputs are ordered by genome name (then FASTA path) and split into
+    `n_shards` contiguous, near equal sized shards, so the shard of each
+    input does not depend on the order of the inputs on the command line and
+    shard outputs combined with ``sistr_cmd merge`` are in the same genome
+    name order.
+
+    Args:
+        input_fastas (list of str): genome FASTA paths
+        genome_names (list of str): genome names
+        shard (int): shard number (1-based)
+        n_shards (int): number of shards
+
+    Returns:
+        (list of str, list of str): FASTA paths and genome names of the shard ordered by genome name
+    """
+    order = sorted(range(len(input_fastas)), key=lambda i: (genome_names[i], input_fastas[i]))
+    n = len(order)
+    selected = order[(shard - 1) * n // n_shards:shard * n // n_shards]
+    logging.info('Shard %s/%s: %s of %s input genomes', shard, n_shards, len(selected), n)
+    return [input_fastas[i] for i in selected], [genome_names[i] for i in selected]
+
+
+def _warn_duplicate(genome, path):
+    logging.warning('%s | Duplicate genome in "%s" ignored (keeping the result from an earlier input)', genome, path)
+
+
+def merge_predictions(paths):
+    """Merge prediction outputs of multiple runs (e.g. shards)
+
+    Args:
+        paths (list of str): prediction output paths (see :func:`sistr.src.readers.read_predictions`)
+
+    Returns:
+        list of dict: prediction output dicts ordered by genome name; the first of duplicate genomes is kept
+    """
+    merged = {}
+    for path in paths:
+        predictions = read_predictions(path)
+        logging.info('Read %s predictions from %s', len(predictions), path)
+        for prediction in predictions:
+            genome = prediction['genome']
+            if genome in merged:
+                _warn_duplicate(genome, path)
+                continue
+            merged[genome] = prediction
+    return [merged[genome] for genome in sorted(merged)]
+
+
+def merge_cgmlst_profiles(paths):
+    """Merge cgMLST330 allelic profiles outputs of multiple runs (e.g. shards)
+
+    Args:
+        paths (list of str): cgMLST330 profiles or allele results paths (see
+            :func:`sistr.src.readers.read_cgmlst_profiles`)
+
+    Returns:
+        pandas.DataFrame: allelic profiles ordered by genome name; the first of duplicate genomes is kept
+    """
+    df = pd.concat([read_cgmlst_profiles(path) for path in paths], sort=False)
+    is_dup = df.index.duplicated(keep='first')
+    for genome in df.index[is_dup]:
+        _warn_duplicate(genome, 'cgMLST330 profiles')
+    return df[~is_dup].sort_index()
+
+
+def merge_alleles(paths, writer):
+    """Write merged allele results of multiple runs (e.g. shards) in genome name order
+
+    Allele results can be large, so only one input is held in memory at a
+    time. Inputs are written in the order of their first genome name (which
+    requires reading each input twice) and each input's genomes in name
+    order, so the merged output of the disjoint shards of
+    :func:`shard_inputs` is in genome name order.
+
+    Args:
+        paths (list of str): allele results JSON paths (see :func:`sistr.src.readers.read_alleles`)
+        writer (sistr.src.writers.AllelesJsonWriter or sistr.src.writers.CompactAllelesWriter): output writer
+
+    Returns:
+        int: number of genomes written
+    """
+    first_genomes = {path: min(read_alleles(path), default='') for path in paths}
+    written = set()
+    last_genome = None
+    for path in sorted(paths, key=lambda x: first_genomes[x]):
+        alleles = read_alleles(path)
+        logging.info('Read allele results of %s genomes from %s', len(alleles), path)
+        for genome in sorted(alleles):
+            if genome in written:
+                _warn_duplicate(genome, path)
+                continue
+            if last_genome is not None and genome < last_genome:
+                logging.warning('%s | Allele results of "%s" overlap the genomes of other inputs; merged allele '
+                                'results are not in genome name order', genome, path)
+            writer.write(genome, alleles[genome])
+            written.add(genome)
+            last_genome = genome
+    return len(written)
+
+
+def merge_novel_alleles(paths, dest):
+    """Merge novel cgMLST330 allele FASTA outputs of multiple runs (e.g. shards)
+
+    Alleles are deduplicated by header (marker and allele name) and written in
+    marker and allele name order.
+
+    Args:
+        paths (list of str): novel allele FASTA paths
+        dest (str): output FASTA path
+
+    Returns:
+        int: number of distinct alleles written
+    """
+    alleles = {}
+    for path in paths:
+        for header, seq in parse_fasta(path):
+            if header == '' and seq == '':
+                # empty FASTA
+                continue
+            if header in alleles:
+                if alleles[header] != seq:
+                    logging.warning('Novel allele "%s" in "%s" has a different sequence than in an earlier input. '
+                                    'Keeping the earlier sequence', header, path)
+                continue
+            alleles[header] = seq
+    with open_output(dest) as fh:
+        for header in sorted(alleles, key=lambda x: x.rsplit('|', 1)):
+            fh.write('>{}\n{}\n'.format(header, alleles[header]))
+    return len(alleles)
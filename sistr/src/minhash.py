@@ -0,0 +1,345 @@
+import json
+import logging
+import os
+from functools import lru_cache
+from subprocess import Popen, PIPE
+
+import numpy as np
+
+from sistr.src.mash import MASH_BIN, MASH_SKETCH_FILE
+
+MURMUR_C1 = np.uint64(0x87c37b91114253d5)
+MURMUR_C2 = np.uint64(0x4cf5ad432745937f)
+
+#: numpy.ndarray: nucleotide byte complement lookup table (non-ACGT bytes map to themselves)
+COMPLEMENT = np.arange(256, dtype=np.uint8)
+COMPLEMENT[np.frombuffer(b'ACGT', dtype=np.uint8)] = np.frombuffer(b'TGCA', dtype=np.uint8)
+
+#: numpy.ndarray: bool lookup table of valid (ACGT) nucleotide bytes
+IS_ACGT = np.zeros(256, dtype=bool)
+IS_ACGT[np.frombuffer(b'ACGT', dtype=np.uint8)] = True
+
+#: int: number of reference sketches compared to a query at a time
+REFERENCE_CHUNK_SIZE = 4096
+
+#: int: number of sequence positions hashed at a time
+KMER_CHUNK_SIZE = 1 << 20
+
+#: int: smallest k-mer size for which Mash uses 64-bit hashes (32-bit MurmurHash3 for smaller k-mers)
+MIN_64BIT_KMER_SIZE = 17
+
+
+class UnsupportedSketchError(Exception):
+    """Mash sketch parameters that the native MinHash implementation cannot reproduce"""
+    pass
+
+
+def check_sketch_params(kmer_size, hash_bits=64):
+    """Check that native sketches are comparable to a Mash sketch with these parameters
+
+    Only 64-bit MurmurHash3 (x64, 128-bit, lower half) hashes are
+    implemented (see :func:`murmurhash3_x64_64`), which Mash uses for
+    k-mers of 17 to 32 bp.
+
+    Args:
+        kmer_size (int): k-mer size
+        hash_bits (int): hash size in bits
+
+    Raises:
+        UnsupportedSketchError: if the sketch uses 32-bit hashes or an unsupported k-mer size
+    """
+    if hash_bits != 64:
+        raise UnsupportedSketchError('Mash sketch has {}-bit hashes; only 64-bit hashes are supported'.format(hash_bits))
+    if not MIN_64BIT_KMER_SIZE <= kmer_size <= 32:
+        raise UnsupportedSketchError('Mash sketch has k-mer size {}; only k-mer sizes of {} to 32 (64-bit hashes) are '
+                                     'supported'.format(kmer_size, MIN_64BIT_KMER_SIZE))
+
+
+def _rotl64(x, r):
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+
+def _fmix64(k):
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xff51afd7ed558ccd)
+    k ^= k >> np.uint64(33)
+    k *= np.uint64(0xc4ceb9fe1a85ec53)
+    k ^= k >> np.uint64(33)
+    return k
+
+
+def murmurhash3_x64_64(keys, seed=42):
+    """First 64 bits of the MurmurHash3_x64_128 hash of each row of equal length keys
+
+    This is the 64-bit hash Mash uses for k-mers when k > 16.
+
+    Args:
+        keys (numpy.ndarray): 2D uint8 array with one key per row
+        seed (int): hash seed
+
+    Returns:
+        numpy.ndarray: uint64 hash of each key
+    """
+    n, length = keys.shape
+    keys = np.ascontiguousarray(keys)
+    nblocks = length // 16
+    with np.errstate(over='ignore'):
+        h1 = np.full(n, seed, dtype=np.uint64)
+        h2 = np.full(n, seed, dtype=np.uint64)
+        if nblocks:
+            blocks = keys[:, :nblocks * 16].copy().view('<u8').reshape(n, nblocks, 2)
+            for i in range(nblocks):
+                k1 = blocks[:, i, 0].astype(np.uint64)
+                k2 = blocks[:, i, 1].astype(np.uint64)
+                k1 *= MURMUR_C1
+                k1 = _rotl64(k1, 31)
+                k1 *= MURMUR_C2
+                h1 ^= k1
+                h1 = _rotl64(h1, 27)
+                h1 += h2
+                h1 = h1 * np.uint64(5) + np.uint64(0x52dce729)
+                k2 *= MURMUR_C2
+                k2 = _rotl64(k2, 33)
+                k2 *= MURMUR_C1
+                h2 ^= k2
+                h2 = _rotl64(h2, 31)
+                h2 += h1
+                h2 = h2 * np.uint64(5) + np.uint64(0x38495ab5)
+        tail = keys[:, nblocks * 16:]
+        tail_length = tail.shape[1]
+        if tail_length > 8:
+            k2 = np.zeros(n, dtype=np.uint64)
+            for i in range(8, tail_length):
+                k2 ^= tail[:, i].astype(np.uint64) << np.uint64(8 * (i - 8))
+            k2 *= MURMUR_C2
+            k2 = _rotl64(k2, 33)
+            k2 *= MURMUR_C1
+            h2 ^= k2
+        if tail_length > 0:
+            k1 = np.zeros(n, dtype=np.uint64)
+            for i in range(min(tail_length, 8)):
+                k1 ^= tail[:, i].astype(np.uint64) << np.uint64(8 * i)
+            k1 *= MURMUR_C1
+            k1 = _rotl64(k1, 31)
+            k1 *= MURMUR_C2
+            h1 ^= k1
+        h1 ^= np.uint64(length)
+        h2 ^= np.uint64(length)
+        h1 += h2
+        h2 += h1
+        h1 = _fmix64(h1)
+        h2 = _fmix64(h2)
+        h1 += h2
+    return h1
+
+
+def canonical_kmers(seq, k):
+    """Canonical k-mers of a nucleotide sequence without non-ACGT characters
+
+    The canonical k-mer is the lexicographically smaller of the k-mer and its
+    reverse complement, as in Mash.
+
+    Args:
+        seq (bytes): uppercase nucleotide sequence
+        k (int): k-mer size
+
+    Returns:
+        numpy.ndarray: 2D uint8 array with one canonical k-mer per row
+    """
+    arr = np.frombuffer(seq, dtype=np.uint8)
+    if arr.size < k:
+        return np.empty((0, k), dtype=np.uint8)
+    kmers = np.lib.stride_tricks.sliding_window_view(arr, k)
+    invalid = np.lib.stride_tricks.sliding_window_view(~IS_ACGT[arr], k).any(axis=1)
+    kmers = kmers[~invalid]
+    revcomps = COMPLEMENT[kmers[:, ::-1]]
+    differs = kmers != revcomps
+    first_diff = differs.argmax(axis=1)
+    rows = np.arange(kmers.shape[0])
+    use_revcomp = differs[rows, first_diff] & (revcomps[rows, first_diff] < kmers[rows, first_diff])
+    return np.where(use_revcomp[:, None], revcomps, kmers)
+
+
+def sketch_fasta(fasta_path, kmer_size=21, sketch_size=1000, seed=42):
+    """Bottom-s MinHash sketch of all sequences in a FASTA file (Mash sketch of a genome)
+
+    Args:
+        fasta_path (str): FASTA path
+        kmer_size (int): k-mer size
+        sketch_size (int): max number of hashes in sketch
+        seed (int): hash seed
+
+    Returns:
+        numpy.ndarray: sorted unique uint64 hashes
+    """
+    from sistr.src.parsers import parse_fasta
+    sketch = np.empty(0, dtype=np.uint64)
+    for _header, seq in parse_fasta(fasta_path):
+        seq = seq.upper().encode()
+        for start in range(0, max(len(seq) - kmer_size + 1, 0), KMER_CHUNK_SIZE):
+            kmers = canonical_kmers(seq[start:start + KMER_CHUNK_SIZE + kmer_size - 1], kmer_size)
+            if kmers.shape[0] == 0:
+                continue
+            hashes = np.unique(murmurhash3_x64_64(kmers, seed))[:sketch_size]
+            sketch = np.union1d(sketch, hashes)[:sketch_size]
+    return sketch
+
+
+def mash_distance(common, denom, kmer_size):
+    """Mash distance from the number of shared hashes out of the sketch union size"""
+    jaccard = common / np.maximum(denom, 1)
+    with np.errstate(divide='ignore'):
+        dist = -np.log(2.0 * jaccard / (1.0 + jaccard)) / kmer_size
+    return np.where(common == 0, 1.0, dist)
+
+
+class ReferenceSketch:
+    """Mash reference sketch hashes loaded into memory
+
+    Attributes:
+        names (list of str): reference sketch names
+        hashes (numpy.ndarray): 2D uint64 array of sorted sketch hashes, one reference per row, padded with the max
+            uint64 value
+        sizes (numpy.ndarray): number of hashes of each reference
+        kmer_size (int): k-mer size
+        sketch_size (int): sketch size
+        seed (int): hash seed
+    """
+
+    def __init__(self, names, hashes, sizes, kmer_size, sketch_size, seed):
+        self.names = names
+        self.hashes = hashes
+        self.sizes = sizes
+        self.kmer_size = kmer_size
+        self.sketch_size = sketch_size
+        self.seed = seed
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_mash_json(cls, sketch_json):
+        """From `mash info -d` JSON dump of a sketch file
+
+        Raises:
+            UnsupportedSketchError: if the sketch hashes cannot be reproduced (see :func:`check_sketch_params`)
+        """
+        kmer_size = sketch_json['kmer']
+        check_sketch_params(kmer_size, sketch_json.get('hashBits', 64 if kmer_size >= MIN_64BIT_KMER_SIZE else 32))
+        sketches = sketch_json['sketches']
+        sketch_size = sketch_json['sketchSize']
+        hashes = np.full((len(sketches), sketch_size), np.iinfo(np.uint64).max, dtype=np.uint64)
+        sizes = np.zeros(len(sketches), dtype=np.int64)
+        for i, sketch in enumerate(sketches):
+            ref_hashes = np.sort(np.array(sketch['hashes'], dtype=np.uint64))[:sketch_size]
+            hashes[i, :ref_hashes.size] = ref_hashes
+            sizes[i] = ref_hashes.size
+        return cls([x['name'] for x in sketches],
+                   hashes,
+                   sizes,
+                   kmer_size,
+                   sketch_size,
+                   sketch_json.get('hashSeed', 42))
+
+    def save(self, path):
+        with open(path, 'wb') as fh:
+            np.savez(fh,
+                     names=np.array(self.names, dtype=str),
+                     hashes=self.hashes,
+                     sizes=self.sizes,
+                     params=np.array([self.kmer_size, self.sketch_size, self.seed], dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as npz:
+            kmer_size, sketch_size, seed = (int(x) for x in npz['params'])
+            check_sketch_params(kmer_size)
+            return cls(list(npz['names']), npz['hashes'], npz['sizes'], kmer_size, sketch_size, seed)
+
+    def distances(self, query):
+        """Mash distances of a query sketch to all reference sketches
+
+        Equivalent to `mash dist`: the Jaccard index is estimated from the
+        hashes shared within the bottom-s hashes of the union of the reference
+        and query sketches.
+
+        Args:
+            query (numpy.ndarray): sorted unique uint64 query sketch hashes
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray): distances, number of shared hashes and union sizes
+        """
+        n_query = query.size
+        common = np.zeros(len(self), dtype=np.int64)
+        for start in range(0, len(self), REFERENCE_CHUNK_SIZE):
+            hashes = self.hashes[start:start + REFERENCE_CHUNK_SIZE]
+            sizes = self.sizes[start:start + REFERENCE_CHUNK_SIZE]
+            is_valid = np.arange(self.sketch_size)[None, :] < sizes[:, None]
+            query_idx = np.searchsorted(query, hashes)
+            if n_query:
+                is_shared = is_valid & (query[np.minimum(query_idx, n_query - 1)] == hashes)
+            else:
+                is_shared = np.zeros(hashes.shape, dtype=bool)
+            # rank of each reference hash within the union of reference and query hashes
+            shared_before = np.cumsum(is_shared, axis=1) - is_shared
+            union_rank = np.arange(self.sketch_size)[None, :] + query_idx - shared_before
+            common[start:start + REFERENCE_CHUNK_SIZE] = (is_shared & (union_rank < self.sketch_size)).sum(axis=1)
+        denom = np.minimum(self.sizes + n_query - common, self.sketch_size)
+        return mash_distance(common, denom, self.kmer_size), common, denom
+
+
+def mash_json_dump(sketch_path=MASH_SKETCH_FILE):
+    p = Popen([MASH_BIN, 'info', '-d', sketch_path], stderr=PIPE, stdout=PIPE)
+    (stdout, stderr) = p.communicate()
+    if p.returncode != 0:
+        raise Exception('Could not run Mash info {}'.format(stderr))
+    return json.loads(stdout)
+
+
+@lru_cache(maxsize=None)
+def reference_sketch(sketch_path=MASH_SKETCH_FILE):
+    """Reference sketch hashes loaded once per process
+
+    The hashes are read from a NumPy cache file next to the sketch file
+    (``{sketch_path}.npz``). If the cache does not exist, it is created from
+    the `mash info -d` dump of the sketch (which requires the Mash binary
+    once).
+
+    Args:
+        sketch_path (str): Mash sketch file path
+
+    Returns:
+        ReferenceSketch: reference sketch hashes
+
+    Raises:
+        UnsupportedSketchError: if the sketch cannot be used for native Mash distances
+    """
+    cache_path = sketch_path + '.npz'
+    if os.path.exists(cache_path):
+        return ReferenceSketch.load(cache_path)
+    logging.info('Creating Mash reference sketch cache %s from %s', cache_path, sketch_path)
+    sketch = ReferenceSketch.from_mash_json(mash_json_dump(sketch_path))
+    try:
+        sketch.save(cache_path)
+    except OSError as ex:
+        logging.warning('Could not write Mash reference sketch cache %s: %s', cache_path, ex)
+    return sketch
+
+
+def native_mash_dist(fasta_path, ref_sketch=None):
+    """Mash distances of a genome FASTA to the reference sketch DB computed in-process
+
+    Args:
+        fasta_path (str): genome FASTA path
+        ref_sketch (ReferenceSketch): reference sketch; :func:`reference_sketch` by default
+
+    Returns:
+        bytes: `mash dist` format output (reference, query, distance, p-value, shared/union hashes); p-values are
+            not computed and are output as 0
+    """
+    if ref_sketch is None:
+        ref_sketch = reference_sketch()
+    query = sketch_fasta(fasta_path, ref_sketch.kmer_size, ref_sketch.sketch_size, ref_sketch.seed)
+    dists, common, denom = ref_sketch.distances(query)
+    return ''.join('{}\t{}\t{:g}\t0\t{}/{}\n'.format(name, fasta_path, d, c, n)
+                   for name, d, c, n in zip(ref_sketch.names, dists, common, denom)).encode()
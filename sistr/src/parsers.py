@@ -1,3 +1,11 @@
+import gzip
+import hashlib
+import mmap
+import os
+import re
+import stat
+import sys
+
 # TODO: check format of file? guess format maybe; use BioPython to parse variety of formats?
 
 #: set: valid IUPAC nucleotide characters for checking FASTA format
@@ -18,11 +26,187 @@ VALID_NUCLEOTIDES = {'A', 'a',
                      'N', 'n',
                      'X', 'x', } # X for masked nucleotides
 
+#: bytes: `VALID_NUCLEOTIDES` as bytes for deleting valid characters with `bytes.translate`
+VALID_NUCLEOTIDE_BYTES = ''.join(sorted(VALID_NUCLEOTIDES)).encode()
+
+
+#: int: bytes of FASTA read at a time by `parse_fasta`
+FASTA_CHUNK_SIZE = 1 << 20
+
+#: bytes: gzip file magic number
+GZIP_MAGIC = b'\x1f\x8b'
+
+#: tuple: whitespace other than spaces and newlines that is stripped from the ends of lines in text mode
+_RARE_WHITESPACE = (b'\t', b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e', b'\x1f')
+
+
+def _has_rare_chars(data):
+    """Does `data` contain whitespace other than spaces and newlines or non-ASCII bytes?"""
+    return not data.isascii() or any(c in data for c in _RARE_WHITESPACE)
+
+
+class _HashingReader:
+    """Binary file reader updating a hash object with every byte read through it"""
+
+    def __init__(self, fh, sha):
+        self.fh = fh
+        self.sha = sha
+
+    def read(self, size=-1):
+        data = self.fh.read(size)
+        self.sha.update(data)
+        return data
+
+
+def _is_plain_file(filepath):
+    """Is `filepath` a regular file that is not gzip compressed?"""
+    if filepath == '-' or not stat.S_ISREG(os.stat(filepath).st_mode):
+        return False
+    with open(filepath, 'rb') as fh:
+        return fh.read(2) != GZIP_MAGIC
+
+
+def _fasta_blocks(filepath, chunk_size=FASTA_CHUNK_SIZE, sha=None):
+    """Blocks of complete FASTA lines of about `chunk_size` bytes, split before a header line where possible
+
+    Plain files are memory mapped. Gzip compressed files (detected by their
+    magic number), standard input (`filepath` "-") and other non-regular files
+    such as pipes are read `chunk_size` bytes at a time. If `sha` (a hashlib
+    hash object) is given, it is updated with the raw (still compressed) file
+    bytes as they are read, giving the :func:`file_sha256` digest once all
+    blocks are consumed.
+    """
+    if filepath == '-':
+        fh = sys.stdin.buffer
+        is_gzip = fh.peek(2)[:2] == GZIP_MAGIC
+        if sha is not None:
+            fh = _HashingReader(fh, sha)
+        if is_gzip:
+            with gzip.GzipFile(fileobj=fh) as gz:
+                yield from _stream_fasta_blocks(gz, chunk_size)
+        else:
+            yield from _stream_fasta_blocks(fh, chunk_size)
+        return
+    with open(filepath, 'rb') as fh:
+        st = os.fstat(fh.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            is_gzip = fh.peek(2)[:2] == GZIP_MAGIC
+            reader = fh if sha is None else _HashingReader(fh, sha)
+            if is_gzip:
+                with gzip.GzipFile(fileobj=reader) as gz:
+                    yield from _stream_fasta_blocks(gz, chunk_size)
+            else:
+                yield from _stream_fasta_blocks(reader, chunk_size)
+            return
+        is_gzip = fh.read(2) == GZIP_MAGIC
+        fh.seek(0)
+        if is_gzip:
+            reader = fh if sha is None else _HashingReader(fh, sha)
+            with gzip.GzipFile(fileobj=reader) as gz:
+                yield from _stream_fasta_blocks(gz, chunk_size)
+            return
+        size = st.st_size
+        if size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = start + chunk_size
+                if end >= size:
+                    end = size
+                else:
+                    cut = mm.rfind(b'\n>', start, end)
+                    if cut < 0:
+                        cut = mm.find(b'\n>', end - 1)
+                    end = size if cut < 0 else cut + 1
+                block = mm[start:end]
+                if sha is not None:
+                    sha.update(block)
+                yield block
+                start = end
+
 
-def parse_fasta(filepath):
+def _stream_fasta_blocks(fh, chunk_size=FASTA_CHUNK_SIZE):
+    """Blocks of complete FASTA lines read from a binary stream `chunk_size` bytes at a time"""
+    pending = []
+    for chunk in iter(lambda: fh.read(chunk_size), b''):
+        cut = chunk.rfind(b'\n>')
+        if cut >= 0:
+            pending.append(chunk[:cut + 1])
+            yield b''.join(pending)
+            pending = [chunk[cut + 1:]]
+        elif pending and chunk[:1] == b'>' and pending[-1][-1:] == b'\n':
+            yield b''.join(pending)
+            pending = [chunk]
+        else:
+            pending.append(chunk)
+    if pending:
+        yield b''.join(pending)
+
+
+def _line_records(lines):
+    """(header, sequence) pieces of FASTA text lines parsed line by line"""
+    for line in lines:
+        line = line.strip()
+        if line == '':
+            continue
+        if line[0] == '>':
+            yield line.replace('>', ''), ''
+        else:
+            yield None, line
+
+
+def _block_records(block):
+    """(header or None, sequence) pieces of a block of complete FASTA lines in file order
+
+    Records are located by searching for ">" at the start of lines and the
+    sequence of each record is joined by removing its newlines. Records whose
+    sequence lines contain characters requiring the line-by-line rules
+    (stripping whitespace from the ends of lines, whitespace before a ">"
+    header) are parsed line by line.
+    """
+    if b'\r' in block:
+        # universal newlines as in text mode
+        block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    check_rare = _has_rare_chars(block)
+    starts = []
+    pos = 0 if block[:1] == b'>' else block.find(b'\n>')
+    while pos >= 0:
+        if block[pos:pos + 1] == b'\n':
+            pos += 1
+        starts.append(pos)
+        pos = block.find(b'\n>', pos)
+    if not starts or starts[0] > 0:
+        # sequence lines before the first header
+        starts.insert(0, None)
+    starts.append(len(block))
+    for start, end in zip(starts, starts[1:]):
+        if start is None:
+            header = None
+            seq = block[:end]
+        else:
+            nl = block.find(b'\n', start, end)
+            if nl < 0:
+                nl = end
+            header = block[start:nl].decode().strip().replace('>', '')
+            seq = block[nl + 1:end]
+        if b' ' in seq or (check_rare and _has_rare_chars(seq)):
+            if header is not None:
+                yield header, ''
+            yield from _line_records(seq.decode().splitlines())
+        else:
+            yield header, seq.replace(b'\n', b'').decode()
+
+
+def parse_fasta(filepath, chunk_size=FASTA_CHUNK_SIZE, sha=None):
     '''
     Parse a fasta file returning a generator yielding tuples of fasta headers to sequences.
 
+    The file is read in large binary blocks (memory mapped, or decompressed if
+    gzip compressed) and each block is split into records with bytes operations
+    instead of line by line, giving the same results as parsing the file line
+    by line in text mode.
+
     Note:
         This function should give equivalent results to SeqIO from BioPython
 
@@ -37,11 +221,41 @@ def parse_fasta(filepath):
             assert hseqs == hseqs_bio
 
     Args:
-        filepath (str): Fasta file path
+        filepath (str): Fasta file path (optionally gzip compressed) or "-" for standard input
+        chunk_size (int): approximate number of bytes parsed at a time
+        sha (hashlib hash object): updated with the raw file bytes as they are read, so that the file's
+            :func:`file_sha256` digest is available without reading it again once parsing finishes
 
     Returns:
         generator: yields tuples of (<fasta header>, <fasta sequence>)
     '''
+    seqs = []
+    header = ''
+    for block in _fasta_blocks(filepath, chunk_size, sha=sha):
+        for h, seq in _block_records(block):
+            if h is not None and header != '':
+                yield header, ''.join(seqs)
+                seqs = []
+                header = h
+            elif h is not None:
+                header = h
+            if seq:
+                seqs.append(seq)
+    yield header, ''.join(seqs)
+
+
+def parse_fasta_lines(filepath):
+    """Parse a fasta file line by line in text mode
+
+    Reference implementation of :func:`parse_fasta` (which yields the same
+    tuples) for testing and benchmarking.
+
+    Args:
+        filepath (str): Fasta file path
+
+    Returns:
+        generator: yields tuples of (<fasta header>, <fasta sequence>)
+    """
     with open(filepath, 'r') as f:
         seqs = []
         header = ''
@@ -61,6 +275,115 @@ def parse_fasta(filepath):
         yield header, ''.join(seqs)
 
 
+class FastaFormatError(Exception):
+    """Invalid FASTA format"""
+    pass
+
+
+def _check_fasta_lines(lines, line_number, has_header):
+    """Check FASTA text lines one at a time (see :func:`fasta_content_summary`)
+
+    Args:
+        lines (list of str): FASTA lines
+        line_number (int): line number of the first line
+        has_header (bool): has a header line been seen before these lines?
+
+    Returns:
+        (int, int): number of header lines and sequence characters
+
+    Raises:
+        FastaFormatError: Sequence line before the first header or with non-nucleotide characters
+    """
+    header_count = 0
+    nt_count = 0
+    for i, l in enumerate(lines, line_number):
+        l = l.strip()
+        if l == '':
+            continue
+        if l[0] == '>':
+            header_count += 1
+            continue
+        if not has_header and header_count == 0:
+            raise FastaFormatError('First non-blank line (L:{}) does not contain FASTA header. '
+                                   'Line beginning with ">" expected.'.format(i))
+        non_nucleotide_chars_in_line = set(l) - VALID_NUCLEOTIDES
+        if len(non_nucleotide_chars_in_line) > 0:
+            raise FastaFormatError('Line {} contains the following non-nucleotide characters: {}'.format(
+                i, ', '.join(sorted(non_nucleotide_chars_in_line))))
+        nt_count += len(l)
+    return header_count, nt_count
+
+
+def fasta_content_summary(fasta_path, chunk_size=FASTA_CHUNK_SIZE):
+    """Validate a FASTA file and summarize its content in a single pass
+
+    The file is read in binary blocks as in :func:`parse_fasta`. Header lines
+    are located with bytes searches and the sequence lines of each block are
+    checked at once by deleting newlines and valid IUPAC nucleotide characters
+    with `bytes.translate`; anything left over (e.g. invalid characters or
+    whitespace within lines) is checked line by line to report the offending
+    line.
+
+    Two digests are computed in the same pass. "sha256" is the digest of the
+    decompressed content, so that the same genome is recognized whether or not
+    it is compressed. "file_sha256" is the digest of the file as stored (same
+    as :func:`file_sha256`), which is the digest genomes are keyed by in the
+    result cache, Mash sketch cache, results DB and search artifacts since
+    analysis workers compute it from the bytes they read. Both are the same
+    for uncompressed files.
+
+    Args:
+        fasta_path (str): FASTA path (optionally gzip compressed)
+        chunk_size (int): approximate number of bytes checked at a time
+
+    Returns:
+        dict: "sha256" (SHA-256 hex digest of the decompressed FASTA content), "file_sha256" (SHA-256 hex digest
+            of the file), "contigs" (number of header lines) and "genome_size" (number of sequence characters)
+
+    Raises:
+        FastaFormatError: Sequence before the first header, non-nucleotide characters or no sequence
+    """
+    sha = hashlib.sha256()
+    # raw file bytes only differ from the content of compressed or streamed files
+    file_sha = None if _is_plain_file(fasta_path) else hashlib.sha256()
+    header_count = 0
+    nt_count = 0
+    line_number = 1
+    for block in _fasta_blocks(fasta_path, chunk_size, sha=file_sha):
+        sha.update(block)
+        if b'\r' in block:
+            block = block.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+        starts = []
+        pos = 0 if block[:1] == b'>' else block.find(b'\n>')
+        while pos >= 0:
+            if block[pos:pos + 1] == b'\n':
+                pos += 1
+            starts.append(pos)
+            pos = block.find(b'\n>', pos)
+        # sequence lines before the first header of the block continue the previous record
+        pieces = [block[:starts[0]] if starts else block]
+        for start, end in zip(starts, starts[1:] + [len(block)]):
+            nl = block.find(b'\n', start, end)
+            if nl >= 0:
+                pieces.append(block[nl + 1:end])
+        seq = b''.join(pieces).translate(None, b'\n')
+        if (header_count == 0 and pieces[0].strip()) or seq.translate(None, VALID_NUCLEOTIDE_BYTES):
+            n_headers, n_nts = _check_fasta_lines(block.decode(errors='replace').split('\n'),
+                                                  line_number,
+                                                  header_count > 0)
+        else:
+            n_headers, n_nts = len(starts), len(seq)
+        header_count += n_headers
+        nt_count += n_nts
+        line_number += block.count(b'\n')
+    if nt_count == 0:
+        raise FastaFormatError('File "{}" does not contain any nucleotide sequence.'.format(fasta_path))
+    return {'sha256': sha.hexdigest(),
+            'file_sha256': sha.hexdigest() if file_sha is None else file_sha.hexdigest(),
+            'contigs': header_count,
+            'genome_size': nt_count, }
+
+
 def fasta_format_check(fasta_path, logger):
     """
     Check that a file is valid FASTA format.
@@ -69,42 +392,36 @@ def fasta_format_check(fasta_path, logger):
      - Sequence can only contain valid IUPAC nucleotide characters
 
     Args:
-        fasta_str (str): FASTA file contents string
+        fasta_path (str): FASTA file path (optionally gzip compressed)
+        logger (logging.Logger): logger
+
+    Returns:
+        dict: FASTA content summary (see :func:`fasta_content_summary`)
 
     Raises:
-        Exception: If invalid FASTA format
+        FastaFormatError: If invalid FASTA format
     """
+    try:
+        summary = fasta_content_summary(fasta_path)
+    except FastaFormatError as e:
+        logger.error(str(e))
+        raise
+    logger.info('Valid FASTA format "{}" ({} bp)'.format(fasta_path, summary['genome_size']))
+    return summary
 
-    header_count = 0
-    line_count = 1
-    nt_count = 0
-    with open(fasta_path) as f:
-        for l in f:
-            l = l.strip()
-            if l == '':
-                continue
-            if l[0] == '>':
-                header_count += 1
-                continue
-            if header_count == 0 and l[0] != '>':
-                error_msg = 'First non-blank line (L:{line_count}) does not contain FASTA header. Line beginning with ">" expected.' \
-                    .format(line_count=line_count)
-                logger.error(error_msg)
-                raise Exception(error_msg)
-            non_nucleotide_chars_in_line = set(l) - VALID_NUCLEOTIDES
-
-            if len(non_nucleotide_chars_in_line) > 0:
-                error_msg = 'Line {line} contains the following non-nucleotide characters: {non_nt_chars}' \
-                    .format(line=line_count,
-                            non_nt_chars=', '.join([x for x in non_nucleotide_chars_in_line]))
-                logger.error(error_msg)
-                raise Exception(error_msg)
-            nt_count += len(l)
-            line_count += 1
-
-        if nt_count == 0:
-            error_msg = 'File "{}" does not contain any nucleotide sequence.'.format(fasta_path)
-            logger.error(error_msg)
-            raise Exception(error_msg)
-
-        logger.info('Valid FASTA format "{}" ({} bp)'.format(fasta_path, nt_count))
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's contents
+
+    Args:
+        path (str): file path
+        chunk_size (int): bytes read at a time
+
+    Returns:
+        str: SHA-256 hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
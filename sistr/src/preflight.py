@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import zlib
+
+from sistr.src.parsers import FastaFormatError, fasta_content_summary
+
+
+def check_input(fasta_path, genome_name):
+    """Pre-flight check of an input genome FASTA
+
+    Args:
+        fasta_path (str): genome FASTA path
+        genome_name (str): genome name
+
+    Returns:
+        dict: manifest entry with "genome", "fasta_path", "file_size" (bytes), "genome_size" (bp), "contigs",
+            "sha256" (of the decompressed FASTA content), "file_sha256" (of the file, see
+            :func:`sistr.src.parsers.fasta_content_summary`), "valid" and "error" (None if valid)
+    """
+    entry = {'genome': genome_name,
+             'fasta_path': os.path.abspath(fasta_path),
+             'file_size': None,
+             'genome_size': None,
+             'contigs': None,
+             'sha256': None,
+             'file_sha256': None,
+             'valid': False,
+             'error': None, }
+    try:
+        entry['file_size'] = os.path.getsize(fasta_path)
+        entry.update(fasta_content_summary(fasta_path))
+        entry['valid'] = True
+    except (OSError, EOFError, zlib.error, FastaFormatError) as e:
+        # truncated or corrupt gzip files raise EOFError or zlib.error
+        entry['error'] = str(e) or type(e).__name__
+    return entry
+
+
+def check_input_star(args):
+    """:func:`check_input` taking a single tuple of arguments for use with ``Pool.imap``"""
+    return check_input(*args)
+
+
+def preflight_check(input_fastas, genome_names, threads=1):
+    """Check all input genome FASTA files in parallel before any analysis is scheduled
+
+    Each input is checked for FASTA validity (header before any sequence,
+    only IUPAC nucleotide characters, some sequence) and summarized (file
+    size, genome size, number of contigs and content hash). Inputs with the
+    same content as an earlier input are marked with the name of that genome
+    in "duplicate_of".
+
+    Args:
+        input_fastas (list of str): genome FASTA paths
+        genome_names (list of str): genome names
+        threads (int): number of parallel processes
+
+    Returns:
+        list of dict: manifest entry of each input in input order (see :func:`check_input`)
+    """
+    inputs = list(zip(input_fastas, genome_names))
+    if threads > 1 and len(inputs) > 1:
+        from multiprocessing import Pool
+        with Pool(processes=min(threads, len(inputs))) as pool:
+            manifest = pool.map(check_input_star, inputs, chunksize=1)
+    else:
+        manifest = [check_input(*x) for x in inputs]
+    first_genome = {}
+    for entry in manifest:
+        entry['duplicate_of'] = None
+        if not entry['valid']:
+            logging.error('%s | Invalid input "%s": %s', entry['genome'], entry['fasta_path'], entry['error'])
+            continue
+        sha = entry['sha256']
+        if sha in first_genome:
+            entry['duplicate_of'] = first_genome[sha]
+            logging.warning('%s | Input "%s" has the same content as genome "%s"',
+                            entry['genome'], entry['fasta_path'], first_genome[sha])
+        else:
+            first_genome[sha] = entry['genome']
+    n_valid = sum(1 for x in manifest if x['valid'])
+    logging.info('Pre-flight check: %s of %s inputs valid (%s bp total)',
+                 n_valid, len(manifest), sum(x['genome_size'] for x in manifest if x['valid']))
+    return manifest
+
+
+def write_manifest(manifest, path):
+    """Write a pre-flight input manifest to a JSON file
+
+    Args:
+        manifest (list of dict): manifest entries (see :func:`preflight_check`)
+        path (str): output JSON path
+    """
+    with open(path, 'w') as fh:
+        json.dump(manifest, fh, indent=2)
+    logging.info('Wrote input manifest of %s genomes to %s', len(manifest), path)
@@ -4,16 +4,33 @@ from sistr.src.qc.constants import ERR_MISSING_CGMLST_MARKERS, WARN_MISSING_CGML
 from sistr.src.serovar_prediction import CGMLST_DISTANCE_THRESHOLD
 
 
-def qc(fasta_path, cgmlst_results, prediction):
+def qc(fasta_path, cgmlst_results, prediction, genome_size=None, genome=None):
+    """Basic QC of a genome's serovar prediction
+
+    Args:
+        fasta_path (str): genome FASTA path
+        cgmlst_results (dict): cgMLST330 marker to allele results or None if cgMLST was not run
+        prediction (sistr.src.serovar_prediction.SerovarPrediction): serovar prediction
+        genome_size (int): genome size if known; computed from `fasta_path` if None. The genome size is
+            not checked if `fasta_path`, `genome_size` and `genome` are all None.
+        genome (sistr.src.genome.Genome): loaded genome; its precomputed size is used instead of reading `fasta_path`
+
+    Returns:
+        (str, list of str): QC status ("PASS", "WARNING" or "FAIL") and QC messages
+    """
     qc_status = 'PASS'
     qc_msgs = []
-    genome_size = sum([len(s) for h, s in parse_fasta(fasta_path)])
-    lb_salm_gsize, ub_salm_gsize = SALMONELLA_GENOME_SIZE_MBP
-    is_gsize_acceptable = (genome_size >= lb_salm_gsize and genome_size <= ub_salm_gsize)
-    logging.info('Genome size=%s (within gsize thresholds? %s)', genome_size, is_gsize_acceptable)
-    if not is_gsize_acceptable:
-        qc_status = 'WARNING'
-        qc_msgs.append('WARNING: Input genome size ({} bp) not within expected range of {}-{} (bp) for Salmonella'.format(genome_size, lb_salm_gsize, ub_salm_gsize))
+    if genome_size is None and genome is not None:
+        genome_size = genome.size
+    if genome_size is None and fasta_path is not None:
+        genome_size = sum([len(s) for h, s in parse_fasta(fasta_path)])
+    if genome_size is not None:
+        lb_salm_gsize, ub_salm_gsize = SALMONELLA_GENOME_SIZE_MBP
+        is_gsize_acceptable = (genome_size >= lb_salm_gsize and genome_size <= ub_salm_gsize)
+        logging.info('Genome size=%s (within gsize thresholds? %s)', genome_size, is_gsize_acceptable)
+        if not is_gsize_acceptable:
+            qc_status = 'WARNING'
+            qc_msgs.append('WARNING: Input genome size ({} bp) not within expected range of {}-{} (bp) for Salmonella'.format(genome_size, lb_salm_gsize, ub_salm_gsize))
     if cgmlst_results is not None:
         if len(cgmlst_results) == 0:
             missing_cgmlst_count = 330
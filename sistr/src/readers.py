@@ -0,0 +1,167 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from sistr.src.writers import ALLELE_BLAST_RESULT_DTYPES, COLUMNAR_FORMATS, TABULAR_FORMAT_DELIMITERS, \
+    _import_pyarrow
+
+
+def _format_from_path(path):
+    """Output format of a file from its extension ignoring a ".gz" suffix (e.g. "csv" for "x.csv.gz")"""
+    if path.endswith('.gz'):
+        path = path[:-3]
+    fmt = os.path.splitext(path)[1][1:].lower()
+    if fmt == 'tsv':
+        fmt = 'tab'
+    return fmt
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    return open(path)
+
+
+def _read_columnar_table(path, fmt):
+    pa = _import_pyarrow()
+    if fmt == 'parquet':
+        return pa.parquet.read_table(path)
+    with pa.ipc.open_file(path) as reader:
+        return reader.read_all()
+
+
+def read_predictions(path):
+    """Read a previous run's prediction output (see :class:`sistr.src.writers.PredictionWriter`)
+
+    The format is determined from the file extension: JSON, JSON lines,
+    CSV, tab-delimited (".tab" or ".tsv"), Parquet or Arrow. Text files may
+    be gzip compressed. Empty tabular values are read as None.
+
+    Args:
+        path (str): prediction output path
+
+    Returns:
+        list of dict: prediction output dict of each genome
+    """
+    fmt = _format_from_path(path)
+    if fmt in COLUMNAR_FORMATS:
+        return _read_columnar_table(path, fmt).to_pylist()
+    with _open_text(path) as fh:
+        if fmt == 'jsonl':
+            return [json.loads(line) for line in fh if line.strip()]
+        if fmt in TABULAR_FORMAT_DELIMITERS:
+            reader = csv.DictReader(fh, delimiter=TABULAR_FORMAT_DELIMITERS[fmt])
+            return [{k: (None if v == '' else v) for k, v in row.items()} for row in reader]
+        out = json.load(fh)
+    if isinstance(out, dict):
+        out = [out]
+    return out
+
+
+def read_cgmlst_profiles(path):
+    """Read cgMLST330 allelic profiles from a previous run's output
+
+    Reads ``--cgmlst-profiles`` output (CSV, Parquet or Arrow) or
+    ``--alleles-output`` JSON (either "json" or "compact" format, determined
+    from the file contents).
+
+    Args:
+        path (str): cgMLST330 profiles or alleles JSON path
+
+    Returns:
+        pandas.DataFrame: allelic profiles indexed by genome with a column per marker (missing alleles are NaN)
+    """
+    fmt = _format_from_path(path)
+    if fmt in COLUMNAR_FORMATS:
+        df = _read_columnar_table(path, fmt).to_pandas().set_index('genome')
+    elif fmt == 'json':
+        with _open_text(path) as fh:
+            alleles = json.load(fh)
+        if 'genomes' in alleles and 'alleles' in alleles:
+            # compact format: genome to marker to allele name
+            profiles = alleles['genomes']
+        else:
+            profiles = {genome: {marker: res['name'] for marker, res in results.items()}
+                        for genome, results in alleles.items()}
+        df = pd.DataFrame.from_dict(profiles, orient='index', dtype=np.float64)
+    else:
+        df = pd.read_csv(path, index_col=0, dtype={0: str})
+    df.index = df.index.astype(str)
+    logging.info('Read %s cgMLST330 allelic profiles with %s markers from %s', df.shape[0], df.shape[1], path)
+    return df.astype(np.float64)
+
+
+def _parse_side_table_value(value, dtype):
+    if value == '':
+        return None
+    if dtype is np.bool_:
+        return value == 'True'
+    if dtype is np.int64:
+        return int(value)
+    if dtype is np.float64:
+        return float(value)
+    return value
+
+
+def read_compact_alleles_side_table(path):
+    """Read the allele BLAST results side table of compact allele results JSON
+
+    See :class:`sistr.src.writers.CompactAllelesWriter`. The side table is
+    looked up next to the JSON as Parquet or gzipped tab-delimited file.
+
+    Args:
+        path (str): compact allele results JSON path
+
+    Returns:
+        dict: (genome, marker) to allele BLAST result dict; empty if no side table is found
+    """
+    base = re.sub(r'(\.json)?(\.gz)?$', '', path)
+    rows = None
+    if os.path.exists(base + '.blast.parquet'):
+        rows = _read_columnar_table(base + '.blast.parquet', 'parquet').to_pylist()
+    elif os.path.exists(base + '.blast.tsv.gz'):
+        with gzip.open(base + '.blast.tsv.gz', 'rt') as fh:
+            rows = [{k: (v if k in ('genome', 'marker') else
+                         _parse_side_table_value(v, ALLELE_BLAST_RESULT_DTYPES.get(k, str)))
+                     for k, v in row.items()}
+                    for row in csv.DictReader(fh, delimiter='\t')]
+    if rows is None:
+        logging.warning('No allele BLAST results side table found for compact allele results "%s"', path)
+        return {}
+    return {(row['genome'], row['marker']): {k: row[k] for k in ALLELE_BLAST_RESULT_DTYPES if k in row}
+            for row in rows}
+
+
+def read_alleles(path):
+    """Read cgMLST330 allele results from a previous run's ``--alleles-output`` JSON
+
+    Both the "json" and "compact" formats are read (determined from the file
+    contents). Compact results are expanded to the "json" format structure
+    with the allele BLAST results from the side table (see
+    :func:`read_compact_alleles_side_table`).
+
+    Args:
+        path (str): allele results JSON path
+
+    Returns:
+        dict: genome name to marker to allele result dict ("name", "seq" and "blast_result") in file order
+    """
+    with _open_text(path) as fh:
+        alleles = json.load(fh)
+    if not ('genomes' in alleles and 'alleles' in alleles):
+        return alleles
+    blast_results = read_compact_alleles_side_table(path)
+    seqs = alleles['alleles']
+    out = {}
+    for genome, profile in alleles['genomes'].items():
+        out[genome] = {marker: {'name': name,
+                                'seq': None if name is None else seqs.get(str(name)),
+                                'blast_result': blast_results.get((genome, marker))}
+                       for marker, name in profile.items()}
+    return out
@@ -0,0 +1,155 @@
+import logging
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from sistr.src.serovar_prediction.constants import genomes_to_serovar, genomes_to_subspecies
+
+
+class GenomeCategories:
+    """Genome name to category (e.g. serovar, subspecies) lookup table
+
+    Genome names are stored as a sorted fixed-width numpy string array and
+    categories as integer codes into a list of distinct category names. Unlike
+    a dict of Python strings, these arrays are not touched by reference
+    counting, so forked worker processes can share them with the parent
+    without copying memory pages.
+    """
+
+    def __init__(self, genome_category):
+        """
+        Args:
+            genome_category (dict): genome name to category name
+        """
+        genomes = sorted(genome_category.keys())
+        self.genomes = np.array(genomes, dtype=str)
+        self.categories = sorted(set(genome_category.values()))
+        category_codes = {x: i for i, x in enumerate(self.categories)}
+        self.codes = np.array([category_codes[genome_category[g]] for g in genomes], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.genomes)
+
+    def _index(self, genome):
+        i = np.searchsorted(self.genomes, genome)
+        if i < len(self.genomes) and self.genomes[i] == genome:
+            return i
+        return None
+
+    def __contains__(self, genome):
+        return self._index(genome) is not None
+
+    def __getitem__(self, genome):
+        i = self._index(genome)
+        if i is None:
+            raise KeyError(genome)
+        return self.categories[self.codes[i]]
+
+    def get(self, genome, default=None):
+        i = self._index(genome)
+        if i is None:
+            return default
+        return self.categories[self.codes[i]]
+
+    def lookup(self, genomes, default=None):
+        """Categories for a list of genomes
+
+        Args:
+            genomes (list of str): genome names
+            default: value for genomes not in table
+
+        Returns:
+            list: category for each genome or `default` if genome not found
+        """
+        if len(genomes) == 0 or len(self.genomes) == 0:
+            return [default for _ in genomes]
+        query = np.array(genomes, dtype=str)
+        idx = np.minimum(np.searchsorted(self.genomes, query), len(self.genomes) - 1)
+        is_found = self.genomes[idx] == query
+        return [self.categories[code] if found else default for code, found in zip(self.codes[idx], is_found)]
+
+
+class ReferenceData:
+    """Reference genome metadata shared by all pipeline stages
+
+    Genome serovar and subspecies designations are loaded on initialization.
+    The cgMLST reference profiles are loaded on first access so that runs
+    without cgMLST analysis do not need to read them.
+
+    Use :func:`reference_data` to get the process-wide instance.
+    """
+
+    def __init__(self, genome_serovar=None, genome_subspecies=None):
+        """
+        Args:
+            genome_serovar (dict): genome to serovar designations; read from the SISTR data files by default
+            genome_subspecies (dict): genome to subspecies designations; read from the SISTR data files by default
+        """
+        if genome_serovar is None:
+            genome_serovar = genomes_to_serovar()
+        if genome_subspecies is None:
+            genome_subspecies = genomes_to_subspecies()
+        self.genome_serovar = GenomeCategories(genome_serovar)
+        self.genome_subspecies = GenomeCategories(genome_subspecies)
+        self._cgmlst_profiles = None
+        self._cgmlst_profiles_matrix = None
+        self._serovar_lists = {}
+        logging.debug('Loaded reference serovar (n=%s) and subspecies (n=%s) designations',
+                      len(self.genome_serovar),
+                      len(self.genome_subspecies))
+
+    @property
+    def cgmlst_profiles(self):
+        """pandas.DataFrame: cgMLST330 reference genome allelic profiles"""
+        if self._cgmlst_profiles is None:
+            from sistr.src.cgmlst import ref_cgmlst_profiles
+            self._cgmlst_profiles = ref_cgmlst_profiles()
+        return self._cgmlst_profiles
+
+    @property
+    def cgmlst_profiles_matrix(self):
+        """numpy.ndarray: cgMLST330 reference allelic profiles as a float64 matrix (missing alleles are NaN)"""
+        if self._cgmlst_profiles_matrix is None:
+            self._cgmlst_profiles_matrix = np.array(self.cgmlst_profiles, dtype=np.float64)
+        return self._cgmlst_profiles_matrix
+
+    def serovar_list(self, path):
+        """Serovars in a single column text file or None if the file does not exist
+
+        Args:
+            path (str): serovar list file path
+
+        Returns:
+            list of str: serovar names or None if `path` does not exist
+        """
+        if path not in self._serovar_lists:
+            if os.path.exists(path):
+                with open(path) as fp:
+                    self._serovar_lists[path] = [l.rstrip() for l in fp.readlines()]
+            else:
+                self._serovar_lists[path] = None
+        return self._serovar_lists[path]
+
+    def preload(self, cgmlst=True, serovar_list_path=None):
+        """Load reference data needed for a run up front (e.g. before forking worker processes)
+
+        Args:
+            cgmlst (bool): load cgMLST reference profiles
+            serovar_list_path (str): serovar list file to load
+        """
+        if cgmlst:
+            self.cgmlst_profiles_matrix
+        if serovar_list_path:
+            self.serovar_list(serovar_list_path)
+        return self
+
+
+@lru_cache(maxsize=None)
+def reference_data():
+    """Process-wide :class:`ReferenceData` loaded on first use
+
+    Returns:
+        ReferenceData: reference genome metadata
+    """
+    return ReferenceData()
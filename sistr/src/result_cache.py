@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+
+from pkg_resources import resource_filename
+
+from sistr.version import __version__
+
+#: str: file extension of cached results
+CACHE_FILE_EXT = '.pickle'
+
+SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(size):
+    """Parse a size in bytes with an optional K, M, G or T suffix (e.g. "500M")
+
+    Args:
+        size (str): size string
+
+    Returns:
+        int: size in bytes or None if `size` is None
+    """
+    if size is None:
+        return None
+    m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$', str(size), flags=re.IGNORECASE)
+    if m is None:
+        raise ValueError('Invalid size "{}". Expected a number of bytes with an optional K, M, G or T suffix'.format(size))
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+
+def db_version():
+    """Installed SISTR DB version string (contents of "dbstatus.txt") or None if not found"""
+    path = resource_filename('sistr', 'dbstatus.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return fh.read().strip()
+
+
+class ResultCache:
+    """On-disk cache of per-genome SISTR results keyed by input content and analysis options
+
+    Results are stored as pickled ``(prediction, cgmlst_results)`` tuples named
+    by a SHA-256 key of the genome FASTA content hash, the SISTR version, the
+    installed DB version and the result-affecting analysis options (see
+    :meth:`key`). The same assembly under a different file name or genome name
+    is therefore a cache hit.
+
+    When `max_size` is set, least recently used results (by file modification
+    time, which is updated on each hit) are evicted once the total size of
+    cached results exceeds it.
+
+    Args:
+        cache_dir (str): cache directory; created if it does not exist
+        max_size (int): max total size of cached results in bytes; unlimited if None
+    """
+
+    def __init__(self, cache_dir, max_size=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_version = db_version()
+        self.hits = 0
+        self.misses = 0
+        self._size = sum(size for _path, size, _mtime in self._entries())
+
+    def _entries(self):
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_FILE_EXT) and entry.is_file():
+                stat = entry.stat()
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + CACHE_FILE_EXT)
+
+    def key(self, fasta_sha256, options):
+        """Cache key for a genome FASTA and analysis options
+
+        Args:
+            fasta_sha256 (str): SHA-256 of the genome FASTA content
+            options (dict): result-affecting analysis options (JSON serializable)
+
+        Returns:
+            str: SHA-256 hex digest cache key
+        """
+        key_data = {'fasta_sha256': fasta_sha256,
+                    'sistr_version': __version__,
+                    'db_version': self.db_version,
+                    'options': options}
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Cached results for a key or None if not cached
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            tuple: ``(prediction, cgmlst_results)`` or None
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fh:
+                result = pickle.load(fh)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as ex:
+            logging.warning('Could not read cached result %s: %s', path, ex)
+            self.misses += 1
+            return None
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        """Cache results for a key
+
+        Args:
+            key (str): cache key
+            result (tuple): ``(prediction, cgmlst_results)``
+        """
+        path = self._path(key)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump(result, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._size += os.path.getsize(path)
+        if self.max_size is not None and self._size > self.max_size:
+            self.evict(self.max_size)
+
+    def evict(self, max_size):
+        """Remove least recently used results until the cache is no larger than `max_size` bytes
+
+        Args:
+            max_size (int): max total size of cached results in bytes
+
+        Returns:
+            int: number of cached results removed
+        """
+        entries = sorted(self._entries(), key=lambda x: x[2])
+        total = sum(size for _path, size, _mtime in entries)
+        n_removed = 0
+        for path, size, _mtime in entries:
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            n_removed += 1
+        self._size = total
+        if n_removed:
+            logging.info('Evicted %s least recently used results from cache %s', n_removed, self.cache_dir)
+        return n_removed
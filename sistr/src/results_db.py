@@ -0,0 +1,137 @@
+import json
+import logging
+import sqlite3
+from datetime import datetime
+
+from sistr.version import __version__
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    sistr_version TEXT,
+    started TEXT,
+    args TEXT
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER REFERENCES runs(id),
+    genome TEXT,
+    fasta_filepath TEXT,
+    input_sha256 TEXT,
+    serovar TEXT,
+    serovar_antigen TEXT,
+    serovar_cgmlst TEXT,
+    cgmlst330_ST INTEGER,
+    cgmlst_subspecies TEXT,
+    cgmlst_matching_alleles INTEGER,
+    qc_status TEXT,
+    qc_messages TEXT,
+    prediction TEXT
+);
+CREATE INDEX IF NOT EXISTS predictions_genome ON predictions (genome);
+CREATE INDEX IF NOT EXISTS predictions_serovar ON predictions (serovar);
+CREATE INDEX IF NOT EXISTS predictions_cgmlst330_ST ON predictions (cgmlst330_ST);
+CREATE INDEX IF NOT EXISTS predictions_input_sha256 ON predictions (input_sha256);
+CREATE TABLE IF NOT EXISTS cgmlst_alleles (
+    prediction_id INTEGER REFERENCES predictions(id),
+    marker TEXT,
+    allele INTEGER,
+    PRIMARY KEY (prediction_id, marker)
+) WITHOUT ROWID;
+'''
+
+#: int: number of genomes written per database transaction
+COMMIT_BATCH_SIZE = 100
+
+
+class ResultsDatabase:
+    """SQLite database of SISTR results accumulated across runs
+
+    Each run adds a row to the ``runs`` table and each genome a row to the
+    ``predictions`` table (with the full JSON prediction output) along with
+    its cgMLST330 allele calls in the ``cgmlst_alleles`` table. Predictions
+    are indexed by genome name, serovar, cgMLST330 sequence type and the
+    SHA-256 of the input FASTA, which is taken from the prediction (see
+    `SerovarPrediction.input_sha256`; NULL if unknown) rather than re-read
+    from the FASTA path.
+
+    Genomes are written in batched transactions of `batch_size` genomes. The
+    database uses write-ahead logging so that it can be queried while being
+    written and so that concurrent SISTR runs can write to the same database.
+
+    Args:
+        path (str): SQLite database path; created if it does not exist
+        args (argparse.Namespace): sistr_cmd arguments recorded for the run
+        more_results (int): output verbosity level of stored JSON predictions
+        batch_size (int): genomes per transaction
+    """
+
+    def __init__(self, path, args=None, more_results=0, batch_size=COMMIT_BATCH_SIZE):
+        self.path = path
+        self.more_results = more_results
+        self.batch_size = batch_size
+        self.count = 0
+        self._uncommitted = 0
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        cursor = self.conn.execute('INSERT INTO runs (sistr_version, started, args) VALUES (?, ?, ?)',
+                                   (__version__,
+                                    datetime.now().isoformat(),
+                                    json.dumps(vars(args), default=str) if args is not None else None))
+        self.run_id = cursor.lastrowid
+        self.conn.commit()
+        logging.info('Writing results to SQLite database "%s" (run id=%s)', path, self.run_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, prediction, cgmlst_results=None):
+        """Add a genome's prediction and cgMLST330 allele calls
+
+        Args:
+            prediction (sistr.src.serovar_prediction.SerovarPrediction): serovar prediction
+            cgmlst_results (dict): cgMLST330 marker to allele results
+        """
+        from sistr.src.writers import prediction_to_output_dict
+        out = prediction_to_output_dict(prediction, self.more_results)
+        fasta_filepath = out.get('fasta_filepath')
+        input_sha256 = prediction.input_sha256
+        cursor = self.conn.execute('''INSERT INTO predictions (run_id, genome, fasta_filepath, input_sha256,
+                                          serovar, serovar_antigen, serovar_cgmlst, cgmlst330_ST, cgmlst_subspecies,
+                                          cgmlst_matching_alleles, qc_status, qc_messages, prediction)
+                                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                   (self.run_id,
+                                    out.get('genome'),
+                                    fasta_filepath,
+                                    input_sha256,
+                                    out.get('serovar'),
+                                    out.get('serovar_antigen'),
+                                    out.get('serovar_cgmlst'),
+                                    out.get('cgmlst_ST'),
+                                    out.get('cgmlst_subspecies'),
+                                    out.get('cgmlst_matching_alleles'),
+                                    out.get('qc_status'),
+                                    out.get('qc_messages'),
+                                    json.dumps(out)))
+        if cgmlst_results:
+            prediction_id = cursor.lastrowid
+            self.conn.executemany('INSERT INTO cgmlst_alleles (prediction_id, marker, allele) VALUES (?, ?, ?)',
+                                  ((prediction_id, marker, int(res['name']) if res['name'] is not None else None)
+                                   for marker, res in cgmlst_results.items()))
+        self.count += 1
+        self._uncommitted += 1
+        if self._uncommitted >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
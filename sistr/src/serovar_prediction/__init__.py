@@ -1,7 +1,9 @@
 import logging, re
+from collections import Counter
+from functools import lru_cache
 import pandas as pd
 
-from sistr.src.blast_wrapper import BlastReader
+from sistr.src.blast_wrapper import BlastReader, BLAST_TABLE_COLS, BLAST_TABLE_COLS_NO_SSEQ
 from sistr.src.serovar_prediction.constants import \
     FLJB_FASTA_PATH, \
     FLIC_FASTA_PATH, \
@@ -22,55 +24,236 @@ spp_name_to_roman = {'enterica': 'I',
                      'indica': 'VI'}
 
 
-class BlastResultMixin(object):
-    blast_results = None
-    top_result = None
-    is_trunc = False
-    is_missing = False
-    is_perfect_match = False
+class Record(object):
+    """Base class for slotted prediction result records
+
+    Subclasses declare their fields in `__slots__`, the default values of
+    fields in `DEFAULTS` and the output types of fields in `TYPES` (``str``,
+    ``int``, ``float``, ``bool``, a Record type for nested records or ``dict``
+    for BLAST/Mash result dicts). Fields with a default value are always
+    output; fields without one are only output once they have been set.
+    `FIELDS` lists all fields (including inherited ones) in output order and
+    `FIELD_TYPES` their types. Slots starting with an underscore hold
+    internal state and are not fields.
+    """
+    __slots__ = ()
+    DEFAULTS = {}
+    TYPES = {}
+    FIELDS = ()
+    FIELD_TYPES = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = set()
+        defaults = {}
+        types = {}
+        for klass in reversed(cls.__mro__):
+            fields.update(x for x in klass.__dict__.get('__slots__', ()) if not x.startswith('_'))
+            defaults.update(klass.__dict__.get('DEFAULTS', {}))
+            types.update(klass.__dict__.get('TYPES', {}))
+        cls.FIELDS = tuple(sorted(fields))
+        cls.FIELD_TYPES = types
+        cls._field_defaults = defaults
+
+    def __init__(self, **kwargs):
+        for field, value in self._field_defaults.items():
+            setattr(self, field, value)
+        for field, value in kwargs.items():
+            setattr(self, field, value)
+
+    def has(self, field):
+        """Has a value been set for `field`?"""
+        return hasattr(self, field)
+
+    def fields(self):
+        """Generator of (field, value) tuples of all set fields in output order"""
+        for field in self.FIELDS:
+            try:
+                yield field, getattr(self, field)
+            except AttributeError:
+                continue
+
+
+class BlastResultMixin(Record):
+    __slots__ = ('blast_results',
+                 'top_result',
+                 'is_trunc',
+                 'is_missing',
+                 'is_perfect_match')
+    DEFAULTS = {'blast_results': None,
+                'top_result': None,
+                'is_trunc': False,
+                'is_missing': False,
+                'is_perfect_match': False}
+    # blast_results: column to row to value; top_result: column to value
+    TYPES = {'blast_results': dict,
+             'top_result': dict,
+             'is_trunc': bool,
+             'is_missing': bool,
+             'is_perfect_match': bool}
 
 
 class WzxPrediction(BlastResultMixin):
-    serogroup = None
+    __slots__ = ('serogroup',)
+    DEFAULTS = {'serogroup': None}
+    TYPES = {'serogroup': str}
 
 
 class WzyPrediction(BlastResultMixin):
-    serogroup = None
-
+    __slots__ = ('serogroup',)
+    DEFAULTS = {'serogroup': None}
+    TYPES = {'serogroup': str}
 
-class SerogroupPrediction():
-    serogroup = None
 
-    wzx_prediction = None
-    wzy_prediction = None
+class SerogroupPrediction(Record):
+    __slots__ = ('serogroup',
+                 'wzx_prediction',
+                 'wzy_prediction')
+    DEFAULTS = {'serogroup': None,
+                'wzx_prediction': None,
+                'wzy_prediction': None}
+    TYPES = {'serogroup': str,
+             'wzx_prediction': WzxPrediction,
+             'wzy_prediction': WzyPrediction}
 
 
 class H1FliCPrediction(BlastResultMixin):
-    h1 = None
+    __slots__ = ('h1',)
+    DEFAULTS = {'h1': None}
+    TYPES = {'h1': str}
 
 
 class H2FljBPrediction(BlastResultMixin):
-    h2 = None
-
-
-class SerovarPrediction():
-    genome = None
-    serovar = None
-    serovar_cgmlst = None
-    cgmlst_distance = 1.0
-    cgmlst_matching_alleles = 0
-    cgmlst_found_loci = 0
-    cgmlst_genome_match = None
-    cgmlst_subspecies = None
+    __slots__ = ('h2',)
+    DEFAULTS = {'h2': None}
+    TYPES = {'h2': str}
+
+
+class SerovarPrediction(Record):
+    __slots__ = ('genome',
+                 'fasta_filepath',
+                 'serovar',
+                 'serovar_cgmlst',
+                 'cgmlst_distance',
+                 'cgmlst_matching_alleles',
+                 'cgmlst_found_loci',
+                 'cgmlst_genome_match',
+                 'cgmlst_subspecies',
+                 'cgmlst_ST',
+                 'serovar_antigen',
+                 'serogroup',
+                 'serogroup_prediction',
+                 'h1',
+                 'h1_flic_prediction',
+                 'h2',
+                 'h2_fljb_prediction',
+                 'o_antigen',
+                 'antigenic_formula',
+                 'predicted_serovar_in_list',
+                 'qc_status',
+                 'qc_messages',
+                 'mash_genome',
+                 'mash_serovar',
+                 'mash_distance',
+                 'mash_match',
+                 'mash_subspecies',
+                 'mash_top_5',
+                 '_input_sha256')
+    # fields without a default value are only output when set (e.g. Mash results with --run-mash)
+    DEFAULTS = {'genome': None,
+                'serovar': None,
+                'serovar_cgmlst': None,
+                'cgmlst_distance': 1.0,
+                'cgmlst_matching_alleles': 0,
+                'cgmlst_found_loci': 0,
+                'cgmlst_genome_match': None,
+                'cgmlst_subspecies': None,
+                'serovar_antigen': None,
+                'serogroup': None,
+                'serogroup_prediction': None,
+                'h1': None,
+                'h1_flic_prediction': None,
+                'h2': None,
+                'h2_fljb_prediction': None}
+    # mash_top_5: Mash result field to `mash dist` output row to value
+    TYPES = {'genome': str,
+             'fasta_filepath': str,
+             'serovar': str,
+             'serovar_cgmlst': str,
+             'cgmlst_distance': float,
+             'cgmlst_matching_alleles': int,
+             'cgmlst_found_loci': int,
+             'cgmlst_genome_match': str,
+             'cgmlst_subspecies': str,
+             'cgmlst_ST': int,
+             'serovar_antigen': str,
+             'serogroup': str,
+             'serogroup_prediction': SerogroupPrediction,
+             'h1': str,
+             'h1_flic_prediction': H1FliCPrediction,
+             'h2': str,
+             'h2_fljb_prediction': H2FljBPrediction,
+             'o_antigen': str,
+             'antigenic_formula': str,
+             'predicted_serovar_in_list': str,
+             'qc_status': str,
+             'qc_messages': str,
+             'mash_genome': str,
+             'mash_serovar': str,
+             'mash_distance': float,
+             'mash_match': int,
+             'mash_subspecies': str,
+             'mash_top_5': dict}
+
+    @property
+    def input_sha256(self):
+        """SHA-256 of the input genome FASTA file (not output); None if unknown (e.g. genome from a multi-genome
+        FASTA or stdin, or predictions re-made from saved outputs)"""
+        return getattr(self, '_input_sha256', None)
+
+    @input_sha256.setter
+    def input_sha256(self, value):
+        self._input_sha256 = value
+
+
+#: dict: nested prediction output field to Record type
+OUTPUT_RECORD_TYPES = {'serogroup_prediction': SerogroupPrediction,
+                       'wzx_prediction': WzxPrediction,
+                       'wzy_prediction': WzyPrediction,
+                       'h1_flic_prediction': H1FliCPrediction,
+                       'h2_fljb_prediction': H2FljBPrediction}
+
+
+def record_from_output_dict(cls, d):
+    """Record from its prediction output dict (e.g. from a previous run's JSON output)
+
+    Keys that are not fields of `cls` are ignored. Nested prediction output
+    dicts are converted to their Record types (see `OUTPUT_RECORD_TYPES`).
+    String values of numeric and boolean fields (e.g. from CSV/tab-delimited
+    output) are converted to the field types (see `Record.FIELD_TYPES`).
 
+    Args:
+        cls (type): Record type
+        d (dict): output dict
 
-    serovar_antigen = None
-    serogroup = None
-    serogroup_prediction = None
-    h1 = None
-    h1_flic_prediction = None
-    h2 = None
-    h2_fljb_prediction = None
+    Returns:
+        Record: record of type `cls`
+    """
+    kwargs = {}
+    for k, v in d.items():
+        if k not in cls.FIELDS:
+            continue
+        if isinstance(v, dict) and k in OUTPUT_RECORD_TYPES:
+            v = record_from_output_dict(OUTPUT_RECORD_TYPES[k], v)
+        elif isinstance(v, str) and cls.FIELD_TYPES.get(k) is bool:
+            v = v == 'True'
+        elif isinstance(v, str) and cls.FIELD_TYPES.get(k) is int:
+            # integers may have been written as floats (e.g. "330.0") by pandas
+            v = int(float(v))
+        elif isinstance(v, str) and cls.FIELD_TYPES.get(k) is float:
+            v = float(v)
+        kwargs[k] = v
+    return cls(**kwargs)
 
 
 def get_antigen_name(qseqid):
@@ -96,14 +279,215 @@ def serovar_table():
     return pd.read_csv(SEROVAR_TABLE_PATH)
 
 
+def _similarity_group_index(similarity_groups):
+    """Map each antigen to the first similarity group that contains it.
+
+    Args:
+        similarity_groups (list of list of str): antigen similarity groups
+
+    Returns:
+        dict: antigen name to similarity group (list of str)
+    """
+    rtn = {}
+    for group in similarity_groups:
+        for antigen in group:
+            if antigen not in rtn:
+                rtn[antigen] = group
+    return rtn
+
+
+def _missing_to_none(x):
+    if x is None or (isinstance(x, float) and x != x):
+        return None
+    return x
+
+
+class SerovarResolver:
+    """Antigenic formula to serovar lookups compiled from the WHO 2007 serovar table
+
+    The serovar table is read once and indexed by subspecies, serogroup, H1
+    and H2 antigen so that serovar lookups are set intersections rather than
+    DataFrame scans. Antigen similarity group expansions are precomputed and
+    serovar predictions are memoized per antigen tuple.
+
+    Use :func:`serovar_resolver` to get the process-wide instance.
+    """
+
+    def __init__(self, df):
+        serovars = list(df['Serovar'])
+        self.serovars = serovars
+        self.unique_serogroups = list(df['Serogroup'].unique())
+        self.unique_h1 = list(df['H1'].unique())
+
+        self.rows_by_serogroup = self._index_rows(df['Serogroup'])
+        self.rows_by_h1 = self._index_rows(df['H1'])
+        self.rows_by_h2 = self._index_rows(df['H2'])
+        self.rows_by_subspecies = self._index_rows(df['subspecies'])
+        self.rows_h2_can_be_missing = frozenset(i for i, x in enumerate(df['can_h2_be_missing']) if x)
+
+        self.serogroup_similarity = _similarity_group_index(SEROGROUP_SIMILARITY_GROUPS)
+        self.h1_similarity = _similarity_group_index(H1_FLIC_SIMILARITY_GROUPS)
+        self.h2_similarity = _similarity_group_index(H2_FLJB_SIMILARITY_GROUPS)
+        self.h2_groups_by_antigen = {}
+        for i, group in enumerate(H2_FLJB_SIMILARITY_GROUPS):
+            for antigen in group:
+                self.h2_groups_by_antigen.setdefault(antigen, set()).add(i)
+
+        self.serovar_antigens = {}
+        o_antigens_by_serovar = {}
+        for serovar, spp, sg, h1, h2, o_antigen in zip(serovars,
+                                                       df['subspecies'],
+                                                       df['Serogroup'],
+                                                       df['H1'],
+                                                       df['H2'],
+                                                       df['O_antigen']):
+            if serovar not in self.serovar_antigens:
+                self.serovar_antigens[serovar] = {'spp': spp, 'sg': sg, 'h1': h1, 'h2': h2}
+            o_antigens_by_serovar.setdefault(serovar, []).append(o_antigen)
+        self.o_antigen_by_serovar = {serovar: Counter(o_antigens).most_common(1)[0][0]
+                                     for serovar, o_antigens in o_antigens_by_serovar.items()}
+
+        self._serovar_cache = {}
+
+    @staticmethod
+    def _index_rows(series):
+        rtn = {}
+        for i, x in enumerate(series):
+            rtn.setdefault(_missing_to_none(x), set()).add(i)
+        return {k: frozenset(v) for k, v in rtn.items()}
+
+    @staticmethod
+    def _rows_matching(index, values):
+        rows = set()
+        for x in values:
+            rows |= index.get(_missing_to_none(x), frozenset())
+        return rows
+
+    def expand_serogroup(self, sg):
+        """Serogroup to list of serogroups in the same similarity group or all serogroups if `sg` is None"""
+        if sg is None:
+            return list(self.unique_serogroups)
+        if sg in self.serogroup_similarity:
+            return list(self.serogroup_similarity[sg])
+        return [sg]
+
+    def expand_h1(self, h1):
+        """H1 antigen to list of H1 antigens in the same similarity group or all H1 antigens if `h1` is None"""
+        if h1 is None:
+            return list(self.unique_h1)
+        if h1 != '-' and h1 in self.h1_similarity:
+            return list(self.h1_similarity[h1])
+        return [h1]
+
+    def expand_h2(self, h2):
+        """H2 antigen to list of H2 antigens in the same similarity group"""
+        if h2 is not None and h2 != '-' and h2 in self.h2_similarity:
+            return list(self.h2_similarity[h2])
+        return [h2]
+
+    def h1_h2_share_group(self, h1, h2):
+        """Do the H1 and H2 antigens both belong to the same H2 (fljB) similarity group?"""
+        return len(self.h2_groups_by_antigen.get(h1, set()) & self.h2_groups_by_antigen.get(h2, set())) > 0
+
+    def get_serovar(self, sg, h1, h2, spp):
+        """Serovar(s) matching lists of serogroup, H1 and H2 antigens (and subspecies if specified)
+
+        Args:
+            sg (list of str): serogroups
+            h1 (list of str): H1 antigens
+            h2 (list of str): H2 antigens; if '-' in list then serovars where H2 can be missing are matched
+            spp (str): subspecies name or None
+
+        Returns:
+            str: '|' delimited serovar names in serovar table order or None if no matching serovars
+        """
+        key = (tuple(sg), tuple(h1), tuple(h2), spp)
+        if key in self._serovar_cache:
+            return self._serovar_cache[key]
+        rows = self._rows_matching(self.rows_by_serogroup, sg)
+        rows &= self._rows_matching(self.rows_by_h1, h1)
+        if '-' in h2:
+            rows &= self.rows_h2_can_be_missing
+        else:
+            rows &= self._rows_matching(self.rows_by_h2, h2)
+        if spp is not None and spp != '':
+            rows &= self.rows_by_subspecies.get(spp, frozenset())
+        serovars = [self.serovars[i] for i in sorted(rows)]
+        logging.debug('Rough antigenic serovar(s) prediction for subspecies %s sg=%s:h1=%s:h2=%s is %s serovar(s)', spp, sg, h1, h2, serovars)
+        rtn = '|'.join(serovars) if len(serovars) > 0 else None
+        self._serovar_cache[key] = rtn
+        return rtn
+
+    def lookup_serovar_antigens(self, serovar):
+        """Subspecies, serogroup, H1 and H2 antigens of the first serovar table entry for a serovar
+
+        Raises:
+            KeyError: serovar not in serovar table
+        """
+        return dict(self.serovar_antigens[serovar])
+
+    def o_antigen(self, serovar):
+        """Most common O-antigen for a serovar or None if serovar not in serovar table"""
+        return self.o_antigen_by_serovar.get(serovar)
+
+
+@lru_cache(maxsize=None)
+def serovar_resolver():
+    """Process-wide :class:`SerovarResolver` compiled from the serovar table on first use
+
+    Returns:
+        SerovarResolver: compiled serovar table lookups
+    """
+    return SerovarResolver(serovar_table())
+
+
 class BlastAntigenGeneMixin:
+    #: bool: store all antigen gene blastn results on prediction objects (output with -MM or to a hits table)
+    keep_blast_results = True
+    #: list of str: `blastn` output columns requested and parsed; all of `BLAST_TABLE_COLS` if None
+    blast_columns = None
+    _blast_readers = None
+
+    def set_output_level(self, more_results, keep_blast_results=None):
+        """Only request, parse and keep the antigen `blastn` results needed for the output verbosity level
+
+        The aligned subject sequence (`sseq`) is only requested from `blastn`
+        if it will be output, since it is not needed for antigen calls.
+
+        Args:
+            more_results (int): output verbosity level; `sseq` is output with -M and all blastn results with -MM
+            keep_blast_results (bool): keep all blastn results regardless of `more_results` (e.g. to write them
+                to a separate hits table)
+        """
+        if keep_blast_results is None:
+            keep_blast_results = more_results >= 2
+        self.keep_blast_results = keep_blast_results
+        if more_results >= 1 or keep_blast_results:
+            self.blast_columns = BLAST_TABLE_COLS
+        else:
+            self.blast_columns = BLAST_TABLE_COLS_NO_SSEQ
+
+    def antigen_gene_blast_reader(self, antigen_gene_fasta):
+        """Unfiltered BlastReader for an antigen gene query, running `blastn` only on first request"""
+        if self._blast_readers is None:
+            self._blast_readers = {}
+        if antigen_gene_fasta not in self._blast_readers:
+            blast_outfile = self.blast_runner.blast_against_query(antigen_gene_fasta, columns=self.blast_columns)
+            self._blast_readers[antigen_gene_fasta] = BlastReader(blast_outfile,
+                                                                  columns=self.blast_columns,
+                                                                  file_columns=self.blast_columns)
+        return self._blast_readers[antigen_gene_fasta]
+
     def get_antigen_gene_blast_results(self, model_obj, antigen_gene_fasta,exclude=['N/A']):
-        blast_outfile = self.blast_runner.blast_against_query(antigen_gene_fasta)
-        blast_reader = BlastReader(blast_outfile,exclude)
+        blast_reader = self.antigen_gene_blast_reader(antigen_gene_fasta).refilter(exclude)
+        return self.set_blast_results(model_obj, blast_reader)
+
+    def set_blast_results(self, model_obj, blast_reader):
         is_missing = blast_reader.is_missing
         model_obj.is_missing = is_missing
         if not is_missing:
-            model_obj.blast_results = blast_reader.df_dict()
+            if self.keep_blast_results:
+                model_obj.blast_results = blast_reader.df_dict()
 
             model_obj.top_result = blast_reader.top_result()
             model_obj.is_perfect_match = blast_reader.is_perfect_match
@@ -231,44 +615,73 @@ class SerogroupPredictor(BlastAntigenGeneMixin):
 
 
 
+def antigen_hit_candidates(hits, tiers):
+    """Select candidate antigen `blastn` hits by the first (max mismatches, min length) tier with any hits
+
+    Args:
+        hits (sistr.src.blast_wrapper.BlastHits): antigen gene `blastn` hits
+        tiers (list of (int, int)): max mismatches and min alignment length tiers in order of preference
+
+    Returns:
+        sistr.src.blast_wrapper.BlastHits: candidate hits or None if no tier has any hits
+    """
+    for max_mismatch, min_length in tiers:
+        candidates = hits.take((hits['mismatch'] <= max_mismatch) & (hits['length'] >= min_length))
+        if len(candidates) > 0:
+            return candidates
+    return None
+
+
+def best_antigen_hit(candidates):
+    """Best candidate antigen hit as a dict with whether it's truncated
+
+    Hits of at least 1000 bp with at most 5 mismatches are preferred, taking
+    the one with the fewest mismatches. Otherwise, the hit with the highest
+    bitscore is taken.
+
+    Args:
+        candidates (sistr.src.blast_wrapper.BlastHits): candidate antigen hits
+
+    Returns:
+        (dict, bool): best hit and whether it's truncated by the end of a contig
+    """
+    over1000 = candidates.take((candidates['mismatch'] <= 5) & (candidates['length'] >= 1000))
+    if len(over1000) > 0:
+        result_dict = over1000.sort_by('mismatch').row()
+    else:
+        result_dict = candidates.sort_by('bitscore', ascending=False).row()
+    result_trunc = BlastReader.is_blast_result_trunc(qstart=result_dict['qstart'],
+                                                     qend=result_dict['qend'],
+                                                     sstart=result_dict['sstart'],
+                                                     send=result_dict['send'],
+                                                     qlen=result_dict['qlen'],
+                                                     slen=result_dict['slen'])
+    return result_dict, result_trunc
+
+
 class H1Predictor(BlastAntigenGeneMixin):
     def __init__(self, blast_runner):
         self.blast_runner = blast_runner
         self.h1_prediction = H1FliCPrediction()
 
     def predict(self,filter=['N/A']):
-        self.h1_prediction = self.get_antigen_gene_blast_results(self.h1_prediction, FLIC_FASTA_PATH,filter)
+        """Predict the H1 antigen from fliC `blastn` results excluding antigens matching `filter`
+
+        `blastn` is only run on the first call; subsequent calls re-evaluate the
+        cached results with the new exclusion filter.
+        """
+        blast_reader = self.antigen_gene_blast_reader(FLIC_FASTA_PATH).refilter(filter)
+        self.h1_prediction = self.set_blast_results(H1FliCPrediction(), blast_reader)
         if not self.h1_prediction.is_missing and self.h1_prediction.top_result is not None:
             if not self.h1_prediction.is_perfect_match:
-                df_blast_results = pd.DataFrame(self.h1_prediction.blast_results)
-                df_blast_results = df_blast_results[
-                    (df_blast_results['mismatch'] <= 25) & (df_blast_results['length'] >= 700)]
-
-                if df_blast_results.shape[0] == 0:
-                    df_blast_results = pd.DataFrame(self.h1_prediction.blast_results)
-                    df_blast_results = df_blast_results[
-                        (df_blast_results['mismatch'] <= 0) & (df_blast_results['length'] >= 400)]
-                    if df_blast_results.shape[0] == 0:
-                        self.h1_prediction.is_missing = True
-                        self.h1_prediction.top_result = None
-                        self.h1_prediction.h1 = None
-                        return
-
-                df_blast_results_over1000 = df_blast_results[
-                    (df_blast_results['mismatch'] <= 5) & (df_blast_results['length'] >= 1000)]
-
-                if df_blast_results_over1000.shape[0] > 0:
-                    df_blast_results = df_blast_results_over1000.sort_values(by='mismatch')
-                else:
-                    df_blast_results = df_blast_results.sort_values(by='bitscore', ascending=False)
-
-                result_dict = BlastReader.df_first_row_to_dict(df_blast_results)
-                result_trunc = BlastReader.is_blast_result_trunc(qstart=result_dict['qstart'],
-                                                                 qend=result_dict['qend'],
-                                                                 sstart=result_dict['sstart'],
-                                                                 send=result_dict['send'],
-                                                                 qlen=result_dict['qlen'],
-                                                                 slen=result_dict['slen'])
+                candidates = antigen_hit_candidates(blast_reader.hits, [(25, 700), (0, 400)])
+                if candidates is None:
+                    self.h1_prediction.is_missing = True
+                    self.h1_prediction.top_result = None
+                    self.h1_prediction.h1 = None
+                    return
+
+                result_dict, result_trunc = best_antigen_hit(candidates)
                 self.h1_prediction.top_result = result_dict
                 self.h1_prediction.is_trunc = result_trunc
             self.h1_prediction.h1 = get_antigen_name(self.h1_prediction.top_result['qseqid'])
@@ -280,29 +693,25 @@ class H2Predictor(BlastAntigenGeneMixin):
         self.h2_prediction = H2FljBPrediction()
 
     def predict(self,filter=['N/A']):
+        """Predict the H2 antigen from fljB `blastn` results excluding antigens matching `filter`
 
-        self.h2_prediction = self.get_antigen_gene_blast_results(self.h2_prediction, FLJB_FASTA_PATH,filter)
+        `blastn` is only run on the first call; subsequent calls re-evaluate the
+        cached results with the new exclusion filter.
+        """
+        blast_reader = self.antigen_gene_blast_reader(FLJB_FASTA_PATH).refilter(filter)
+        self.h2_prediction = self.set_blast_results(H2FljBPrediction(), blast_reader)
         if not self.h2_prediction.is_missing and self.h2_prediction.top_result is not None:
             if not self.h2_prediction.is_perfect_match :
                 top_result = self.h2_prediction.top_result
                 match_len = top_result['length']
                 pident = top_result['pident']
 
-
-                df_blast_results = pd.DataFrame(self.h2_prediction.blast_results)
-                df_blast_results = df_blast_results[
-                    (df_blast_results['mismatch'] <= 50) & (df_blast_results['length'] >= 700)]
-
-                if df_blast_results.shape[0] == 0:
-                    df_blast_results = pd.DataFrame(self.h2_prediction.blast_results)
-                    df_blast_results = df_blast_results[
-                        (df_blast_results['mismatch'] <= 0) & (df_blast_results['length'] >= 600)]
-
-                    if df_blast_results.shape[0] == 0:
-                        self.h2_prediction.is_missing = True
-                        self.h2_prediction.top_result = None
-                        self.h2_prediction.h2 = '-'
-                        return
+                candidates = antigen_hit_candidates(blast_reader.hits, [(50, 700), (0, 600)])
+                if candidates is None:
+                    self.h2_prediction.is_missing = True
+                    self.h2_prediction.top_result = None
+                    self.h2_prediction.h2 = '-'
+                    return
 
                 # short lower %ID matches are treated as missing or '-' for H2
                 if match_len <= 600 and pident < 88.0:
@@ -310,23 +719,7 @@ class H2Predictor(BlastAntigenGeneMixin):
                     self.h2_prediction.is_missing = True
                     return
 
-
-
-                df_blast_results_over1000 = df_blast_results[
-                    (df_blast_results['mismatch'] <= 5) & (df_blast_results['length'] >= 1000)]
-
-                if df_blast_results_over1000.shape[0] > 0:
-                    df_blast_results = df_blast_results_over1000.sort_values(by='mismatch')
-                else:
-                    df_blast_results = df_blast_results.sort_values(by='bitscore', ascending=False)
-
-                result_dict = BlastReader.df_first_row_to_dict(df_blast_results)
-                result_trunc = BlastReader.is_blast_result_trunc(qstart=result_dict['qstart'],
-                                                                 qend=result_dict['qend'],
-                                                                 sstart=result_dict['sstart'],
-                                                                 send=result_dict['send'],
-                                                                 qlen=result_dict['qlen'],
-                                                                 slen=result_dict['slen'])
+                result_dict, result_trunc = best_antigen_hit(candidates)
                 self.h2_prediction.top_result = result_dict
                 self.h2_prediction.is_trunc = result_trunc
             self.h2_prediction.h2 = get_antigen_name(self.h2_prediction.top_result['qseqid'])
@@ -342,15 +735,22 @@ class SerovarPredictor:
     serovar = None
     subspecies = None
 
-    def __init__(self, blast_runner, subspecies):
+    def __init__(self, blast_runner, subspecies, more_results=2, keep_blast_results=None):
         """
-
+        Args:
+            blast_runner (sistr.src.blast_wrapper.BlastRunner): blastn runner object with genome fasta initialized
+            subspecies (str): subspecies prediction or None
+            more_results (int): output verbosity level determining which antigen gene blastn results
+                are kept (by default all results are kept)
+            keep_blast_results (bool): keep all antigen gene blastn results regardless of `more_results`
         """
         self.blast_runner = blast_runner
         self.subspecies = subspecies
         self.serogroup_predictor = SerogroupPredictor(self.blast_runner)
         self.h1_predictor = H1Predictor(self.blast_runner)
         self.h2_predictor = H2Predictor(self.blast_runner)
+        for predictor in (self.serogroup_predictor, self.h1_predictor, self.h2_predictor):
+            predictor.set_output_level(more_results, keep_blast_results)
 
     def predict_antigens(self):
         self.h1_predictor.predict()
@@ -363,46 +763,22 @@ class SerovarPredictor:
 
 
     @staticmethod
-    def get_serovar(df, sg, h1, h2, spp):
-        h2_is_missing = '-' in h2
-        b_sg = df['Serogroup'].isin(sg)
-        b_h1 = df['H1'].isin(h1)
-        if h2_is_missing:
-            b_h2 = df['can_h2_be_missing']
-        else:
-            b_h2 = df['H2'].isin(h2)
-
-    
-        if spp is not None and spp != '':
-            b_spp = df['subspecies'] == spp
-        else:
-            b_spp = b_sg
-        
-        df_prediction = df[(b_spp & b_sg & b_h1 & b_h2)]
-
-        logging.debug(f"Antigen to serovar dataframe filtered spp={spp} sg={sg} h1={h1} h2{h2}\n Total of {df_prediction.shape[0]} serovar hits:\n{df_prediction}\n")
-        logging.debug('Rough antigenic serovar(s) prediction for subspecies %s sg=%s:h1=%s:h2=%s is %s serovar(s)', spp, sg, h1, h2, list(df_prediction['Serovar']))
-        if df_prediction.shape[0] > 0:
-            return '|'.join(list(df_prediction['Serovar']))
+    def get_serovar(resolver, sg, h1, h2, spp):
+        """Serovar(s) matching the serogroup, H1 and H2 antigen lists (see :meth:`SerovarResolver.get_serovar`)"""
+        return resolver.get_serovar(sg, h1, h2, spp)
 
     @staticmethod
-    def lookup_serovar_antigens(df, serovar):
-
-        df_prediction = df.loc[df['Serovar'] == serovar]
-        spp = df_prediction['subspecies'].values.item(0)
-        sg = df_prediction['Serogroup'].values.item(0)
-        h1 = df_prediction['H1'].values.item(0)
-        h2 = df_prediction['H2'].values.item(0)
-
-        logging.debug('Serovar antigens for %s  are: %s %s:%s:%s', serovar,spp, sg, h1, h2, )
-        return {'spp':spp,'sg':sg,'h1':h1,'h2':h2}
+    def lookup_serovar_antigens(resolver, serovar):
+        antigens = resolver.lookup_serovar_antigens(serovar)
+        logging.debug('Serovar antigens for %s  are: %s %s:%s:%s', serovar, antigens['spp'], antigens['sg'], antigens['h1'], antigens['h2'])
+        return antigens
 
     def predict_serovar_from_antigen_blast(self):
 
         if not self.serogroup or not self.h2 or not self.h1:
             self.predict_antigens()
 
-        df = serovar_table()
+        resolver = serovar_resolver()
         sg = self.serogroup
         h1 = self.h1
         h2 = self.h2
@@ -415,52 +791,16 @@ class SerovarPredictor:
             self.serovar = '-:-:-'
             return self.serovar
 
-        for sg_groups in SEROGROUP_SIMILARITY_GROUPS:
-            if sg in sg_groups:
-                sg = sg_groups
-                break
-        if sg is None:
-            sg = list(df['Serogroup'].unique())
-        if not isinstance(sg, list):
-            sg = [sg]
-
-        for h1_groups in H1_FLIC_SIMILARITY_GROUPS:
-            if h1 is None or h1 == '-':
-                break
-            if h1 in h1_groups:
-                h1 = h1_groups
-                break
-
-        if h1 is None:
-            h1 = list(df['H1'].unique())
-        if not isinstance(h1, list):
-            h1 = [h1]
-
-        for h2_groups in H2_FLJB_SIMILARITY_GROUPS:
-            if h2 is None or h2 == '-':
-                break
-            if h2 in h2_groups:
-                h2 = h2_groups
-                break
-
-        if not isinstance(h2, list):
-            h2 = [h2]
-        self.serovar = SerovarPredictor.get_serovar(df, sg, h1, h2, self.subspecies)
+        sg = resolver.expand_serogroup(sg)
+        h1 = resolver.expand_h1(h1)
+        h2 = resolver.expand_h2(h2)
+        self.serovar = SerovarPredictor.get_serovar(resolver, sg, h1, h2, self.subspecies)
         if self.serovar is None:
             try:
                 spp_roman = spp_name_to_roman[self.subspecies]
             except:
                 spp_roman = None
-            from collections import Counter
-            c = Counter(df.O_antigen[df.Serogroup.isin(sg)])
-            temp_o = c.most_common()
-
-            if 0 in temp_o and 0 in temp_o[0]:
-                o_antigen = c.most_common()[0][0]
-            else:
-                o_antigen = sg.pop()
-            h1_first = h1[0]
-            h2_first = h2[0]
+            o_antigen = sg[-1]
             if spp_roman:
                 self.serovar = '{} {}:{}:{}'.format(spp_roman, o_antigen, self.h1, self.h2)
             else:
@@ -486,6 +826,67 @@ class SerovarPredictor:
         return serovar_pred
 
 
+class SavedAntigenPredictor:
+    """Antigen gene predictor stand-in holding a saved antigen prediction (see :class:`SavedAntigenSerovarPredictor`)"""
+
+    def __init__(self, **predictions):
+        for k, v in predictions.items():
+            setattr(self, k, v)
+
+    def predict(self, filter=None):
+        pass
+
+
+class SavedAntigenSerovarPredictor(SerovarPredictor):
+    """SerovarPredictor from saved serogroup, H1 and H2 antigen predictions without antigen gene BLAST
+
+    Used to re-predict serovars after cgMLST330 subspecies and serovar
+    predictions change (e.g. with updated reference data). Re-evaluating
+    the fliC/fljB results excluding similar antigens in
+    :func:`overall_serovar_call` needs the antigen gene `blastn` results,
+    so saved H1 and H2 antigens are used as they are.
+
+    Args:
+        subspecies (str): subspecies prediction or None
+        serogroup_prediction (SerogroupPrediction): saved serogroup prediction
+        h1_prediction (H1FliCPrediction): saved H1 prediction
+        h2_prediction (H2FljBPrediction): saved H2 prediction
+    """
+
+    def __init__(self, subspecies, serogroup_prediction, h1_prediction, h2_prediction):
+        self.blast_runner = None
+        self.subspecies = subspecies
+        self.serogroup_predictor = SavedAntigenPredictor(serogroup_prediction=serogroup_prediction)
+        self.h1_predictor = SavedAntigenPredictor(h1_prediction=h1_prediction)
+        self.h2_predictor = SavedAntigenPredictor(h2_prediction=h2_prediction)
+        self.serogroup = serogroup_prediction.serogroup
+        self.h1 = h1_prediction.h1
+        self.h2 = h2_prediction.h2
+
+    @classmethod
+    def from_prediction(cls, subspecies, prediction):
+        """From a saved prediction (e.g. see :func:`record_from_output_dict`)
+
+        Missing serogroup and H1 antigens output as "-" are restored to None as
+        returned by antigen gene BLAST.
+
+        Args:
+            subspecies (str): subspecies prediction or None
+            prediction (SerovarPrediction): saved prediction
+
+        Returns:
+            SavedAntigenSerovarPredictor: predictor with the saved antigen predictions
+        """
+        none_if_missing = lambda x: None if x in ('-', '') else x
+        serogroup_prediction = prediction.serogroup_prediction or SerogroupPrediction()
+        h1_prediction = prediction.h1_flic_prediction or H1FliCPrediction()
+        h2_prediction = prediction.h2_fljb_prediction or H2FljBPrediction()
+        serogroup_prediction.serogroup = none_if_missing(prediction.serogroup)
+        h1_prediction.h1 = none_if_missing(prediction.h1)
+        h2_prediction.h2 = prediction.h2 if prediction.h2 else '-'
+        return cls(subspecies, serogroup_prediction, h1_prediction, h2_prediction)
+
+
 def overall_serovar_call(serovar_prediction, antigen_predictor):
     """
     Predict serovar from cgMLST cluster membership analysis and antigen BLAST results.
@@ -522,42 +923,32 @@ def overall_serovar_call(serovar_prediction, antigen_predictor):
     sg = antigen_predictor.serogroup
     spp = serovar_prediction.cgmlst_subspecies
     if spp is None:
-        if 'mash_match' in serovar_prediction.__dict__:
-            spp = serovar_prediction.__dict__['mash_subspecies']
+        if serovar_prediction.has('mash_match'):
+            spp = serovar_prediction.mash_subspecies
 
     serovar_prediction.serovar_antigen = antigen_predictor.serovar #assign antigen serovar from antigen_predictor object
     cgmlst_serovar = serovar_prediction.serovar_cgmlst
     cgmlst_distance = float(serovar_prediction.cgmlst_distance)
 
-    h1_h2_share_group = False
-    for h2_groups in H2_FLJB_SIMILARITY_GROUPS:
-        if h1 in h2_groups and h2 in h2_groups:
-            h1_h2_share_group = True
-            break
-
-
+    resolver = serovar_resolver()
+    h1_h2_share_group = resolver.h1_h2_share_group(h1, h2)
 
     if(h1_h2_share_group and h1 != '-' and cgmlst_serovar is not  None):
-        cgmlst_serovar_antigens = antigen_predictor.lookup_serovar_antigens(serovar_table(),cgmlst_serovar)
-        h1_in_h2_similarity_groups = False
-        for h2_groups in H2_FLJB_SIMILARITY_GROUPS:
-            if cgmlst_serovar_antigens['h1'] in h2_groups:
-                h1_in_h2_similarity_groups = True
-                groups = h2_groups
-                break
-        h2_in_h1_similarity_groups = False
-        for h1_groups in H1_FLIC_SIMILARITY_GROUPS:
-            if cgmlst_serovar_antigens['h2'] in h1_groups:
-                h2_in_h1_similarity_groups = True
-                groups = h1_groups
-                break
+        cgmlst_serovar_antigens = antigen_predictor.lookup_serovar_antigens(resolver, cgmlst_serovar)
+        groups = None
+        h1_in_h2_similarity_groups = cgmlst_serovar_antigens['h1'] in resolver.h2_similarity
+        if h1_in_h2_similarity_groups:
+            groups = resolver.h2_similarity[cgmlst_serovar_antigens['h1']]
+        h2_in_h1_similarity_groups = cgmlst_serovar_antigens['h2'] in resolver.h1_similarity
+        if h2_in_h1_similarity_groups:
+            groups = resolver.h1_similarity[cgmlst_serovar_antigens['h2']]
         if antigen_predictor.serogroup is None:
             antigen_predictor.serogroup = '-'
 
         if(h1_in_h2_similarity_groups):
-            temp = H2Predictor(antigen_predictor.blast_runner)
+            # re-evaluate the cached fljB results excluding the cgMLST serovar H1 similarity group antigens
+            temp = antigen_predictor.h2_predictor
             temp.predict(filter=groups)
-            antigen_predictor.h2_predictor = temp
             h2 = temp.h2_prediction.h2
             if h2 is None:
                 h2 = '-'
@@ -566,9 +957,9 @@ def overall_serovar_call(serovar_prediction, antigen_predictor):
             serovar_prediction.h2_fljb_prediction.h2 = h2
 
         elif(h2_in_h1_similarity_groups):
-            temp = H1Predictor(antigen_predictor.blast_runner)
+            # re-evaluate the cached fliC results excluding the cgMLST serovar H2 similarity group antigens
+            temp = antigen_predictor.h1_predictor
             temp.predict(filter=groups)
-            antigen_predictor.h1_predictor = temp
             h1 = temp.h1_prediction.h1
             if h1 is None:
                 h1 = '-'
@@ -604,12 +995,11 @@ def overall_serovar_call(serovar_prediction, antigen_predictor):
             serovar_prediction.serovar = cgmlst_serovar
         else:
             serovar_prediction.serovar = null_result
-            if 'mash_match' in serovar_prediction.__dict__:
-                spd = serovar_prediction.__dict__
-                mash_dist = float(spd['mash_distance'])
+            if serovar_prediction.has('mash_match'):
+                mash_dist = float(serovar_prediction.mash_distance)
                 if mash_dist <= MASH_DISTANCE_THRESHOLD:
-                    logging.info(f"Overall serovar assigned by MASH {spd['mash_distance']} ...")
-                    serovar_prediction.serovar = spd['mash_serovar']
+                    logging.info(f"Overall serovar assigned by MASH {serovar_prediction.mash_distance} ...")
+                    serovar_prediction.serovar = serovar_prediction.mash_serovar
     else:
         serovars_from_antigen = antigen_predictor.serovar.split('|')
         if not isinstance(serovars_from_antigen, list):
@@ -619,10 +1009,9 @@ def overall_serovar_call(serovar_prediction, antigen_predictor):
                 logging.info(f"Overall serovar assigned by cgMLST {cgmlst_serovar} ...")
                 serovar_prediction.serovar = cgmlst_serovar
 
-        elif 'mash_match' in serovar_prediction.__dict__:
-            spd = serovar_prediction.__dict__
-            mash_serovar = spd['mash_serovar']
-            mash_dist = float(spd['mash_distance'])
+        elif serovar_prediction.has('mash_match'):
+            mash_serovar = serovar_prediction.mash_serovar
+            mash_dist = float(serovar_prediction.mash_distance)
             if mash_serovar in serovars_from_antigen:
                 serovar_prediction.serovar = mash_serovar
                 logging.info(f"Overall serovar assigned by MASH serovar {mash_serovar} ...")        
@@ -0,0 +1,383 @@
+import json
+import logging
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from sistr.version import __version__
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS queue (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    sistr_version TEXT,
+    created TEXT,
+    options TEXT,
+    args BLOB
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    genome TEXT NOT NULL,
+    fasta_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed REAL,
+    heartbeat REAL,
+    finished REAL,
+    error TEXT,
+    result BLOB,
+    UNIQUE (genome, fasta_path)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+'''
+
+#: str: job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+#: int: seconds between heartbeats of a worker's running job
+HEARTBEAT_INTERVAL = 30
+
+#: int: seconds without a heartbeat after which a running job is reclaimed by another worker
+STALE_AFTER = 300
+
+#: int: max number of times a job is claimed before it is marked as failed
+MAX_ATTEMPTS = 3
+
+#: int: seconds between checks of the queue while waiting for jobs of other workers
+POLL_INTERVAL = 10
+
+
+class WorkQueueMismatchError(Exception):
+    """Work queue was created by a run with different analysis options or SISTR version"""
+    pass
+
+
+def worker_id():
+    """Unique ID of this worker process ("hostname:pid")"""
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class WorkQueue:
+    """Job table of genomes to analyze in an SQLite database on shared storage
+
+    Any number of worker processes on any host with access to the database
+    file claim pending genomes one at a time (atomically, in an immediate
+    transaction), record a heartbeat while analyzing them and store the
+    pickled ``(prediction, cgmlst_results)`` when finished. Running jobs
+    without a heartbeat for `stale_after` seconds (e.g. of a killed worker
+    or lost host) are reclaimed by other workers; jobs failing or going
+    stale `max_attempts` times are marked as failed.
+
+    No broker or server is needed, only a shared filesystem with working
+    POSIX file locks (e.g. NFSv4, Lustre or GPFS) and roughly synchronized
+    host clocks. The database uses a rollback journal since write-ahead
+    logging does not work across hosts.
+
+    The analysis arguments of the run that created the queue are stored in
+    the queue so that all workers analyze genomes with the same options.
+
+    Args:
+        path (str): SQLite database path
+        create (bool): create the database if it does not exist
+    """
+
+    def __init__(self, path, create=False):
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError('Work queue "{}" does not exist'.format(path))
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=600, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=DELETE')
+        self.conn.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def _transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def init_run(self, args, options):
+        """Store the analysis arguments of the queue or check that they match those of the existing queue
+
+        Args:
+            args (argparse.Namespace): sistr_cmd arguments used by all workers
+            options (dict): result-affecting analysis options (JSON serializable)
+
+        Raises:
+            WorkQueueMismatchError: queue was created with different options or SISTR version
+        """
+        options_json = json.dumps(options, sort_keys=True)
+        with self._transaction():
+            row = self.conn.execute('SELECT sistr_version, options FROM queue').fetchone()
+            if row is None:
+                self.conn.execute('INSERT INTO queue (id, sistr_version, created, options, args) VALUES (1, ?, ?, ?, ?)',
+                                  (__version__,
+                                   datetime.now().isoformat(),
+                                   options_json,
+                                   pickle.dumps(args, protocol=pickle.HIGHEST_PROTOCOL)))
+            elif row != (__version__, options_json):
+                raise WorkQueueMismatchError(
+                    'Work queue "{}" was created with different analysis options or SISTR version: {} {} '
+                    '(current: {} {})'.format(self.path, row[0], row[1], __version__, options_json))
+
+    def args(self):
+        """Analysis arguments stored by the run that created the queue
+
+        Returns:
+            argparse.Namespace: sistr_cmd arguments
+        """
+        row = self.conn.execute('SELECT args FROM queue').fetchone()
+        if row is None:
+            raise ValueError('Work queue "{}" has no analysis arguments. Add genomes with "sistr_cmd --queue"'.format(
+                self.path))
+        return pickle.loads(row[0])
+
+    def enqueue(self, input_fastas, genome_names):
+        """Add genomes to the queue
+
+        Genomes already in the queue (same genome name and absolute FASTA
+        path) are not added again so that finished results are reused, but
+        failed genomes are retried.
+
+        Args:
+            input_fastas (list of str): genome FASTA paths
+            genome_names (list of str): genome names
+
+        Returns:
+            list of int: job ID of each genome in input order
+        """
+        jobs = [(genome, os.path.abspath(fasta_path)) for fasta_path, genome in zip(input_fastas, genome_names)]
+        with self._transaction():
+            self.conn.executemany('INSERT OR IGNORE INTO jobs (genome, fasta_path) VALUES (?, ?)', jobs)
+            job_ids = {(genome, fasta_path): job_id
+                       for job_id, genome, fasta_path in self.conn.execute('SELECT id, genome, fasta_path FROM jobs')}
+            ids = [job_ids[x] for x in jobs]
+            self.conn.executemany('''UPDATE jobs SET status = ?, attempts = 0
+                                     WHERE id = ? AND status = ?''', ((PENDING, x, FAILED) for x in set(ids)))
+        return ids
+
+    def claim(self, worker, stale_after=STALE_AFTER, max_attempts=MAX_ATTEMPTS):
+        """Atomically claim the next pending (or stale running) job
+
+        Args:
+            worker (str): worker ID (see :func:`worker_id`)
+            stale_after (float): seconds without a heartbeat after which a running job is reclaimed
+            max_attempts (int): stale jobs already claimed this many times are marked as failed
+
+        Returns:
+            (int, str, str): job ID, FASTA path and genome name or None if there is no job to claim
+        """
+        with self._transaction():
+            while True:
+                now = time.time()
+                row = self.conn.execute('''SELECT id, fasta_path, genome, status, worker, attempts FROM jobs
+                                           WHERE status = ? OR (status = ? AND heartbeat < ?)
+                                           ORDER BY id LIMIT 1''', (PENDING, RUNNING, now - stale_after)).fetchone()
+                if row is None:
+                    return None
+                job_id, fasta_path, genome, status, last_worker, attempts = row
+                if status == RUNNING:
+                    error = 'No heartbeat from worker {} for {} s'.format(last_worker, stale_after)
+                    if attempts >= max_attempts:
+                        logging.error('%s | %s. Giving up after %s attempts', genome, error, attempts)
+                        self.conn.execute('UPDATE jobs SET status = ?, error = ? WHERE id = ?',
+                                          (FAILED, error, job_id))
+                        continue
+                    logging.warning('%s | %s. Reclaiming job %s', genome, error, job_id)
+                self.conn.execute('''UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, claimed = ?,
+                                     heartbeat = ? WHERE id = ?''', (RUNNING, worker, now, now, job_id))
+                return job_id, fasta_path, genome
+
+    def heartbeat(self, job_id, worker):
+        """Record that a worker is still analyzing a claimed job
+
+        Returns:
+            bool: False if the job is no longer claimed by the worker (e.g. reclaimed as stale)
+        """
+        cursor = self.conn.execute('UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = ?',
+                                   (time.time(), job_id, worker, RUNNING))
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, worker, result):
+        """Store the results of a finished job
+
+        Results of a job that was reclaimed as stale but finished anyway are
+        kept unless the job was already finished by another worker.
+
+        Args:
+            job_id (int): job ID
+            worker (str): worker ID
+            result (tuple): ``(prediction, cgmlst_results)``
+        """
+        self.conn.execute('''UPDATE jobs SET status = ?, worker = ?, finished = ?, error = NULL, result = ?
+                             WHERE id = ? AND status != ?''',
+                          (DONE, worker, time.time(), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL),
+                           job_id, DONE))
+
+    def fail(self, job_id, worker, error, max_attempts=MAX_ATTEMPTS):
+        """Record a failed attempt of a claimed job; the job is retried until `max_attempts` attempts have failed
+
+        Args:
+            job_id (int): job ID
+            worker (str): worker ID
+            error (str): error message
+            max_attempts (int): max number of attempts
+        """
+        self.conn.execute('''UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?
+                             WHERE id = ? AND worker = ? AND status = ?''',
+                          (max_attempts, FAILED, PENDING, error, job_id, worker, RUNNING))
+
+    def job(self, job_id):
+        """Status of a job
+
+        Returns:
+            (str, str, tuple, str): status, genome name, ``(prediction, cgmlst_results)`` (None if not done) and
+                error message of the last failed attempt
+        """
+        status, genome, result, error = self.conn.execute('SELECT status, genome, result, error FROM jobs WHERE id = ?',
+                                                          (job_id,)).fetchone()
+        return status, genome, (pickle.loads(result) if result is not None else None), error
+
+    def counts(self):
+        """Number of jobs in each state
+
+        Returns:
+            dict: job status to count
+        """
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status'))
+
+    def close(self):
+        self.conn.close()
+
+
+class Heartbeat:
+    """Periodically record the heartbeat of a worker's current job from a background thread
+
+    Set :attr:`job_id` to the claimed job while analyzing it and back to None
+    when finished.
+
+    Args:
+        queue_path (str): work queue database path
+        worker (str): worker ID
+        interval (float): seconds between heartbeats
+    """
+
+    def __init__(self, queue_path, worker, interval=HEARTBEAT_INTERVAL):
+        self.queue_path = queue_path
+        self.worker = worker
+        self.interval = interval
+        self.job_id = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        # SQLite connections cannot be shared between threads
+        queue = WorkQueue(self.queue_path)
+        try:
+            while not self._stopped.wait(self.interval):
+                job_id = self.job_id
+                if job_id is None:
+                    continue
+                try:
+                    if not queue.heartbeat(job_id, self.worker):
+                        logging.warning('Job %s is no longer claimed by worker %s', job_id, self.worker)
+                except sqlite3.Error as ex:
+                    logging.warning('Could not record heartbeat of job %s: %s', job_id, ex)
+        finally:
+            queue.close()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+def run_worker(queue_path, predict, heartbeat_interval=HEARTBEAT_INTERVAL, stale_after=STALE_AFTER,
+               max_attempts=MAX_ATTEMPTS, poll_interval=POLL_INTERVAL):
+    """Claim and analyze genomes from a work queue until all jobs are finished
+
+    While other workers still have running jobs, the worker waits for them
+    to finish or go stale so that jobs of lost workers are reclaimed.
+
+    Args:
+        queue_path (str): work queue database path
+        predict (function): ``predict(fasta_path, genome_name)`` returning ``(prediction, cgmlst_results)``
+        heartbeat_interval (float): seconds between heartbeats of the running job
+        stale_after (float): seconds without a heartbeat after which running jobs of other workers are reclaimed
+        max_attempts (int): max number of attempts per job
+        poll_interval (float): seconds between checks for stale jobs while waiting for other workers
+
+    Returns:
+        int: number of jobs completed by this worker
+    """
+    worker = worker_id()
+    completed = 0
+    with WorkQueue(queue_path) as queue:
+        heartbeat = Heartbeat(queue_path, worker, heartbeat_interval)
+        try:
+            while True:
+                job = queue.claim(worker, stale_after=stale_after, max_attempts=max_attempts)
+                if job is None:
+                    if queue.counts().get(RUNNING, 0) == 0:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                job_id, fasta_path, genome = job
+                logging.info('%s | Worker %s claimed job %s', genome, worker, job_id)
+                heartbeat.job_id = job_id
+                try:
+                    result = predict(fasta_path, genome)
+                except Exception as ex:
+                    logging.error('%s | Job %s failed: %s', genome, job_id, ex)
+                    queue.fail(job_id, worker, '{}: {}'.format(type(ex).__name__, ex), max_attempts=max_attempts)
+                    continue
+                finally:
+                    heartbeat.job_id = None
+                queue.complete(job_id, worker, result)
+                completed += 1
+        finally:
+            heartbeat.stop()
+    logging.info('Worker %s completed %s jobs', worker, completed)
+    return completed
+
+
+def queue_outputs(queue, job_ids, poll_interval=POLL_INTERVAL):
+    """Results of jobs in order, waiting for each job to be finished by any worker
+
+    Jobs that failed `max_attempts` times are logged and skipped.
+
+    Args:
+        queue (WorkQueue): work queue
+        job_ids (list of int): job IDs
+        poll_interval (float): seconds between checks of unfinished jobs
+
+    Yields:
+        (SerovarPrediction, dict): prediction and cgMLST results of each finished job
+    """
+    for job_id in job_ids:
+        while True:
+            status, genome, result, error = queue.job(job_id)
+            if status == DONE:
+                yield result
+                break
+            if status == FAILED:
+                logging.error('%s | Analysis failed: %s', genome, error)
+                break
+            time.sleep(poll_interval)
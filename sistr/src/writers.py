@@ -1,4 +1,11 @@
+import csv
+import gzip
+import json
 import logging
+import os
+import re
+import sys
+
 import numpy as np
 
 
@@ -28,6 +35,10 @@ def to_dict(x, depth, exclude_keys=set(), depth_threshold=8):
     json.dump(s) and pickle don't like to un/serialize regular Python objects so
     this function should handle arbitrarily nested objects to be serialized to
     regular string, float, int, bool, None values.
+
+    Record objects (e.g. ``SerovarPrediction``) are serialized from their
+    explicit field schema (``FIELDS``) in schema order. Other objects fall back
+    to all of their non-callable non-private attributes (see :func:`listattrs`).
     
     This is a recursive function so by default it will exit at a certain depth (depth_threshold=8).
     
@@ -42,16 +53,8 @@ def to_dict(x, depth, exclude_keys=set(), depth_threshold=8):
     """
     if x is None or isinstance(x, (str, int, float, bool)):
         return x
-    if isinstance(x, np.int_):
-        return int(x)
-    if isinstance(x, np.int64):
-        return int(x)
-    if isinstance(x, np.float_):
-        return float(x)
-    if isinstance(x, np.float64):
-        return float(x)
-    if isinstance(x, np.bool_):
-        return bool(x)
+    if isinstance(x, (np.integer, np.floating, np.bool_)):
+        return x.item()
     if depth + 1 > depth_threshold: return {}
     if isinstance(x, list):
         out = []
@@ -60,25 +63,63 @@ def to_dict(x, depth, exclude_keys=set(), depth_threshold=8):
             if tmp == {}: continue
             out.append(tmp)
         return out
-    out = {}
     if isinstance(x, dict):
-        for k, v in x.items():
-            if k in exclude_keys: continue
-            if not isinstance(k, (str,)):
-                k = str(k)
-            tmp = to_dict(v, depth + 1, exclude_keys, depth_threshold)
-            if tmp == {}: continue
-            out[k] = tmp
-        return out
-    for attr in listattrs(x):
-        if attr in exclude_keys: continue
-        v = getattr(x, attr)
+        items = x.items()
+    elif hasattr(type(x), 'FIELDS'):
+        items = x.fields()
+    else:
+        items = ((attr, getattr(x, attr)) for attr in listattrs(x))
+    out = {}
+    for k, v in items:
+        if k in exclude_keys: continue
+        if not isinstance(k, (str,)):
+            k = str(k)
         tmp = to_dict(v, depth + 1, exclude_keys, depth_threshold)
         if tmp == {}: continue
-        out[attr] = tmp
+        out[k] = tmp
     return out
 
 
+def output_exclude_keys(more_results=0):
+    """Keys excluded from prediction output at an output verbosity level
+
+    - default: no antigen gene blastn results or aligned subject sequences (`sseq`)
+    - ``-M``: aligned subject sequences of top antigen gene results
+    - ``-MM``: all antigen gene blastn results
+
+    Args:
+        more_results (int): output verbosity level (-M count)
+
+    Returns:
+        set: keys to exclude from output
+    """
+    if more_results >= 2:
+        return set()
+    if more_results == 1:
+        return {'blast_results'}
+    return {'blast_results', 'sseq'}
+
+
+def prediction_to_output_dict(prediction, more_results=0, flatten=False):
+    """Serialize a prediction for output at an output verbosity level
+
+    Args:
+        prediction (sistr.src.serovar_prediction.SerovarPrediction): serovar prediction
+        more_results (int): output verbosity level (-M count)
+        flatten (bool): flatten into a single level dict for tabular output; with the default verbosity
+            only top-level scalar fields are output
+
+    Returns:
+        dict: output dict
+    """
+    exclude_keys = output_exclude_keys(more_results)
+    if not flatten:
+        return to_dict(prediction, 0, exclude_keys=exclude_keys)
+    if more_results > 0:
+        return flatten_dict(to_dict(prediction, 0, exclude_keys=exclude_keys))
+    return to_dict(prediction, 0, exclude_keys=exclude_keys, depth_threshold=1)
+
+
 def _recur_flatten(key, x, out, sep='.'):
     """Helper function to flatten_dict
     
@@ -129,13 +170,12 @@ def flatten_dict(x):
 
 
 def write_json(fh, output):
-    import json
     json.dump(output, fh)
 
 
 def write_pickle(fh, output):
-    import cPickle
-    cPickle.dump(output, fh)
+    import pickle
+    pickle.dump(output, fh)
 
 
 def write_csv(fh, output):
@@ -155,34 +195,736 @@ fmt_to_write_func = {'json': write_json,
                      'csv': write_csv,
                      'tab': write_tab, }
 
+#: set: output formats that can be written incrementally one genome at a time
+STREAMING_FORMATS = {'json', 'jsonl', 'csv', 'tab', 'parquet', 'arrow'}
 
-def write(dest, fmt, serovar_predictions, more_results=0):
-    assert isinstance(serovar_predictions, list)
-    if not fmt in fmt_to_write_func:
-        logging.warn('Invalid output format "%s". Defaulting to "json"', fmt)
-        fmt = 'json'
+#: dict: output format to column delimiter for tabular output formats
+TABULAR_FORMAT_DELIMITERS = {'csv': ',', 'tab': '\t'}
+
+#: set: typed columnar output formats (requires pyarrow)
+COLUMNAR_FORMATS = {'parquet', 'arrow'}
+
+#: int: number of rows buffered and written as a single Parquet row group/Arrow record batch
+COLUMNAR_BATCH_SIZE = 1000
+
+#: set: prediction output fields written as dictionary encoded (categorical) columns
+CATEGORICAL_FIELDS = {'serovar',
+                      'serovar_antigen',
+                      'serovar_cgmlst',
+                      'mash_serovar',
+                      'serogroup',
+                      'o_antigen',
+                      'h1',
+                      'h2',
+                      'cgmlst_subspecies',
+                      'mash_subspecies',
+                      'qc_status',
+                      'predicted_serovar_in_list'}
+
+#: set: prediction output fields written as unsigned 32-bit integer columns (CRC32 based identifiers)
+UINT32_FIELDS = {'cgmlst_ST'}
+
+#: dict: Mash top results field to type (values of the `mash_top_5` prediction output field)
+MASH_TOP_DTYPES = {'ref': str,
+                   'dist': np.float64,
+                   'n_match': np.int64,
+                   'serovar': str}
+
+
+def _nested_field_dtypes(field):
+    """Column types of a prediction output dict field (keyed by column name first)"""
+    if field == 'mash_top_5':
+        return MASH_TOP_DTYPES
+    from sistr.src.blast_wrapper import BLAST_RESULT_DTYPES
+    return BLAST_RESULT_DTYPES
+
+
+def prediction_output_fields(args=None):
+    """Scalar top-level prediction output fields (the tabular output columns at the default verbosity)
+
+    Args:
+        args (argparse.Namespace): sistr_cmd arguments; if given, only the fields that an analysis with these
+            options outputs (e.g. Mash fields only with --run-mash)
+
+    Returns:
+        list of str: fields in output order
+    """
+    from sistr.src.serovar_prediction import SerovarPrediction
+    fields = [field for field in SerovarPrediction.FIELDS
+              if SerovarPrediction.FIELD_TYPES[field] in (str, int, float, bool)]
+    if args is None:
+        return fields
+    excluded = set()
+    if args.no_cgmlst:
+        excluded.add('cgmlst_ST')
+    if not args.run_mash:
+        excluded.update(field for field in fields if field.startswith('mash_'))
+    if not args.qc:
+        excluded.update(('qc_status', 'qc_messages'))
+    if not args.list_of_serovars:
+        excluded.add('predicted_serovar_in_list')
+    return [field for field in fields if field not in excluded]
+
+
+def prediction_output_dtype(key):
+    """Type of a prediction output field from the prediction record schema
+
+    Args:
+        key (str): output field, flattened with "." for nested fields (e.g.
+            "h1_flic_prediction.top_result.pident" or "mash_top_5.dist.12")
+
+    Returns:
+        type: field type (``str``, ``int``, ``float``, ``bool`` or a NumPy scalar type) or None if unknown
+    """
+    from sistr.src.serovar_prediction import Record, SerovarPrediction
+    cls = SerovarPrediction
+    parts = key.split('.')
+    for i, part in enumerate(parts):
+        dtype = cls.FIELD_TYPES.get(part)
+        if isinstance(dtype, type) and issubclass(dtype, Record):
+            cls = dtype
+            continue
+        if dtype is dict:
+            # BLAST/Mash result dicts are keyed by column first (then by row for multiple results)
+            return _nested_field_dtypes(part).get(parts[i + 1]) if i + 1 < len(parts) else None
+        return dtype if i == len(parts) - 1 else None
+    return None
+
+
+def open_output(dest):
+    """Open an output file for writing text, gzip compressed if the path ends with ".gz"
+
+    Args:
+        dest (str): output file path or "-" for stdout
+
+    Returns:
+        file object opened for writing text
+    """
+    if dest == '-':
+        return sys.stdout
+    if dest.endswith('.gz'):
+        return gzip.open(dest, 'wt')
+    return open(dest, 'w')
+
+
+def output_path(dest, fmt):
+    """Output path with the output format file extension added if missing (before any ".gz" extension)"""
+    if dest == '-':
+        return dest
+    is_gzip = dest.endswith('.gz')
+    if is_gzip:
+        dest = dest[:-3]
     if '.' + fmt not in dest:
         dest += '.' + fmt
-    logging.info('Writing output "%s" file to "%s"', fmt, dest)
-    fh = open(dest, 'w')
+    if is_gzip:
+        dest += '.gz'
+    return dest
+
+
+class StreamingTableWriter:
+    """Write dicts as CSV/TSV rows
+
+    With `fieldnames` (for tables whose columns are known up front), the
+    header is written immediately and each row as it is produced; keys
+    missing from a row are written as empty values and keys not in
+    `fieldnames` are an error.
+
+    Without `fieldnames`, rows are buffered and written when closed with a
+    header of the union of the keys of all rows in order of first appearance
+    (like ``pandas.DataFrame(rows).to_csv()``), so no column is lost when
+    later rows have keys that earlier rows lack (e.g. flattened -M/-MM
+    prediction output).
+
+    Args:
+        fh (file): output file object (not closed by :meth:`close`)
+        delimiter (str): column delimiter
+        fieldnames (list of str): table columns; taken from all rows when closed if None
+    """
+
+    def __init__(self, fh, delimiter=',', fieldnames=None):
+        self.fh = fh
+        self.delimiter = delimiter
+        self.fieldnames = None
+        self.writer = None
+        self._rows = []
+        if fieldnames is not None:
+            self._open(fieldnames)
+
+    def _open(self, fieldnames):
+        self.fieldnames = list(fieldnames)
+        self.writer = csv.DictWriter(self.fh,
+                                     fieldnames=self.fieldnames,
+                                     delimiter=self.delimiter,
+                                     lineterminator='\n',
+                                     restval='')
+        self.writer.writeheader()
+
+    def write(self, row):
+        if self.writer is None:
+            self._rows.append(row)
+            return
+        self.writer.writerow({k: ('' if v is None else v) for k, v in row.items()})
+        self.fh.flush()
+
+    def close(self):
+        """Write buffered rows (if no `fieldnames` were given)"""
+        if self.writer is not None or len(self._rows) == 0:
+            return
+        self._open(dict.fromkeys(k for row in self._rows for k in row))
+        rows = self._rows
+        self._rows = []
+        for row in rows:
+            self.write(row)
+
+
+def _import_pyarrow():
     try:
-        # write in whatever format necessary
-        write_func = fmt_to_write_func[fmt]
-        exclude_keys_in_output = {'blast_results', 'sseq'}
-        if more_results >= 2:
-            exclude_keys_in_output.remove('blast_results')
-            exclude_keys_in_output.remove('sseq')
-        elif more_results == 1:
-            exclude_keys_in_output.remove('sseq')
-        if fmt in {'pickle', 'json'}:
-            output_dict = [to_dict(v, 0, exclude_keys=exclude_keys_in_output) for v in serovar_predictions]
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Parquet/Arrow output requires the "pyarrow" package (e.g. pip install sistr_cmd[columnar])')
+    return pyarrow
+
+
+class ColumnarTableWriter:
+    """Write dicts to a typed Parquet or Arrow IPC file
+
+    With a `schema` (for tables whose columns are known up front), rows are
+    buffered and written as a Parquet row group or Arrow record batch every
+    `batch_size` rows; keys not in the schema are not written.
+
+    Without a `schema`, all rows are buffered and written when closed with a
+    schema of the union of the keys of all rows (see :meth:`schema_for`), so
+    no column is lost when later rows have keys that earlier rows lack.
+
+    Args:
+        dest (str): output file path
+        fmt (str): "parquet" or "arrow"
+        schema (pyarrow.Schema): output table schema; derived from all rows when closed if None
+        categorical_fields (set): fields to dictionary encode
+        uint32_fields (set): fields to write as unsigned 32-bit integers
+        batch_size (int): rows per Parquet row group/Arrow record batch
+        dtypes (function): column name to type (``str``, Python or NumPy scalar type) or None if unknown, for
+            deriving the schema
+    """
+
+    def __init__(self, dest, fmt='parquet', schema=None, categorical_fields=(), uint32_fields=(),
+                 batch_size=COLUMNAR_BATCH_SIZE, dtypes=None):
+        self.pa = _import_pyarrow()
+        self.dest = dest
+        self.fmt = fmt
+        self.schema = schema
+        self.categorical_fields = set(categorical_fields)
+        self.uint32_fields = set(uint32_fields)
+        self.batch_size = batch_size
+        self.dtypes = dtypes
+        self.writer = None
+        self._rows = []
+
+    def schema_for(self, columns, rows=()):
+        """Table schema for columns
+
+        - fields in `uint32_fields` are unsigned 32-bit integers
+        - other fields are typed by `dtypes`; fields of unknown type are
+          inferred from their values in `rows` (strings if all null)
+        - string fields in `categorical_fields` are dictionary encoded
+
+        Args:
+            columns (list of str): column names in order
+            rows (list of dict): rows for inferring the types of columns of unknown type
+
+        Returns:
+            pyarrow.Schema: table schema
+        """
+        pa = self.pa
+        fields = []
+        for column in columns:
+            dtype = self.dtypes(column) if self.dtypes is not None else None
+            if column in self.uint32_fields:
+                arrow_type = pa.uint32()
+            elif dtype is not None:
+                arrow_type = _arrow_type(pa, dtype)
+            else:
+                arrow_type = pa.array([row.get(column) for row in rows]).type
+                if pa.types.is_null(arrow_type):
+                    arrow_type = pa.string()
+            if column in self.categorical_fields and pa.types.is_string(arrow_type):
+                arrow_type = pa.dictionary(pa.int32(), pa.string())
+            fields.append(pa.field(column, arrow_type))
+        return pa.schema(fields)
+
+    def _open(self):
+        if self.fmt == 'parquet':
+            self.writer = self.pa.parquet.ParquetWriter(self.dest, self.schema)
+        else:
+            self.writer = self.pa.ipc.new_file(self.dest, self.schema)
+
+    def write(self, row):
+        self._rows.append(row)
+        if self.schema is not None and len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows (if the schema is known)"""
+        if len(self._rows) == 0 or self.schema is None:
+            return
+        if self.writer is None:
+            self._open()
+        for i in range(0, len(self._rows), self.batch_size):
+            self.writer.write_table(self.pa.Table.from_pylist(self._rows[i:i + self.batch_size], schema=self.schema))
+        self._rows = []
+
+    def close(self):
+        if self.schema is None:
+            self.schema = self.schema_for(dict.fromkeys(k for row in self._rows for k in row), self._rows)
+        self.flush()
+        if self.writer is None:
+            self._open()
+        self.writer.close()
+
+
+class PredictionWriter:
+    """Write serovar predictions to an output file as each genome's prediction completes
+
+    Formats:
+
+    - ``json``: JSON array of predictions (same as the non-streaming JSON output once closed)
+    - ``jsonl``: JSON Lines with one prediction per line
+    - ``csv``/``tab``: one row per prediction (see :class:`StreamingTableWriter`). At the default verbosity with
+      `fields` given, the columns are `fields` and each row is written as its prediction completes. Otherwise
+      (flattened -M/-MM output, whose columns depend on the BLAST results of each genome, or predictions read
+      back from previous outputs) the columns are the union of all predictions' fields and all rows are kept in
+      memory and written when closed
+    - ``parquet``/``arrow``: typed columnar table with one row per prediction (see :class:`ColumnarTableWriter`)
+      with column types from the prediction record schema. At the default verbosity the columns are all scalar
+      prediction fields (see :func:`prediction_output_fields`) and rows are written in batches; with -M/-MM the
+      columns are the union of all predictions' flattened fields, written when closed
+    - ``pickle``: list of predictions written when closed
+
+    Output is gzip compressed if the output path ends with ".gz" and written
+    to stdout if the output path is "-".
+
+    Args:
+        dest (str): output path
+        fmt (str): output format
+        more_results (int): output verbosity level (-M count)
+        typed (bool): take Parquet/Arrow column types from the prediction record schema; False for predictions
+            read back from previous outputs (dicts), whose column types are inferred from their values
+        fields (list of str): csv/tab columns at the default verbosity (see :func:`prediction_output_fields`);
+            fields of a prediction that are not columns must be empty
+    """
+
+    def __init__(self, dest, fmt='json', more_results=0, typed=True, fields=None):
+        if not fmt in fmt_to_write_func and not fmt in STREAMING_FORMATS:
+            logging.warning('Invalid output format "%s". Defaulting to "json"', fmt)
+            fmt = 'json'
+        self.fmt = fmt
+        self.more_results = more_results
+        self.dest = output_path(dest, fmt)
+        self.count = 0
+        self._buffer = []
+        logging.info('Writing output "%s" file to "%s"', fmt, self.dest)
+        self.fh = None
+        self.table_writer = None
+        self.fields = list(fields) if fields is not None and more_results == 0 else None
+        if fmt in COLUMNAR_FORMATS:
+            self.table_writer = ColumnarTableWriter(self.dest,
+                                                    fmt,
+                                                    categorical_fields=CATEGORICAL_FIELDS,
+                                                    uint32_fields=UINT32_FIELDS,
+                                                    dtypes=prediction_output_dtype if typed else None)
+            if typed and more_results == 0:
+                self.table_writer.schema = self.table_writer.schema_for(prediction_output_fields())
+        elif fmt != 'pickle':
+            self.fh = open_output(self.dest)
+            if fmt in TABULAR_FORMAT_DELIMITERS:
+                self.table_writer = StreamingTableWriter(self.fh,
+                                                         delimiter=TABULAR_FORMAT_DELIMITERS[fmt],
+                                                         fieldnames=self.fields)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, prediction):
+        if self.fmt == 'pickle':
+            self._buffer.append(prediction_to_output_dict(prediction, self.more_results))
+        elif self.table_writer is not None:
+            row = prediction_to_output_dict(prediction, self.more_results, flatten=True)
+            if self.fields is not None and self.fh is not None:
+                extra_fields = [k for k, v in row.items() if v is not None and k not in self.table_writer.fieldnames]
+                if extra_fields:
+                    raise ValueError('Prediction of genome "{}" has output fields {} that are not columns of the '
+                                     'output table'.format(prediction.genome, extra_fields))
+                row = {k: row.get(k) for k in self.table_writer.fieldnames}
+            self.table_writer.write(row)
         else:
-            if more_results > 0:
-                output_dict = [flatten_dict(to_dict(v, 0, exclude_keys=exclude_keys_in_output)) for v in
-                               serovar_predictions]
+            record = json.dumps(prediction_to_output_dict(prediction, self.more_results))
+            if self.fmt == 'jsonl':
+                self.fh.write(record + '\n')
             else:
-                output_dict = [to_dict(v, 0, exclude_keys=exclude_keys_in_output, depth_threshold=1) for v in
-                               serovar_predictions]
-        write_func(fh, output_dict)
-    finally:
-        fh.close()
+                self.fh.write(('[' if self.count == 0 else ', ') + record)
+            self.fh.flush()
+        self.count += 1
+
+    def close(self):
+        if self.fmt == 'pickle':
+            with open(self.dest, 'wb') as fh:
+                write_pickle(fh, self._buffer)
+            return
+        if self.fh is None:
+            self.table_writer.close()
+            return
+        if self.fh.closed:
+            return
+        if self.table_writer is not None:
+            self.table_writer.close()
+        if self.fmt == 'json':
+            self.fh.write('[]' if self.count == 0 else ']')
+        if self.fh is sys.stdout:
+            self.fh.write('\n')
+            self.fh.flush()
+        else:
+            self.fh.close()
+
+
+def write(dest, fmt, serovar_predictions, more_results=0):
+    assert isinstance(serovar_predictions, list)
+    with PredictionWriter(dest, fmt, more_results=more_results) as writer:
+        for prediction in serovar_predictions:
+            writer.write(prediction)
+
+
+class CgmlstProfilesWriter:
+    """Write each genome's cgMLST330 allelic profile as a row as it completes
+
+    Profiles are written as CSV unless the output path ends with ".parquet" or
+    ".arrow", in which case they are written to a typed columnar table with a
+    "genome" column and a nullable unsigned 32-bit integer allele column per
+    marker.
+
+    Args:
+        dest (str): output path (CSV gzip compressed if ends with ".gz")
+        markers (list of str): cgMLST330 marker names in column order
+    """
+
+    def __init__(self, dest, markers):
+        self.markers = list(markers)
+        self.fh = None
+        self.table_writer = None
+        fmt = os.path.splitext(dest)[1][1:]
+        if fmt in COLUMNAR_FORMATS:
+            pa = _import_pyarrow()
+            schema = pa.schema([pa.field('genome', pa.string())] + [pa.field(m, pa.uint32()) for m in self.markers])
+            self.table_writer = ColumnarTableWriter(dest, fmt, schema=schema)
+        else:
+            self.fh = open_output(dest)
+            self.fh.write(','.join([''] + self.markers) + '\n')
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, genome, cgmlst_results):
+        if cgmlst_results is None:
+            return
+        self.count += 1
+        if self.table_writer is not None:
+            row = {'genome': genome}
+            for marker in self.markers:
+                aname = cgmlst_results[marker]['name'] if marker in cgmlst_results else None
+                row[marker] = None if aname is None else int(aname)
+            self.table_writer.write(row)
+            return
+        row = [genome]
+        for marker in self.markers:
+            aname = cgmlst_results[marker]['name'] if marker in cgmlst_results else None
+            row.append('' if aname is None else str(int(aname)))
+        csv.writer(self.fh, lineterminator='\n').writerow(row)
+        self.fh.flush()
+
+    def close(self):
+        if self.table_writer is not None:
+            self.table_writer.close()
+        else:
+            self.fh.close()
+
+
+class AllelesJsonWriter:
+    """Write each genome's cgMLST330 allele results to a JSON object keyed by genome name as it completes"""
+
+    def __init__(self, dest):
+        self.fh = open_output(dest)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, genome, cgmlst_results):
+        self.fh.write(('{' if self.count == 0 else ', ') + json.dumps(genome) + ': ' + json.dumps(cgmlst_results))
+        self.fh.flush()
+        self.count += 1
+
+    def close(self):
+        if self.fh.closed:
+            return
+        self.fh.write('{}' if self.count == 0 else '}')
+        self.fh.close()
+
+
+#: dict: cgMLST330 allele BLAST result fields written to the compact allele results side table and their types
+ALLELE_BLAST_RESULT_DTYPES = {'qseqid': str,
+                              'stitle': str,
+                              'pident': np.float64,
+                              'length': np.int64,
+                              'mismatch': np.int64,
+                              'gapopen': np.int64,
+                              'qstart': np.int64,
+                              'qend': np.int64,
+                              'sstart': np.int64,
+                              'send': np.int64,
+                              'evalue': np.float64,
+                              'bitscore': np.float64,
+                              'qlen': np.int64,
+                              'slen': np.int64,
+                              'coverage': np.float64,
+                              'is_trunc': np.bool_,
+                              'is_match': np.bool_,
+                              'is_perfect': np.bool_,
+                              'has_perfect_match': np.bool_,
+                              'start_idx': np.int64,
+                              'end_idx': np.int64,
+                              'needs_revcomp': np.bool_,
+                              'trunc': np.bool_,
+                              'is_extended': np.bool_,
+                              'too_many_gaps': np.bool_,
+                              'sseq_msa_gaps': np.int64,
+                              'sseq_msa_p_gaps': np.float64, }
+
+
+def _arrow_type(pa, dtype):
+    if dtype is str:
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+
+class CompactAllelesWriter:
+    """Write cgMLST330 allele results with each distinct allele sequence stored once
+
+    The output JSON object has a ``genomes`` object of genome name to marker to
+    allele name (``null`` if missing) that is written as each genome
+    completes and an ``alleles`` object of allele name to allele sequence
+    written when closed::
+
+        {"genomes": {"genome_1": {"NZ_AOXE01000059.1_2": 3196308940, ...}, ...},
+         "alleles": {"3196308940": "ATG...", ...}}
+
+    The allele BLAST results (see `ALLELE_BLAST_RESULT_DTYPES`) of each
+    genome and marker are written to a typed side table: a Parquet file if
+    pyarrow is installed, otherwise a gzipped tab-delimited file (see
+    :func:`compact_alleles_side_table_path`).
+
+    Args:
+        dest (str): output JSON path (gzip compressed if ends with ".gz")
+    """
+
+    def __init__(self, dest):
+        self.fh = open_output(dest)
+        self.alleles = {}
+        self.count = 0
+        self.side_table_path = compact_alleles_side_table_path(dest)
+        if self.side_table_path.endswith('.parquet'):
+            pa = _import_pyarrow()
+            fields = [pa.field('genome', pa.string()), pa.field('marker', pa.string()), pa.field('allele', pa.uint32())]
+            fields += [pa.field(k, _arrow_type(pa, v)) for k, v in ALLELE_BLAST_RESULT_DTYPES.items()]
+            self.side_table_fh = None
+            self.side_table = ColumnarTableWriter(self.side_table_path, 'parquet', schema=pa.schema(fields))
+        else:
+            self.side_table_fh = open_output(self.side_table_path)
+            self.side_table = StreamingTableWriter(self.side_table_fh,
+                                                   delimiter='\t',
+                                                   fieldnames=['genome', 'marker', 'allele'] +
+                                                              list(ALLELE_BLAST_RESULT_DTYPES))
+        logging.info('Writing allele BLAST results side table to "%s"', self.side_table_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, genome, cgmlst_results):
+        if cgmlst_results is None:
+            return
+        profile = {}
+        for marker, res in cgmlst_results.items():
+            name = res['name']
+            name = None if name is None else int(name)
+            profile[marker] = name
+            if name is not None and res['seq'] is not None:
+                self.alleles.setdefault(str(name), res['seq'])
+            br = res['blast_result']
+            if isinstance(br, dict):
+                row = {'genome': genome, 'marker': marker, 'allele': name}
+                for k in ALLELE_BLAST_RESULT_DTYPES:
+                    row[k] = to_dict(br.get(k), 0)
+                self.side_table.write(row)
+        self.fh.write(('{"genomes": {' if self.count == 0 else ', ') + json.dumps(genome) + ': ' + json.dumps(profile))
+        self.fh.flush()
+        self.count += 1
+
+    def close(self):
+        if self.fh.closed:
+            return
+        self.fh.write(('{"genomes": {' if self.count == 0 else '') + '}, "alleles": ' + json.dumps(self.alleles) + '}')
+        self.fh.close()
+        if self.side_table_fh is not None:
+            self.side_table_fh.close()
+        else:
+            self.side_table.close()
+
+
+def compact_alleles_side_table_path(dest):
+    """Compact allele results side table path for an allele results JSON output path
+
+    Example:
+        ``alleles.json`` => ``alleles.blast.parquet`` (or ``alleles.blast.tsv.gz`` without pyarrow)
+
+    Args:
+        dest (str): compact allele results JSON path
+
+    Returns:
+        str: side table path
+    """
+    base = re.sub(r'(\.json)?(\.gz)?$', '', dest)
+    try:
+        _import_pyarrow()
+        return base + '.blast.parquet'
+    except ImportError:
+        return base + '.blast.tsv.gz'
+
+
+def antigen_blast_results(prediction):
+    """Antigen gene search names and their kept `blastn` results (if any) for a serovar prediction
+
+    Args:
+        prediction (sistr.src.serovar_prediction.SerovarPrediction): serovar prediction
+
+    Yields:
+        (str, dict): antigen gene name ("wzx", "wzy", "fliC" or "fljB") and `blastn` results as a
+            dict of column name to dict of row index to value (i.e. ``pandas.DataFrame.to_dict()``)
+    """
+    sg_pred = prediction.serogroup_prediction
+    antigen_preds = [('wzx', sg_pred.wzx_prediction if sg_pred else None),
+                     ('wzy', sg_pred.wzy_prediction if sg_pred else None),
+                     ('fliC', prediction.h1_flic_prediction),
+                     ('fljB', prediction.h2_fljb_prediction)]
+    for antigen, pred in antigen_preds:
+        if pred is not None and pred.blast_results:
+            yield antigen, pred.blast_results
+
+
+def _blast_hits_dtype(column):
+    from sistr.src.blast_wrapper import BLAST_RESULT_DTYPES
+    if column in ('genome', 'antigen'):
+        return str
+    return BLAST_RESULT_DTYPES.get(column)
+
+
+class BlastHitsWriter:
+    """Write all antigen gene `blastn` results of each genome to a hits table as it completes
+
+    Hits are written to a Parquet or Arrow table if the output path ends with
+    ".parquet" or ".arrow", otherwise to a tab-delimited file (gzip
+    compressed if the path ends with ".gz"). Each row has the genome name,
+    antigen gene name (see :func:`antigen_blast_results`) and the `blastn`
+    result columns, which are the same for all antigen searches of a run.
+
+    Args:
+        dest (str): output path
+    """
+
+    def __init__(self, dest):
+        self.fh = None
+        fmt = os.path.splitext(dest)[1][1:]
+        if fmt in COLUMNAR_FORMATS:
+            self.table_writer = ColumnarTableWriter(dest,
+                                                    fmt,
+                                                    categorical_fields={'genome', 'antigen'},
+                                                    dtypes=_blast_hits_dtype)
+        else:
+            self.fh = open_output(dest)
+            # header written with the columns of the first hit
+            self.table_writer = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, prediction):
+        for antigen, blast_results in antigen_blast_results(prediction):
+            columns = list(blast_results.keys())
+            for idx in blast_results[columns[0]]:
+                row = {'genome': prediction.genome, 'antigen': antigen}
+                for column in columns:
+                    row[column] = to_dict(blast_results[column][idx], 0)
+                if self.table_writer is None:
+                    self.table_writer = StreamingTableWriter(self.fh, delimiter='\t', fieldnames=row.keys())
+                elif self.fh is None and self.table_writer.schema is None:
+                    self.table_writer.schema = self.table_writer.schema_for(row.keys())
+                self.table_writer.write(row)
+                self.count += 1
+        if self.fh is not None:
+            self.fh.flush()
+
+    def close(self):
+        if self.fh is not None:
+            self.fh.close()
+        else:
+            self.table_writer.close()
+
+
+class NovelAllelesWriter:
+    """Write novel (non-truncated) cgMLST330 alleles of each genome to a FASTA file as it completes"""
+
+    def __init__(self, dest):
+        self.fh = open_output(dest)
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, cgmlst_results):
+        if cgmlst_results is None:
+            return 0
+        count = 0
+        for marker, res in cgmlst_results.items():
+            name = res['name']
+            seq = res['seq']
+            br = res['blast_result']
+            if br is not None and isinstance(br, dict):
+                trunc = br['trunc']
+                if not trunc:
+                    self.fh.write('>{}|{}\n{}\n'.format(marker, name, seq))
+                    count += 1
+        self.fh.flush()
+        self.count += count
+        return count
+
+    def close(self):
+        self.fh.close()
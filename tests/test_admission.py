@@ -0,0 +1,94 @@
+import argparse
+import gzip
+import os
+import threading
+
+from sistr.src.admission import AdmissionController, estimate_genome_memory, input_genome_size, process_memory, \
+    workers_memory
+
+
+def _args(**kwargs):
+    args = dict(no_cgmlst=False, use_full_cgmlst_db=False, more_results=0, blast_hits_output=None)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def test_estimate_genome_memory(tmpdir):
+    estimate = estimate_genome_memory(5000000, _args())
+    assert estimate_genome_memory(6000000, _args()) > estimate
+    assert estimate_genome_memory(5000000, _args(use_full_cgmlst_db=True)) > estimate
+    assert estimate_genome_memory(5000000, _args(more_results=2)) > estimate
+    assert estimate_genome_memory(5000000, _args(more_results=2, blast_hits_output='hits.tab')) == estimate
+    assert estimate_genome_memory(5000000, _args(no_cgmlst=True)) < estimate
+
+    path = str(tmpdir.join('g.fasta'))
+    with open(path, 'w') as fh:
+        fh.write('>contig_1\n' + 'ACGT' * 1000 + '\n')
+    assert input_genome_size(path) == os.path.getsize(path)
+    with gzip.open(path + '.gz', 'wt') as fh:
+        fh.write('>contig_1\n' + 'ACGT' * 1000 + '\n')
+    assert input_genome_size(path + '.gz') > os.path.getsize(path + '.gz')
+    assert input_genome_size(str(tmpdir.join('missing.fasta'))) == 0
+
+
+def test_process_memory():
+    if not os.path.exists('/proc/self/statm'):
+        return
+    assert process_memory(os.getpid()) > 0
+    assert workers_memory() >= process_memory(os.getpid())
+
+
+def test_admission_controller():
+    controller = AdmissionController(max_memory=1000, poll_interval=0.01)
+    # measured memory use of the test process is ignored by the budget
+    controller.baseline = 0
+    controller.used_memory = lambda: controller.baseline + controller.reserved
+    # a genome over budget is admitted if no other genome is in progress
+    controller.admit(2000)
+    admitted = threading.Event()
+
+    def admit():
+        controller.admit(400)
+        admitted.set()
+
+    thread = threading.Thread(target=admit)
+    thread.start()
+    assert not admitted.wait(0.1)
+    controller.release(2000)
+    assert admitted.wait(5)
+    thread.join()
+    assert controller.throttled == 1
+    controller.admit(600)
+    assert controller.in_progress == 2
+    assert controller.reserved == 1000
+
+    controller = AdmissionController(max_memory=1 << 40)
+    reserved = []
+
+    def finished_last_first(admitted):
+        for i, x in reversed(list(admitted)):
+            yield i, x * 2
+            reserved.append(controller.reserved)
+
+    outputs = list(controller.released(finished_last_first(controller.admitted([1, 2, 3], [10, 20, 30]))))
+    # outputs in input order, memory released in completion order
+    assert outputs == [2, 4, 6]
+    assert reserved == [30, 10, 0]
+    assert controller.in_progress == 0
+    assert controller.reserved == 0
+
+
+def test_admission_controller_abort():
+    controller = AdmissionController(max_memory=1000, poll_interval=0.01)
+    controller.baseline = 0
+    controller.used_memory = lambda: controller.baseline + controller.reserved
+    admitted = []
+    thread = threading.Thread(target=lambda: admitted.extend(controller.admitted('abc', [800, 800, 800])))
+    thread.start()
+    thread.join(0.1)
+    # waiting for the first genome to finish
+    assert thread.is_alive()
+    controller.abort()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert admitted == [(0, 'a')]
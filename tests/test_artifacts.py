@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from sistr.src.artifacts import GenomeArtifacts, ArtifactBlastRunner, ArtifactsMismatchError, artifacts_path, \
+    artifact_files
+from sistr.src.blast_wrapper import BlastReader, BLAST_TABLE_COLS, BLAST_TABLE_COLS_NO_SSEQ
+
+BLAST_ROWS = [
+    ['wzx|1', 'contig_1', '100.0', '10', '0', '0', '1', '10', '101', '110', '1e-30', '20.0', '10', '500', 'ACGTACGTAC'],
+    ['wzx|2', 'contig_2', '95.0', '10', '1', '0', '1', '10', '210', '201', '1e-25', '15.0', '10', '500', 'ACGTACGTAA'],
+]
+
+
+@pytest.fixture
+def query_fasta(tmpdir):
+    path = tmpdir.join('wzx.fasta')
+    path.write('>wzx|1\nACGTACGTAC\n>wzx|2\nACGTACGTAA\n')
+    return str(path)
+
+
+@pytest.fixture
+def blast_outfile(tmpdir):
+    path = tmpdir.join('wzx.blast')
+    path.write(''.join('\t'.join(row) + '\n' for row in BLAST_ROWS))
+    return str(path)
+
+
+def test_genome_artifacts_replay(tmpdir, query_fasta, blast_outfile):
+    artifacts = GenomeArtifacts('genome 1', fasta_filepath='/data/genome_1.fasta', genome_size=1000)
+    artifacts.add_blast_output(query_fasta, BLAST_TABLE_COLS, blast_outfile)
+    artifacts.add_allele_sequences('cgmlst-centroid.fasta', {'marker': {'name': '1', 'seq': 'A', 'blast_result': None}})
+    artifacts.mash_out = b'ref\tquery\t0.01\t0\t900/1000\n'
+    path = artifacts_path(str(tmpdir.join('artifacts')), artifacts.genome)
+    assert os.path.basename(path).startswith('genome_1-')
+    assert path.endswith('.sistr-artifacts.pickle.gz')
+    artifacts.save(path)
+    assert artifact_files([str(tmpdir.join('artifacts'))]) == [path]
+
+    loaded = GenomeArtifacts.load(path)
+    assert loaded.genome == 'genome 1'
+    assert loaded.genome_size == 1000
+    assert loaded.mash_out == artifacts.mash_out
+    assert loaded.get_allele_sequences('/other/dir/cgmlst-centroid.fasta')['marker']['name'] == '1'
+
+    runner = ArtifactBlastRunner(loaded)
+    assert runner.replay
+    reader = BlastReader(runner.blast_against_query(query_fasta))
+    lean_reader = BlastReader(runner.blast_against_query(query_fasta, columns=BLAST_TABLE_COLS_NO_SSEQ),
+                              columns=BLAST_TABLE_COLS_NO_SSEQ,
+                              file_columns=BLAST_TABLE_COLS_NO_SSEQ)
+    assert reader.df.shape[0] == 2
+    assert 'sseq' not in lean_reader.df.columns
+    assert list(lean_reader.df['qseqid']) == list(reader.df['qseqid'])
+    assert list(lean_reader.df['is_trunc']) == list(reader.df['is_trunc'])
+
+
+def test_genome_artifacts_query_changed(query_fasta, blast_outfile):
+    artifacts = GenomeArtifacts('genome_1')
+    artifacts.add_blast_output(query_fasta, BLAST_TABLE_COLS, blast_outfile)
+    with open(query_fasta, 'a') as fh:
+        fh.write('>wzx|3\nACGTACGTTT\n')
+    # query FASTA hashes are cached per process
+    from sistr.src.artifacts import query_sha256
+    query_sha256.cache_clear()
+    with pytest.raises(ArtifactsMismatchError):
+        artifacts.blast_output(query_fasta)
+
+
+def test_artifacts_path_collisions(tmpdir):
+    artifacts_dir = str(tmpdir.join('artifacts'))
+    assert artifacts_path(artifacts_dir, 'S.1') != artifacts_path(artifacts_dir, 'S_1')
+    assert artifacts_path(artifacts_dir, 'S.1') == artifacts_path(artifacts_dir, 'S.1')
+    path = artifacts_path(artifacts_dir, 'S.1')
+    GenomeArtifacts('S.1', genome_size=1).save(path)
+    GenomeArtifacts('S.1', genome_size=2).save(path)
+    assert GenomeArtifacts.load(path).genome_size == 2
+    with pytest.raises(FileExistsError):
+        GenomeArtifacts('S_1').save(path)
+    assert GenomeArtifacts.load(path).genome == 'S.1'
@@ -38,3 +38,43 @@ def test_run_cgmlst(blast_runner):
     assert isinstance(marker_res, dict)
     # 330 marker results for 330 cgMLST loci
     assert len(marker_res) == 330
+
+
+def test_cgmlst_predictions_from_profiles(monkeypatch):
+    import numpy as np
+    import pandas as pd
+    from sistr.src import cgmlst
+    from sistr.src.reference_data import ReferenceData
+
+    markers = ['m{}'.format(i) for i in range(10)]
+    rng = np.random.RandomState(42)
+    df_ref = pd.DataFrame(rng.randint(1, 4, size=(20, len(markers))).astype(np.float64),
+                          index=['r{}'.format(i) for i in range(20)],
+                          columns=markers)
+    df_ref.iloc[3, 2] = np.nan
+    ref = ReferenceData(genome_serovar={g: 'S{}'.format(i % 3) for i, g in enumerate(df_ref.index)},
+                        genome_subspecies={g: 'enterica' if i % 4 else 'salamae' for i, g in enumerate(df_ref.index)})
+    ref._cgmlst_profiles = df_ref
+    monkeypatch.setattr(cgmlst, 'reference_data', lambda: ref)
+
+    df_query = pd.DataFrame(rng.randint(1, 4, size=(7, len(markers))).astype(np.float64),
+                            index=['q{}'.format(i) for i in range(7)],
+                            columns=markers)
+    df_query.iloc[0, 0] = np.nan
+    df_query.iloc[1] = df_ref.iloc[5]
+    results = list(cgmlst.cgmlst_predictions_from_profiles(df_query[markers[::-1]], chunk_size=3))
+    assert [genome for genome, _, _ in results] == list(df_query.index)
+    for genome, prediction, marker_results in results:
+        profile = {m: x for m, x in df_query.loc[genome].items() if not np.isnan(x)}
+        df_relatives = cgmlst.find_closest_related_genome(profile, df_ref)
+        assert prediction['genome_match'] == df_relatives.index[0]
+        assert prediction['matching_alleles'] == df_relatives['matching'].iloc[0]
+        assert prediction['distance'] == df_relatives['distance'].iloc[0]
+        assert prediction['serovar'] == ref.genome_serovar[df_relatives.index[0]]
+        assert prediction['found_loci'] == len(profile)
+        assert len(marker_results) == len(markers)
+    assert results[0][1]['cgmlst330_ST'] is None
+    assert results[1][1]['genome_match'] == 'r5'
+    assert results[1][1]['matching_alleles'] == len(markers)
+    expected_st = allele_name('-'.join(str(int(df_query.loc['q1', m])) for m in sorted(markers)))
+    assert results[1][1]['cgmlst330_ST'] == expected_st
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from sistr import sistr_cmd
+from sistr.src.checkpoint import Checkpoint, CheckpointMismatchError
+from sistr.src.serovar_prediction import SerovarPrediction
+
+
+def test_checkpoint(tmpdir):
+    fasta = tmpdir.join('g1.fasta')
+    fasta.write('>contig_1\nACGT\n')
+    checkpoint = Checkpoint(str(tmpdir.join('checkpoint')), {'qc': True})
+    key = checkpoint.key(str(fasta), 'g1')
+    assert key == checkpoint.key(str(fasta), 'g1')
+    assert key != checkpoint.key(str(fasta), 'g2')
+    assert key not in checkpoint
+    assert checkpoint.get(key) is None
+    checkpoint.put(key, (SerovarPrediction(genome='g1', serovar='Enteritidis'), {}))
+    assert key in checkpoint
+    assert checkpoint.get(key)[0].serovar == 'Enteritidis'
+    # modified input FASTA is analyzed again
+    fasta.write('>contig_1\nACGTACGT\n')
+    assert checkpoint.key(str(fasta), 'g1') != key
+
+    assert Checkpoint(str(tmpdir.join('checkpoint')), {'qc': True}).get(key) is not None
+    with pytest.raises(CheckpointMismatchError):
+        Checkpoint(str(tmpdir.join('checkpoint')), {'qc': False})
+
+
+def test_checkpoint_resume(tmpdir, monkeypatch):
+    fastas = []
+    for i in range(4):
+        path = tmpdir.join('g{}.fasta'.format(i))
+        path.write('>contig_1\nACGT\n')
+        fastas.append(str(path))
+    analyzed = []
+    interrupt = ['g2']
+
+    def fake_sistr_predict(input_fasta, genome_name, *args):
+        if genome_name in interrupt:
+            raise KeyboardInterrupt()
+        analyzed.append(genome_name)
+        return SerovarPrediction(genome=genome_name, fasta_filepath=os.path.abspath(input_fasta)), {}
+
+    monkeypatch.setattr(sistr_cmd, 'sistr_predict', fake_sistr_predict)
+    checkpoint_dir = str(tmpdir.join('checkpoint'))
+
+    def run():
+        checkpoint = Checkpoint(checkpoint_dir, {})
+        keys = [checkpoint.key(x, os.path.basename(x)[:2]) for x in fastas]
+        todo = sistr_cmd.uncached_indices(checkpoint, keys)
+        inputs = [(x, os.path.basename(x)[:2], None, False, None, None) for x in fastas]
+        run_inputs = [(checkpoint_dir, keys[i], inputs[i]) for i in todo]
+        outputs = (sistr_cmd.sistr_predict_checkpointed_star(x) for x in run_inputs)
+        return todo, [p.genome for p, _ in sistr_cmd.cached_outputs(checkpoint, keys, inputs, todo, outputs)]
+
+    # interrupted after completing g0 and g1
+    with pytest.raises(KeyboardInterrupt):
+        run()
+    assert analyzed == ['g0', 'g1']
+    interrupt.clear()
+    todo, genomes = run()
+    assert todo == [2, 3]
+    assert genomes == ['g0', 'g1', 'g2', 'g3']
+    assert analyzed == ['g0', 'g1', 'g2', 'g3']
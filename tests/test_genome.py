@@ -0,0 +1,77 @@
+import gzip
+
+import pytest
+
+from sistr.src.blast_wrapper.helpers import retrieve_seq, NT_SUB
+from sistr.src.genome import Genome, genomes_from_multi_fasta
+from sistr.src.parsers import parse_fasta, file_sha256
+
+
+def test_genome_from_fasta(fasta_path, tmpdir):
+    genome = Genome.from_fasta(fasta_path)
+    assert genome.name == '00_0163'
+    contigs = list(parse_fasta(fasta_path))
+    assert list(genome.contigs()) == contigs
+    assert genome.size == sum(len(s) for _h, s in contigs)
+    assert genome.n_count == sum(s.upper().count('N') for _h, s in contigs)
+    stats = genome.stats()
+    assert stats['contig_count'] == len(contigs)
+    assert stats['max_contig_length'] == max(len(s) for _h, s in contigs)
+    assert stats['min_contig_length'] <= stats['n50'] <= stats['max_contig_length']
+
+    header, seq = contigs[-1]
+    assert header in genome
+    assert genome.contig(header) == seq
+    for start, end in [(0, 99), (10, 10), (len(seq) - 50, len(seq) - 1)]:
+        for needs_revcomp in [False, True]:
+            assert genome.retrieve_seq(header, start, end, needs_revcomp) == retrieve_seq(seq, start, end,
+                                                                                         needs_revcomp)
+
+    gz_path = str(tmpdir.join('genome.fasta.gz'))
+    with open(fasta_path, 'rb') as fin, gzip.open(gz_path, 'wb') as fout:
+        fout.write(fin.read())
+    assert list(Genome.from_fasta(gz_path, 'genome').contigs()) == contigs
+
+    staged_path = str(tmpdir.join('staged.fasta'))
+    genome.write_fasta(staged_path)
+    assert list(parse_fasta(staged_path)) == contigs
+
+
+def test_genome_retrieve_seq_revcomp():
+    genome = Genome('g', [('contig_1', 'ACGTNRYacgtn'), ('contig_2', 'AAAC')])
+    assert genome.size == 16
+    assert genome.n_count == 2
+    assert genome.retrieve_seq('contig_2', 0, 3, False) == 'AAAC'
+    assert genome.retrieve_seq('contig_2', 0, 3, True) == 'GTTT'
+    expected = ''.join(NT_SUB[c] for c in 'ACGTNRYacgtn'[::-1])
+    assert genome.retrieve_seq('contig_1', 0, 11, True) == expected
+    assert genome.stats()['n50'] == 12
+
+
+def test_genomes_from_multi_fasta(tmpdir):
+    path = tmpdir.join('multi.fasta')
+    path.write('>g1|contig_1\nACGT\n>g1|contig_2\nGG\n>g2|contig_1 len=3\nTTT\n')
+    genomes = list(genomes_from_multi_fasta(str(path)))
+    assert [g.name for g in genomes] == ['g1', 'g2']
+    assert genomes[0].headers == ['g1|contig_1', 'g1|contig_2']
+    assert genomes[0].size == 6
+    assert genomes[1].contig('g2|contig_1 len=3') == 'TTT'
+    assert genomes[1].fasta_path == str(path)
+
+    genomes = list(genomes_from_multi_fasta(str(path), delimiter=None, regex=r'(g\d)\|'))
+    assert [g.name for g in genomes] == ['g1', 'g2']
+    with pytest.raises(ValueError):
+        list(genomes_from_multi_fasta(str(path), regex=r'g1'))
+    path.write('>g1|a\nA\n>g2|a\nC\n>g1|b\nG\n')
+    with pytest.raises(ValueError):
+        list(genomes_from_multi_fasta(str(path)))
+
+
+def test_genome_from_fasta_sha256(tmpdir):
+    path = tmpdir.join('g.fasta.gz')
+    with gzip.open(str(path), 'wb') as fh:
+        fh.write(b'>contig_1\nACGT\n>contig_2\nGG\n')
+    genome = Genome.from_fasta(str(path))
+    assert genome.size == 6
+    assert genome.sha256 == file_sha256(str(path))
+    assert list(genomes_from_multi_fasta(str(path)))[0].sha256 is None
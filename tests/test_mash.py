@@ -1,3 +1,5 @@
+import pytest
+
 from sistr.sistr_cmd import run_mash
 
 
@@ -13,3 +15,160 @@ def test_run_mash(fasta_path):
     assert spp == 'salamae'
     assert serovar == 'II 58:l,z13,z28:z6'
     assert genome == '00_0163'
+
+
+def test_mash_dist_batch(fasta_path, tmpdir):
+    from sistr.src.mash import mash_dist_batch, mash_dist_trusted, mash_output_to_pandas_df
+
+    cache_dir = str(tmpdir.join('sketches'))
+    mash_results = mash_dist_batch([fasta_path, fasta_path], cache_dir)
+    assert list(mash_results.keys()) == [fasta_path]
+    df_single = mash_output_to_pandas_df(mash_dist_trusted(fasta_path))
+    assert [x['ref'] for x in mash_results[fasta_path].top] == list(df_single['ref'].head(n=5))
+    # cached query sketch is reused
+    assert tmpdir.join('sketches').listdir() != []
+    assert mash_dist_batch([fasta_path], cache_dir)[fasta_path].top == mash_results[fasta_path].top
+    assert run_mash(fasta_path, mash_results[fasta_path]) == run_mash(fasta_path)
+
+
+def test_parse_mash_dist(monkeypatch):
+    import numpy as np
+    from sistr.src import mash
+    from sistr.src.reference_data import ReferenceData
+
+    genomes = ['g{}'.format(i) for i in range(50)]
+    rng = np.random.RandomState(42)
+    dists = np.round(rng.uniform(0.0, 0.02, len(genomes)), 6)
+    mash_out = ''.join('/refs/{}.fasta\tquery.fasta\t{}\t0\t{}/1000\n'.format(g, d, 1000 - int(d * 10000))
+                       for g, d in zip(genomes, dists)).encode()
+    ref_data = ReferenceData(genome_serovar={g: 'serovar{}'.format(i % 3) for i, g in enumerate(genomes[:40])},
+                             genome_subspecies={g: 'enterica' if i % 4 else 'salamae' for i, g in enumerate(genomes)})
+    monkeypatch.setattr(mash, 'reference_data', lambda: ref_data)
+    monkeypatch.setattr(mash, 'mash_reference_index', lambda: mash.MashReferenceIndex())
+
+    mash_results = mash.parse_mash_dist(mash_out, top_k=5)
+    df = mash.mash_output_to_pandas_df(mash_out)
+    assert mash_results.n_hits == df.shape[0]
+    df_top_5 = df[['ref', 'dist', 'n_match', 'serovar']].head(n=5)
+    assert mash_results.top_to_dict() == df_top_5.to_dict()
+    spp, closest_distance, spp_counter = mash.mash_subspeciation(mash_results)
+    assert closest_distance == df['dist'].min()
+    expected_counter = {}
+    for genome in df['ref']:
+        subspecies = ref_data.genome_subspecies[genome]
+        expected_counter[subspecies] = expected_counter.get(subspecies, 0) + 1
+    assert spp_counter == expected_counter
+    assert spp == 'enterica'
+
+    empty_results = mash.parse_mash_dist(b'/refs/g1.fasta\tquery.fasta\t0.5\t0\t1/1000\n')
+    assert empty_results.empty
+    assert mash.mash_subspeciation(empty_results) is None
+
+
+def test_run_mash_top_hit(monkeypatch):
+    from sistr.src import mash
+    from sistr.src.reference_data import ReferenceData
+
+    genomes = ['g{}'.format(i) for i in range(8)]
+    dists = [0.004, 0.002, 0.007, 0.001, 0.003, 0.005, 0.0015, 0.006]
+    ref_data = ReferenceData(genome_serovar={g: 'serovar{}'.format(i) for i, g in enumerate(genomes)},
+                             genome_subspecies={g: 'enterica' for g in genomes})
+    monkeypatch.setattr(mash, 'reference_data', lambda: ref_data)
+    monkeypatch.setattr(mash, 'mash_reference_index', lambda: mash.MashReferenceIndex())
+
+    def mash_out(dists):
+        return ''.join('/refs/{}.fasta\tquery.fasta\t{}\t0\t{}/1000\n'.format(g, d, 1000 - int(d * 10000))
+                       for g, d in zip(genomes, dists)).encode()
+
+    # the closest reference genome, i.e. the first row of the top 5 table in previous versions (not the 5th)
+    result = run_mash('query.fasta', mash_out(dists))
+    df_top_5 = mash.mash_output_to_pandas_df(mash_out(dists))[['ref', 'dist', 'n_match', 'serovar']].head(n=5)
+    baseline = df_top_5.iloc[0]
+    assert (result['mash_genome'], result['mash_serovar'], result['mash_distance'], result['mash_match']) == \
+           (baseline['ref'], baseline['serovar'], baseline['dist'], baseline['n_match'])
+    assert result['mash_genome'] == 'g3'
+    assert result['mash_top_5'] == df_top_5.to_dict()
+    # ties go to the first tied genome in mash dist output
+    result = run_mash('query.fasta', mash_out([0.004, 0.002, 0.007, 0.002, 0.003, 0.005, 0.002, 0.006]))
+    assert result['mash_genome'] == 'g1'
+
+
+FAKE_MASH = """#!{python}
+import os, sys
+cmd, args = sys.argv[1], sys.argv[2:]
+if cmd == 'info':
+    print('K-mer size: 21\\nSketch size: 1000')
+elif cmd == 'sketch':
+    with open(args[args.index('-o') + 1] + '.msh', 'w') as fh:
+        fh.write(args[-1] + '\\n')
+elif cmd == 'paste':
+    with open(args[1] + '.msh', 'w') as fout:
+        for path in open(args[2]).read().split():
+            fout.write(open(path).read())
+elif cmd == 'dist':
+    for query in open(args[-1]).read().split():
+        n = int(query[0], 16)
+        for i in range(8):
+            sys.stdout.write('/refs/g{{}}.fasta\\t{{}}\\t{{}}\\t0\\t{{}}/1000\\n'.format(i, query, (i + n) / 10000.0, 900 - i))
+"""
+
+
+def test_mash_dist_batch_streamed(tmpdir, monkeypatch):
+    import sys
+    from sistr.src import mash
+    from sistr.src.parsers import file_sha256
+    from sistr.src.reference_data import ReferenceData
+
+    genomes = ['g{}'.format(i) for i in range(8)]
+    ref_data = ReferenceData(genome_serovar={g: 'serovar{}'.format(i) for i, g in enumerate(genomes)},
+                             genome_subspecies={g: 'enterica' for g in genomes})
+    monkeypatch.setattr(mash, 'reference_data', lambda: ref_data)
+    monkeypatch.setattr(mash, 'mash_reference_index', lambda: mash.MashReferenceIndex())
+    fake_mash = tmpdir.join('mash')
+    fake_mash.write(FAKE_MASH.format(python=sys.executable))
+    fake_mash.chmod(0o755)
+    monkeypatch.setattr(mash, 'MASH_BIN', str(fake_mash))
+
+    fastas = []
+    for i in range(3):
+        path = tmpdir.join('q{}.fasta'.format(i))
+        path.write('>contig_1\n' + 'ACGT' * (i + 1) + '\n')
+        fastas.append(str(path))
+    cache_dir = str(tmpdir.join('sketches'))
+    results = mash.mash_dist_batch(fastas + fastas[:1], cache_dir, top_k=2)
+    assert list(results) == fastas
+    for path in fastas:
+        offset = int(file_sha256(path)[0], 16)
+        assert [x['ref'] for x in results[path].top] == ['g0', 'g1']
+        assert results[path].closest_distance == offset / 10000.0
+        assert results[path].n_hits == 8
+        assert run_mash(path, results[path])['mash_genome'] == 'g0'
+    # only the cached query sketches are left in the shared cache directory
+    assert sorted(x.basename for x in tmpdir.join('sketches').listdir()) == \
+           sorted(file_sha256(x) + '.msh' for x in fastas)
+    # digests already computed (e.g. by the pre-flight check) are not recomputed
+    sha256s = {x: file_sha256(x) for x in fastas}
+    monkeypatch.setattr(mash, 'file_sha256', lambda path: pytest.fail('hashed {}'.format(path)))
+    reused = mash.mash_dist_batch(fastas, cache_dir, top_k=2, sha256s=sha256s)
+    assert [reused[x].top for x in fastas] == [results[x].top for x in fastas]
+
+
+def test_mash_subspeciation_dataframe(monkeypatch):
+    from sistr.src import mash
+    from sistr.src.reference_data import ReferenceData
+
+    genomes = ['g{}'.format(i) for i in range(6)]
+    ref_data = ReferenceData(genome_serovar={g: 'serovar{}'.format(i) for i, g in enumerate(genomes)},
+                             genome_subspecies={g: 'enterica' if i % 3 else 'salamae' for i, g in enumerate(genomes)})
+    monkeypatch.setattr(mash, 'reference_data', lambda: ref_data)
+    monkeypatch.setattr(mash, 'mash_reference_index', lambda: mash.MashReferenceIndex())
+    dists = [0.004, 0.002, 0.02, 0.001, 0.002, 0.008]
+    mash_out = ''.join('/refs/{}.fasta\tquery.fasta\t{}\t0\t{}/1000\n'.format(g, d, 900 - i)
+                       for i, (g, d) in enumerate(zip(genomes, dists))).encode()
+    results = mash.parse_mash_dist(mash_out, top_k=3)
+    df_results = mash.MashResults.from_dataframe(mash.mash_output_to_pandas_df(mash_out), top_k=3)
+    assert df_results.top == results.top
+    assert df_results.top_to_dict() == results.top_to_dict()
+    assert list(df_results.subspecies_counter.items()) == list(results.subspecies_counter.items())
+    assert mash.mash_subspeciation(mash.mash_output_to_pandas_df(mash_out)) == mash.mash_subspeciation(results) == \
+           ('enterica', 0.001, {'enterica': 3, 'salamae': 2})
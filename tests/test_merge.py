@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from sistr import sistr_cmd
+from sistr.src.merge import merge_novel_alleles, parse_shard, shard_inputs
+from sistr.src.parsers import parse_fasta
+from sistr.src.readers import read_alleles, read_cgmlst_profiles, read_predictions
+from sistr.src.writers import AllelesJsonWriter, CgmlstProfilesWriter
+
+
+def test_parse_shard():
+    assert parse_shard('1/1') == (1, 1)
+    assert parse_shard('3/8') == (3, 8)
+    for spec in ['0/4', '5/4', '1/0', '1', 'a/b', '1/2/3']:
+        with pytest.raises(ValueError):
+            parse_shard(spec)
+
+
+def test_shard_inputs():
+    names = ['g{}'.format(i) for i in range(10)]
+    fastas = [name + '.fasta' for name in names]
+    # shards do not depend on input order
+    shuffled = list(zip(fastas, names))[::-1]
+    shards = [shard_inputs([f for f, _ in shuffled], [n for _, n in shuffled], i, 3) for i in range(1, 4)]
+    assert [len(names) for _, names in shards] == [3, 3, 4]
+    assert sum((names for _, names in shards), []) == names
+    assert [f[:-6] for f in shards[1][0]] == shards[1][1]
+    # more shards than inputs
+    assert shard_inputs(fastas[:1], names[:1], 1, 2) == ([], [])
+    assert shard_inputs(fastas[:1], names[:1], 2, 2) == (fastas[:1], names[:1])
+
+
+def _alleles(allele_name):
+    return {'NZ_AOXE01000059.1_8': {'name': allele_name,
+                                    'seq': 'ACGT',
+                                    'blast_result': None}}
+
+
+def test_merge(tmpdir):
+    shard_outputs = {1: ['g3', 'g1'], 2: ['g2', 'g3']}
+    for shard, genomes in shard_outputs.items():
+        with open(str(tmpdir.join('predictions_{}.json'.format(shard))), 'w') as fh:
+            json.dump([{'genome': g, 'serovar': 'Enteritidis', 'shard': shard} for g in genomes], fh)
+        with CgmlstProfilesWriter(str(tmpdir.join('profiles_{}.csv'.format(shard))),
+                                  ['NZ_AOXE01000059.1_8']) as writer:
+            for i, g in enumerate(genomes):
+                writer.write(g, _alleles(shard * 10 + i))
+        with AllelesJsonWriter(str(tmpdir.join('alleles_{}.json'.format(shard)))) as writer:
+            for i, g in enumerate(genomes):
+                writer.write(g, _alleles(shard * 10 + i))
+        tmpdir.join('novel_{}.fasta'.format(shard)).write('>m2|{0}\nAAA\n>m1|{0}\nCCC\n>m1|7\nGGG\n'.format(shard))
+
+    def paths(prefix, ext):
+        return [str(tmpdir.join('{}_{}.{}'.format(prefix, shard, ext))) for shard in shard_outputs]
+
+    sistr_cmd.main_merge(['-P'] + paths('predictions', 'json') +
+                         ['-p'] + paths('profiles', 'csv') +
+                         ['-a'] + paths('alleles', 'json') +
+                         ['-n'] + paths('novel', 'fasta') +
+                         ['-o', str(tmpdir.join('merged')),
+                          '-f', 'csv',
+                          '--output-cgmlst-profiles', str(tmpdir.join('merged_profiles.csv')),
+                          '--output-alleles', str(tmpdir.join('merged_alleles.json')),
+                          '--output-novel-alleles', str(tmpdir.join('merged_novel.fasta'))])
+
+    predictions = read_predictions(str(tmpdir.join('merged.csv')))
+    assert [p['genome'] for p in predictions] == ['g1', 'g2', 'g3']
+    # first of duplicate genomes kept
+    assert predictions[2]['shard'] == '1'
+    df_profiles = read_cgmlst_profiles(str(tmpdir.join('merged_profiles.csv')))
+    assert list(df_profiles.index) == ['g1', 'g2', 'g3']
+    assert list(df_profiles['NZ_AOXE01000059.1_8']) == [11, 20, 10]
+    alleles = read_alleles(str(tmpdir.join('merged_alleles.json')))
+    # inputs are overlapping (not shards of one batch) so allele results are only ordered within each input
+    assert list(alleles) == ['g1', 'g3', 'g2']
+    assert alleles['g3'] == _alleles(10)
+    assert list(parse_fasta(str(tmpdir.join('merged_novel.fasta')))) == [('m1|1', 'CCC'),
+                                                                          ('m1|2', 'CCC'),
+                                                                          ('m1|7', 'GGG'),
+                                                                          ('m2|1', 'AAA'),
+                                                                          ('m2|2', 'AAA')]
+
+    sistr_cmd.main_merge(['-a'] + paths('alleles', 'json') +
+                         ['--output-alleles', str(tmpdir.join('merged_compact.json')),
+                          '--alleles-format', 'compact'])
+    compact_alleles = read_alleles(str(tmpdir.join('merged_compact.json')))
+    assert list(compact_alleles) == ['g1', 'g3', 'g2']
+    assert {g: r['NZ_AOXE01000059.1_8']['name'] for g, r in compact_alleles.items()} == {'g1': 11, 'g2': 20,
+                                                                                       'g3': 10}
+
+
+def test_merge_novel_alleles_conflict(tmpdir):
+    tmpdir.join('a.fasta').write('>m1|1\nACGT\n')
+    tmpdir.join('b.fasta').write('>m1|1\nTTTT\n>m1|2\nAC\n')
+    dest = str(tmpdir.join('merged.fasta'))
+    assert merge_novel_alleles([str(tmpdir.join('a.fasta')), str(tmpdir.join('b.fasta'))], dest) == 2
+    assert list(parse_fasta(dest)) == [('m1|1', 'ACGT'), ('m1|2', 'AC')]
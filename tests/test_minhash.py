@@ -0,0 +1,86 @@
+import numpy as np
+
+from sistr.src.minhash import murmurhash3_x64_64, canonical_kmers, sketch_fasta, ReferenceSketch, native_mash_dist, \
+    UnsupportedSketchError
+
+
+def naive_mash_compare(ref, query, sketch_size):
+    """Mash `compareSketches` merge of sorted reference and query hashes"""
+    i = j = common = denom = 0
+    while denom < sketch_size and i < len(ref) and j < len(query):
+        if ref[i] < query[j]:
+            i += 1
+        elif ref[i] > query[j]:
+            j += 1
+        else:
+            i += 1
+            j += 1
+            common += 1
+        denom += 1
+    if denom < sketch_size:
+        denom += (len(ref) - i) + (len(query) - j)
+        denom = min(denom, sketch_size)
+    return common, denom
+
+
+def test_murmurhash3():
+    keys = np.frombuffer(b'hello', dtype=np.uint8).reshape(1, 5)
+    assert int(murmurhash3_x64_64(keys, seed=0)[0]) == 0xcbd8a7b341bd9b02
+    keys = np.frombuffer(b'ACGTACGTACGTACGTACGTA', dtype=np.uint8).reshape(1, 21)
+    assert int(murmurhash3_x64_64(keys, seed=42)[0]) == 0xb4e9c495b633d387
+
+
+def test_canonical_kmers():
+    kmers = canonical_kmers(b'ACGTNAAAACCC', 3)
+    assert [bytes(x) for x in kmers] == [b'ACG', b'ACG', b'AAA', b'AAA', b'AAC', b'ACC', b'CCC']
+
+
+def test_reference_sketch_distances():
+    rng = np.random.RandomState(1)
+    sketch_size = 50
+    pool = np.unique(rng.randint(0, 2 ** 62, size=400, dtype=np.int64).astype(np.uint64))
+    query = np.sort(rng.choice(pool, sketch_size, replace=False))
+    refs = [np.sort(rng.choice(pool, n, replace=False)) for n in (sketch_size, sketch_size, 20, 0)]
+    refs.append(query)
+    sketch = ReferenceSketch.from_mash_json({'kmer': 21,
+                                             'sketchSize': sketch_size,
+                                             'sketches': [{'name': 'ref{}'.format(i), 'hashes': [int(x) for x in ref]}
+                                                          for i, ref in enumerate(refs)]})
+    dists, common, denom = sketch.distances(query)
+    for i, ref in enumerate(refs):
+        assert (common[i], denom[i]) == naive_mash_compare(ref, query, sketch_size)
+    assert dists[-1] == 0.0
+    assert dists[3] == 1.0
+
+
+def test_reference_sketch_unsupported_hashes(tmpdir):
+    import pytest
+    sketch_json = {'kmer': 21, 'hashBits': 64, 'sketchSize': 2, 'sketches': [{'name': 'ref', 'hashes': [1, 2]}]}
+    sketch = ReferenceSketch.from_mash_json(sketch_json)
+    sketch.save(str(tmpdir.join('sketch.npz')))
+    assert ReferenceSketch.load(str(tmpdir.join('sketch.npz'))).kmer_size == 21
+    # Mash uses 32-bit hashes for k <= 16
+    for params in [{'hashBits': 32}, {'kmer': 16, 'hashBits': 32}, {'kmer': 16, 'hashBits': 64}, {'kmer': 33}]:
+        with pytest.raises(UnsupportedSketchError):
+            ReferenceSketch.from_mash_json(dict(sketch_json, **params))
+    sketch.kmer_size = 12
+    sketch.save(str(tmpdir.join('sketch_k12.npz')))
+    with pytest.raises(UnsupportedSketchError):
+        ReferenceSketch.load(str(tmpdir.join('sketch_k12.npz')))
+
+
+def test_native_mash_dist_concordance(fasta_path):
+    """Native distances match `mash dist` of the genome against the SISTR reference sketch"""
+    from sistr.src.mash import mash_dist_trusted, MASH_SKETCH_FILE
+    from sistr.src.minhash import reference_sketch
+
+    ref_sketch = reference_sketch(MASH_SKETCH_FILE)
+    query = sketch_fasta(fasta_path, ref_sketch.kmer_size, ref_sketch.sketch_size, ref_sketch.seed)
+    assert query.size == ref_sketch.sketch_size
+    native = [line.split('\t') for line in native_mash_dist(fasta_path, ref_sketch).decode().splitlines()]
+    expected = [line.split('\t') for line in mash_dist_trusted(fasta_path).decode().splitlines()]
+    assert len(native) == len(expected)
+    for (ref, _, dist, _, matching), (exp_ref, _, exp_dist, _, exp_matching) in zip(native, expected):
+        assert ref == exp_ref
+        assert matching == exp_matching
+        assert abs(float(dist) - float(exp_dist)) < 1e-6
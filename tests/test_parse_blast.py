@@ -1,8 +1,9 @@
 import os
+import numpy as np
 import pandas as pd
 import shutil
 
-from sistr.src.blast_wrapper import BlastRunner, BLAST_TABLE_COLS, BlastReader
+from sistr.src.blast_wrapper import BlastRunner, BLAST_TABLE_COLS, BLAST_TABLE_COLS_NO_SSEQ, BlastReader, BlastHits
 from sistr.src.serovar_prediction import WZX_FASTA_PATH, get_antigen_name, SerovarPredictor
 
 
@@ -87,3 +88,60 @@ def test_SerovarPredictor(blast_runner):
     assert sp.h1 == 'l,z13,z28'
     assert sp.h2 == 'z6'
     assert sp.serovar == 'II 58:l,z13,z28:z6'
+
+
+def test_BlastReader_refilter(tmp_path):
+    blast_outfile = tmp_path / 'fliC.blast'
+    rows = [
+        ['fliC|1|l,z13,z28', 'contig_1', 100.0, 1000, 0, 0, 1, 1000, 101, 1100, 0.0, 1800.0, 1000, 50000, 'ATGC'],
+        ['fliC|2|z6', 'contig_1', 99.0, 1000, 10, 0, 1, 1000, 101, 1100, 0.0, 1700.0, 1000, 50000, 'ATGC'],
+        ['fliC|3|N/A', 'contig_1', 100.0, 1000, 0, 0, 1, 1000, 101, 1100, 0.0, 1900.0, 1000, 50000, 'ATGC'],
+    ]
+    blast_outfile.write_text('\n'.join('\t'.join(str(x) for x in r) for r in rows) + '\n')
+    blast_reader = BlastReader(str(blast_outfile), ['N/A'])
+    assert list(blast_reader.df['qseqid']) == ['fliC|1|l,z13,z28', 'fliC|2|z6']
+    # re-filtering applies the new filter to all parsed results without affecting the original reader
+    refiltered = blast_reader.refilter(['l,z13,z28'])
+    assert list(refiltered.df['qseqid']) == ['fliC|3|N/A', 'fliC|2|z6']
+    assert get_antigen_name(refiltered.top_result()['qseqid']) == 'N/A'
+    assert list(blast_reader.df['qseqid']) == ['fliC|1|l,z13,z28', 'fliC|2|z6']
+
+
+def test_BlastHits_sort_matches_pandas():
+    df = pd.DataFrame({'qseqid': ['a', 'b', 'c', 'd', 'e', 'f'],
+                       'mismatch': [3, 1, 3, 0, 1, 3],
+                       'bitscore': [90.0, 95.5, 95.5, 80.0, 90.0, 95.5]})
+    hits = BlastHits.from_df(df)
+    for col in ['mismatch', 'bitscore']:
+        for ascending in [True, False]:
+            exp = list(df.sort_values(by=col, ascending=ascending)['qseqid'])
+            assert list(hits.sort_by(col, ascending=ascending)['qseqid']) == exp
+    selected = hits.take(hits['mismatch'] <= 1)
+    assert len(selected) == 3
+    assert selected.row() == {'qseqid': 'b', 'mismatch': 1, 'bitscore': 95.5}
+    assert isinstance(selected.row()['mismatch'], int)
+
+
+def test_BlastReader_columns(tmp_path):
+    blast_outfile = tmp_path / 'wzx.blast'
+    blast_outfile.write_text('wzx|1|O:58\tcontig_1\t100.000\t1200\t0\t0\t1\t1200\t1\t1200\t0.0\t2217\t1200\t50000\tATGC\n')
+    blast_reader = BlastReader(str(blast_outfile), columns=BLAST_TABLE_COLS_NO_SSEQ)
+    assert 'sseq' not in blast_reader.df.columns
+    assert blast_reader.df['bitscore'].dtype == np.float64
+    assert blast_reader.df['sstart'].dtype == np.int64
+    top_result = blast_reader.top_result()
+    assert not top_result['is_trunc']
+    assert blast_reader.is_perfect_match
+
+    # blastn output with only the requested columns
+    lean_outfile = tmp_path / 'wzx_lean.blast'
+    lean_outfile.write_text('wzx|1|O:58\tcontig_1\t100.000\t1200\t0\t0\t1\t1200\t1\t1200\t0.0\t2217\t1200\t50000\n')
+    lean_reader = BlastReader(str(lean_outfile), columns=BLAST_TABLE_COLS_NO_SSEQ, file_columns=BLAST_TABLE_COLS_NO_SSEQ)
+    assert lean_reader.top_result() == top_result
+
+    empty_outfile = tmp_path / 'empty.blast'
+    empty_outfile.write_text('')
+    blast_reader = BlastReader(str(empty_outfile))
+    assert blast_reader.is_missing
+    assert blast_reader.df is None
+    assert blast_reader.top_result() is None
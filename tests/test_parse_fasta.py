@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import random
+import re
+
+import pytest
+
+from sistr.src.parsers import parse_fasta, parse_fasta_lines, fasta_content_summary, file_sha256, FastaFormatError
+
+
+FASTA_CASES = [
+    '',
+    '>only_header\n',
+    '>contig_1 some description\nACGT\nacgtN\n>contig_2\nGGGG\n',
+    '>contig_1\r\nACGT\r\nACGT\r\n>contig_2\r\nTT\r\n',
+    '>contig_1\rACGT\rAC\r>contig_2\rTT',
+    'ACGT\n>first\nGG\n',
+    '\n\n>contig_1\n\nAC GT \n  \n\tTT\n >indented\nCC\n>\n>x>y\nAA>CC\n',
+    '>contig_1\nACGT',
+]
+
+
+@pytest.mark.parametrize('content', FASTA_CASES)
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1 << 22])
+def test_parse_fasta_matches_line_parser(tmpdir, content, chunk_size):
+    path = str(tmpdir.join('x.fasta'))
+    with open(path, 'w', newline='') as fh:
+        fh.write(content)
+    expected = list(parse_fasta_lines(path))
+    assert list(parse_fasta(path, chunk_size=chunk_size)) == expected
+    gz_path = str(tmpdir.join('x.fasta.gz'))
+    with gzip.open(gz_path, 'wb') as fh:
+        fh.write(content.encode())
+    assert list(parse_fasta(gz_path, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize('content', FASTA_CASES)
+@pytest.mark.parametrize('chunk_size', [3, 1 << 22])
+def test_parse_fasta_sha256(tmpdir, content, chunk_size):
+    path = str(tmpdir.join('x.fasta'))
+    with open(path, 'w', newline='') as fh:
+        fh.write(content)
+    gz_path = str(tmpdir.join('x.fasta.gz'))
+    with gzip.open(gz_path, 'wb') as fh:
+        fh.write(content.encode())
+    for p in [path, gz_path]:
+        sha = hashlib.sha256()
+        list(parse_fasta(p, chunk_size=chunk_size, sha=sha))
+        assert sha.hexdigest() == file_sha256(p)
+
+
+def test_parse_fasta_random(tmpdir):
+    rng = random.Random(7)
+    lines = []
+    for i in range(300):
+        lines.append('>contig_{} len={}'.format(i, rng.randint(1, 1000)))
+        for _ in range(rng.randint(0, 5)):
+            lines.append(''.join(rng.choice('ACGTN') for _ in range(rng.randint(0, 80))))
+    path = str(tmpdir.join('random.fasta'))
+    with open(path, 'w') as fh:
+        fh.write('\n'.join(lines) + '\n')
+    expected = list(parse_fasta_lines(path))
+    assert len(expected) == 300
+    for chunk_size in [5, 101, 4096]:
+        assert list(parse_fasta(path, chunk_size=chunk_size)) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [3, 1 << 20])
+def test_fasta_content_summary(tmpdir, chunk_size):
+    path = tmpdir.join('ok.fasta')
+    path.write_binary(b'\n>contig_1\r\nACGTN\r\nacgt\r\n  >contig_2\nRYKM \n')
+    summary = fasta_content_summary(str(path), chunk_size=chunk_size)
+    assert summary['contigs'] == 2
+    assert summary['genome_size'] == 13
+    assert summary['sha256'] == file_sha256(str(path))
+    gz_path = str(tmpdir.join('ok.fasta.gz'))
+    with gzip.open(gz_path, 'wb') as fh:
+        fh.write(path.read_binary())
+    assert summary['file_sha256'] == summary['sha256']
+    gz_summary = fasta_content_summary(gz_path, chunk_size=chunk_size)
+    assert gz_summary['file_sha256'] == file_sha256(gz_path)
+    assert dict(gz_summary, file_sha256=summary['file_sha256']) == summary
+
+    for content, error in [('ACGT\n>contig_1\nACGT\n', 'First non-blank line (L:1)'),
+                           ('>contig_1\nACGT\nAC GT\n', 'Line 3 contains the following non-nucleotide characters:  '),
+                           ('>contig_1\nACGT\n>contig_2\nAC-T\n', 'Line 4 contains the following non-nucleotide characters: -'),
+                           ('>contig_1\n\n', 'does not contain any nucleotide sequence'),
+                           ('', 'does not contain any nucleotide sequence')]:
+        path.write(content)
+        with pytest.raises(FastaFormatError, match=re.escape(error)):
+            fasta_content_summary(str(path), chunk_size=chunk_size)
@@ -0,0 +1,40 @@
+import gzip
+import json
+
+from sistr.src.preflight import preflight_check, write_manifest
+
+
+def test_preflight_check(tmpdir):
+    paths = []
+    for name, content in [('a', '>contig_1\nACGT\n'),
+                          ('b', '>contig_1\nACGTZ?\n'),
+                          ('c', '>contig_1\nACGT\n')]:
+        path = tmpdir.join(name + '.fasta')
+        path.write(content)
+        paths.append(str(path))
+    paths.append(str(tmpdir.join('missing.fasta')))
+    names = ['a', 'b', 'c', 'missing']
+    for threads in [1, 2]:
+        manifest = preflight_check(paths, names, threads=threads)
+        assert [x['valid'] for x in manifest] == [True, False, True, False]
+        assert manifest[0]['genome_size'] == 4
+        assert manifest[0]['contigs'] == 1
+        assert manifest[0]['file_size'] == 15
+        assert '?, Z' in manifest[1]['error']
+        assert manifest[2]['duplicate_of'] == 'a'
+        assert manifest[0]['duplicate_of'] is None
+    manifest_path = str(tmpdir.join('manifest.json'))
+    write_manifest(manifest, manifest_path)
+    with open(manifest_path) as fh:
+        assert json.load(fh) == manifest
+
+
+def test_preflight_check_corrupt_gzip(tmpdir):
+    content = gzip.compress(b'>contig_1\n' + b'ACGT' * 10000 + b'\n')
+    truncated = tmpdir.join('truncated.fasta.gz')
+    truncated.write_binary(content[:len(content) // 2])
+    corrupt = tmpdir.join('corrupt.fasta.gz')
+    corrupt.write_binary(content[:20] + b'\xff' * 100 + content[120:])
+    manifest = preflight_check([str(truncated), str(corrupt)], ['truncated', 'corrupt'])
+    assert [x['valid'] for x in manifest] == [False, False]
+    assert all(x['error'] for x in manifest)
@@ -0,0 +1,28 @@
+import pytest
+
+from sistr.src.reference_data import GenomeCategories, ReferenceData
+
+
+def test_genome_categories():
+    genome_serovar = {'g3': 'Typhimurium', 'g1': 'Enteritidis', 'g2': 'Typhimurium', 'g10': 'Heidelberg'}
+    categories = GenomeCategories(genome_serovar)
+    assert len(categories) == 4
+    for genome, serovar in genome_serovar.items():
+        assert genome in categories
+        assert categories[genome] == serovar
+    assert 'g4' not in categories
+    assert categories.get('g4') is None
+    with pytest.raises(KeyError):
+        categories['g0']
+    assert categories.lookup(['g2', 'zzz', 'g1', 'a'], default='nan') == ['Typhimurium', 'nan', 'Enteritidis', 'nan']
+    assert categories.lookup([]) == []
+
+
+def test_serovar_list_read_once(tmp_path):
+    serovar_list_path = tmp_path / 'serovars.txt'
+    serovar_list_path.write_text('Typhimurium\nEnteritidis\n')
+    ref = ReferenceData(genome_serovar={}, genome_subspecies={})
+    assert ref.serovar_list(str(serovar_list_path)) == ['Typhimurium', 'Enteritidis']
+    serovar_list_path.unlink()
+    assert ref.serovar_list(str(serovar_list_path)) == ['Typhimurium', 'Enteritidis']
+    assert ref.serovar_list(str(tmp_path / 'missing.txt')) is None
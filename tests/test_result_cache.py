@@ -0,0 +1,65 @@
+import os
+import time
+
+import pytest
+
+from sistr.src.result_cache import ResultCache, parse_size
+from sistr.src.serovar_prediction import SerovarPrediction
+
+
+def test_parse_size():
+    assert parse_size(None) is None
+    assert parse_size('1024') == 1024
+    assert parse_size('500M') == 500 * 2 ** 20
+    assert parse_size('1.5g') == int(1.5 * 2 ** 30)
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_result_cache(tmpdir):
+    cache = ResultCache(str(tmpdir.join('cache')))
+    key = cache.key('abc', {'qc': True})
+    assert key == cache.key('abc', {'qc': True})
+    assert key != cache.key('abc', {'qc': False})
+    assert key != cache.key('abd', {'qc': True})
+    assert key not in cache
+    assert cache.get(key) is None
+    result = (SerovarPrediction(genome='g1', serovar='Enteritidis'), {'m1': {'name': 1, 'seq': 'A', 'blast_result': None}})
+    cache.put(key, result)
+    assert key in cache
+    prediction, cgmlst_results = cache.get(key)
+    assert prediction.serovar == 'Enteritidis'
+    assert cgmlst_results == result[1]
+    assert cache.hits == 1
+
+
+def test_result_cache_lru_eviction(tmpdir):
+    cache = ResultCache(str(tmpdir.join('cache')))
+    keys = [cache.key(str(i), {}) for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, (SerovarPrediction(genome='g{}'.format(i)), None))
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    # use the oldest result so that the second result is the least recently used
+    cache.get(keys[0])
+    entry_size = os.path.getsize(cache._path(keys[0]))
+    assert cache.evict(2 * entry_size) == 1
+    assert keys[0] in cache
+    assert keys[1] not in cache
+    assert keys[2] in cache
+
+
+def test_cached_outputs(tmpdir):
+    from sistr.sistr_cmd import cached_outputs
+
+    cache = ResultCache(str(tmpdir.join('cache')))
+    cached_key = cache.key('cached', {})
+    cache.put(cached_key, (SerovarPrediction(genome='old_name', serovar='Typhimurium'), None))
+    keys = ['a', 'b', 'a', None, cached_key]
+    inputs = [('/data/{}.fasta'.format(x), x, None, None, None, None) for x in ['g1', 'g2', 'g1_copy', 'g3', 'g4']]
+    run_indices = [0, 1, 3]
+    outputs = iter([(SerovarPrediction(genome=genome, serovar=genome), None) for genome in ['g1', 'g2', 'g3']])
+    results = list(cached_outputs(cache, keys, inputs, run_indices, outputs))
+    assert [x.genome for x, _ in results] == ['g1', 'g2', 'g1_copy', 'g3', 'g4']
+    assert [x.serovar for x, _ in results] == ['g1', 'g2', 'g1', 'g3', 'Typhimurium']
+    assert results[4][0].fasta_filepath == '/data/g4.fasta'
+    assert 'a' in cache and 'b' in cache
@@ -0,0 +1,53 @@
+import pickle
+import sqlite3
+
+import numpy as np
+
+from sistr.src.parsers import file_sha256
+from sistr.src.results_db import ResultsDatabase
+from sistr.src.serovar_prediction import SerovarPrediction
+from sistr.src.writers import prediction_to_output_dict
+
+
+def test_results_db(tmpdir):
+    fasta = tmpdir.join('g1.fasta')
+    fasta.write('>contig1\nACGT\n')
+    db_path = str(tmpdir.join('results.sqlite'))
+    for run in range(2):
+        with ResultsDatabase(db_path, batch_size=2) as db:
+            for i in range(3):
+                prediction = SerovarPrediction(genome='g{}'.format(i),
+                                               serovar='Enteritidis',
+                                               cgmlst_ST=np.int64(3000000000 + i))
+                prediction.fasta_filepath = str(fasta)
+                prediction.input_sha256 = file_sha256(str(fasta))
+                prediction.qc_status = 'PASS'
+                db.write(prediction, {'m1': {'name': 4294967295}, 'm2': {'name': None}})
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM runs').fetchone() == (2,)
+    rows = conn.execute('SELECT run_id, serovar, qc_status, input_sha256 FROM predictions WHERE cgmlst330_ST = ?',
+                        (3000000001,)).fetchall()
+    assert rows == [(1, 'Enteritidis', 'PASS', file_sha256(str(fasta))),
+                    (2, 'Enteritidis', 'PASS', file_sha256(str(fasta)))]
+    alleles = conn.execute('SELECT marker, allele FROM cgmlst_alleles WHERE prediction_id = 1 ORDER BY marker').fetchall()
+    assert alleles == [('m1', 4294967295), ('m2', None)]
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT * FROM predictions WHERE genome = ?', ('g1',)).fetchall()
+    assert 'predictions_genome' in str(plan)
+
+
+def test_results_db_without_input_hash(tmpdir):
+    prediction = SerovarPrediction(genome='g1', fasta_filepath=str(tmpdir.join('g1.fasta')))
+    prediction.input_sha256 = 'abc'
+    # carried with the prediction (e.g. through worker processes and result caches) but not output
+    assert pickle.loads(pickle.dumps(prediction)).input_sha256 == 'abc'
+    assert 'input_sha256' not in prediction_to_output_dict(prediction, 2)
+    db_path = str(tmpdir.join('results.sqlite'))
+    with ResultsDatabase(db_path) as db:
+        # genomes from stdin (multi-genome FASTA "-") or re-made from saved outputs have no input hash and the
+        # input FASTA is not read (it may be missing)
+        db.write(SerovarPrediction(genome='g1', fasta_filepath='-'))
+        db.write(SerovarPrediction(genome='g2', fasta_filepath=str(tmpdir.join('missing.fasta'))))
+        db.write(prediction)
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute('SELECT genome, input_sha256 FROM predictions ORDER BY id').fetchall()
+    assert rows == [('g1', None), ('g2', None), ('g1', 'abc')]
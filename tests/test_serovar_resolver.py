@@ -0,0 +1,34 @@
+import pandas as pd
+
+from sistr.src.serovar_prediction import SerovarResolver
+
+
+def serovar_table_df():
+    return pd.DataFrame([
+        {'Serovar': 'Paratyphi A', 'subspecies': 'enterica', 'Serogroup': 'A', 'O_antigen': '1,2,12', 'H1': 'a', 'H2': '[1,5]', 'can_h2_be_missing': True},
+        {'Serovar': 'Typhi', 'subspecies': 'enterica', 'Serogroup': 'D1', 'O_antigen': '9,12', 'H1': 'd', 'H2': '-', 'can_h2_be_missing': True},
+        {'Serovar': 'Enteritidis', 'subspecies': 'enterica', 'Serogroup': 'D1', 'O_antigen': '1,9,12', 'H1': 'g,m', 'H2': '-', 'can_h2_be_missing': True},
+        {'Serovar': 'Sendai', 'subspecies': 'enterica', 'Serogroup': 'D1', 'O_antigen': '1,9,12', 'H1': 'a', 'H2': '1,5', 'can_h2_be_missing': False},
+        {'Serovar': 'II 58:l,z13,z28:z6', 'subspecies': 'salamae', 'Serogroup': 'O:58', 'O_antigen': '58', 'H1': 'l,z13,z28', 'H2': 'z6', 'can_h2_be_missing': False},
+    ])
+
+
+def test_resolver_get_serovar():
+    resolver = SerovarResolver(serovar_table_df())
+    sg = resolver.expand_serogroup('D1')
+    assert sg == ['A', 'D1', 'D2']
+    assert resolver.get_serovar(sg, ['a'], ['1,5'], None) == 'Sendai'
+    # H2 missing matches serovars where H2 can be missing; results in table order
+    assert resolver.get_serovar(sg, ['a', 'd'], ['-'], 'enterica') == 'Paratyphi A|Typhi'
+    assert resolver.get_serovar(sg, ['a'], ['-'], 'salamae') is None
+    assert resolver.get_serovar(resolver.expand_serogroup(None), resolver.expand_h1(None), ['z6'], None) == 'II 58:l,z13,z28:z6'
+    # expansions are copies so callers cannot mutate the similarity groups
+    sg.pop()
+    assert resolver.expand_serogroup('D1') == ['A', 'D1', 'D2']
+
+
+def test_resolver_serovar_lookups():
+    resolver = SerovarResolver(serovar_table_df())
+    assert resolver.lookup_serovar_antigens('Sendai') == {'spp': 'enterica', 'sg': 'D1', 'h1': 'a', 'h2': '1,5'}
+    assert resolver.o_antigen('Enteritidis') == '1,9,12'
+    assert resolver.o_antigen('Not A Serovar') is None
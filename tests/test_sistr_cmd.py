@@ -0,0 +1,74 @@
+import sys
+import threading
+
+import pytest
+
+from sistr import sistr_cmd
+from sistr.src.parsers import file_sha256
+from sistr.src.serovar_prediction import SerovarPrediction
+
+
+def _fake_sistr_predict(input_fasta, genome_name, *args):
+    if genome_name == 'g1':
+        raise ValueError('BLAST failed')
+    return SerovarPrediction(genome=genome_name), {}
+
+
+def _run_with_timeout(func, timeout=60):
+    errors = []
+
+    def run():
+        try:
+            func()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'run did not exit'
+    return errors
+
+
+@pytest.mark.parametrize('extra_args', [[], ['--max-memory', '1M']])
+def test_multi_fasta_failed_genome_exits(tmpdir, monkeypatch, extra_args):
+    path = tmpdir.join('multi.fasta')
+    path.write(''.join('>g{0}|contig_1\nACGT\n'.format(i) for i in range(20)))
+    monkeypatch.setattr(sistr_cmd, 'sistr_predict', _fake_sistr_predict)
+    monkeypatch.setattr(sistr_cmd, 'preload_reference_data', lambda args: None)
+    parser = sistr_cmd.init_parser()
+    args = parser.parse_args(['--multi-fasta', str(path), '-t', '2', '-o', str(tmpdir.join('out.json'))] + extra_args)
+    # the pool stops instead of waiting for pending genomes (or to admit genomes within --max-memory)
+    errors = _run_with_timeout(lambda: sistr_cmd.main_multi_fasta(parser, args))
+    assert [str(e) for e in errors] == ['BLAST failed']
+
+
+def test_input_sha256s(tmpdir):
+    paths = []
+    for name in ['a', 'b']:
+        path = tmpdir.join(name + '.fasta')
+        path.write('>{}\nACGT\n'.format(name))
+        paths.append(str(path))
+    known = {paths[0]: 'preflight digest'}
+    digests = sistr_cmd.input_sha256s(paths + [str(tmpdir.join('missing.fasta'))], threads=2, known=known)
+    assert digests == {paths[0]: 'preflight digest', paths[1]: file_sha256(paths[1])}
+
+
+def test_result_cache_bypassed_with_artifacts_dir(tmpdir, monkeypatch):
+    path = tmpdir.join('g1.fasta')
+    path.write('>contig_1\nACGT\n')
+    analyzed = []
+
+    def fake_sistr_predict(input_fasta, genome_name, *args, **kwargs):
+        analyzed.append(genome_name)
+        return SerovarPrediction(genome=genome_name, fasta_filepath=input_fasta), {}
+
+    monkeypatch.setattr(sistr_cmd, 'sistr_predict', fake_sistr_predict)
+    monkeypatch.setattr(sistr_cmd, 'setup_sistr_dbs', lambda: None)
+    argv = ['sistr', str(path), '-t', '1', '--no-cgmlst', '--result-cache', str(tmpdir.join('cache')),
+            '-o', str(tmpdir.join('out.json'))]
+    for extra_args in [[], [], ['--artifacts-dir', str(tmpdir.join('artifacts'))]]:
+        monkeypatch.setattr(sys, 'argv', argv + extra_args)
+        sistr_cmd.main()
+    # the second run reuses the cached result; the run saving artifacts analyzes the genome again
+    assert analyzed == ['g1', 'g1']
@@ -0,0 +1,104 @@
+import argparse
+import os
+
+import pytest
+
+from sistr import sistr_cmd
+from sistr.src.serovar_prediction import SerovarPrediction
+from sistr.src.work_queue import DONE, FAILED, PENDING, RUNNING, WorkQueue, WorkQueueMismatchError, queue_outputs, \
+    run_worker
+
+
+def test_work_queue(tmpdir):
+    path = str(tmpdir.join('queue.sqlite'))
+    with pytest.raises(FileNotFoundError):
+        WorkQueue(path)
+    queue = WorkQueue(path, create=True)
+    queue.init_run(argparse.Namespace(qc=True), {'qc': True})
+    assert queue.args().qc
+    with pytest.raises(WorkQueueMismatchError):
+        queue.init_run(argparse.Namespace(qc=False), {'qc': False})
+
+    job_ids = queue.enqueue(['g1.fasta', 'g2.fasta', 'g1.fasta'], ['g1', 'g2', 'g1'])
+    assert job_ids[0] == job_ids[2] != job_ids[1]
+    assert queue.enqueue(['g2.fasta'], ['g2']) == job_ids[1:2]
+    assert queue.counts() == {PENDING: 2}
+
+    job_id, fasta_path, genome = queue.claim('w1')
+    assert (job_id, fasta_path, genome) == (job_ids[0], os.path.abspath('g1.fasta'), 'g1')
+    assert queue.claim('w2')[0] == job_ids[1]
+    assert queue.claim('w3') is None
+    assert queue.heartbeat(job_ids[0], 'w1')
+    assert not queue.heartbeat(job_ids[0], 'w2')
+    queue.complete(job_ids[0], 'w1', (SerovarPrediction(genome='g1'), {}))
+    status, genome, result, error = queue.job(job_ids[0])
+    assert (status, genome, result[0].genome, error) == (DONE, 'g1', 'g1', None)
+
+    # failed jobs are retried until max attempts
+    queue.fail(job_ids[1], 'w2', 'ValueError: bad', max_attempts=2)
+    assert queue.job(job_ids[1])[0] == PENDING
+    assert queue.claim('w2')[0] == job_ids[1]
+    queue.fail(job_ids[1], 'w2', 'ValueError: bad', max_attempts=2)
+    assert queue.job(job_ids[1])[0] == FAILED
+    assert [p.genome for p, _ in queue_outputs(queue, job_ids)] == ['g1', 'g1']
+    # failed jobs are retried when added again
+    queue.enqueue(['g2.fasta'], ['g2'])
+    assert queue.job(job_ids[1])[0] == PENDING
+    queue.close()
+
+
+def test_work_queue_reclaims_stale_jobs(tmpdir):
+    path = str(tmpdir.join('queue.sqlite'))
+    with WorkQueue(path, create=True) as queue:
+        job_id, = queue.enqueue(['g1.fasta'], ['g1'])
+        assert queue.claim('w1')[0] == job_id
+        assert queue.claim('w2', stale_after=60) is None
+        assert queue.claim('w2', stale_after=-1)[0] == job_id
+        # the lost worker's job is no longer claimed by it
+        assert not queue.heartbeat(job_id, 'w1')
+        assert queue.job(job_id)[0] == RUNNING
+        # gives up on jobs going stale too often
+        assert queue.claim('w3', stale_after=-1, max_attempts=2) is None
+        assert queue.job(job_id)[0] == FAILED
+
+
+def test_run_worker(tmpdir, monkeypatch):
+    fastas = []
+    for i in range(3):
+        path = tmpdir.join('g{}.fasta'.format(i))
+        path.write('>contig_1\nACGT\n')
+        fastas.append(str(path))
+    analyzed = []
+
+    def fake_sistr_predict(input_fasta, genome_name, *args):
+        if genome_name == 'g1' and genome_name not in analyzed:
+            analyzed.append(genome_name)
+            raise ValueError('transient error')
+        analyzed.append(genome_name)
+        return SerovarPrediction(genome=genome_name, fasta_filepath=input_fasta), {}
+
+    monkeypatch.setattr(sistr_cmd, 'sistr_predict', fake_sistr_predict)
+    path = str(tmpdir.join('queue.sqlite'))
+    args = argparse.Namespace(tmp_dir=str(tmpdir), keep_tmp=False)
+    with WorkQueue(path, create=True) as queue:
+        queue.init_run(args, {})
+        job_ids = queue.enqueue(fastas, ['g0', 'g1', 'g2'])
+    assert sistr_cmd.queue_worker(path, args, {'heartbeat_interval': 0.01}) == 3
+    # failed job retried (in input order)
+    assert analyzed == ['g0', 'g1', 'g1', 'g2']
+    assert run_worker(path, fake_sistr_predict) == 0
+    with WorkQueue(path) as queue:
+        assert queue.counts() == {DONE: 3}
+        assert [p.genome for p, _ in queue_outputs(queue, job_ids)] == ['g0', 'g1', 'g2']
+
+
+def test_main_queue_mismatch(tmpdir):
+    path = str(tmpdir.join('queue.sqlite'))
+    parser = sistr_cmd.init_parser()
+    args = parser.parse_args(['--queue', path, str(tmpdir.join('g1.fasta'))])
+    with WorkQueue(path, create=True) as queue:
+        queue.init_run(args, {'qc': not args.qc})
+    with pytest.raises(SystemExit):
+        sistr_cmd.main_queue(parser, args, [str(tmpdir.join('g1.fasta'))], ['g1'])
+    with WorkQueue(path) as queue:
+        assert queue.counts() == {}
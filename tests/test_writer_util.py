@@ -113,3 +113,264 @@ def test_numpy_numbers_to_dict():
         c = c.astype(np.int64)
         abc = ABC(r.a, r.b, c)
         assert json.dumps(to_dict(abc, 0), sort_keys=True) == json.dumps(t[i], sort_keys=True)
+
+
+def test_prediction_record_to_output_dict():
+    from sistr.src.serovar_prediction import SerovarPrediction, H1FliCPrediction
+    from sistr.src.writers import prediction_to_output_dict
+
+    h1_pred = H1FliCPrediction(h1='l,z13,z28',
+                               top_result={'qseqid': 'fliC|1|l,z13,z28', 'pident': np.float64(100.0), 'sseq': 'ATGC'},
+                               blast_results={'qseqid': {0: 'fliC|1|l,z13,z28'}})
+    prediction = SerovarPrediction(genome='g1', serovar='II 58:l,z13,z28:z6', h1_flic_prediction=h1_pred)
+    prediction.cgmlst_ST = np.int64(12345)
+    # unset fields without defaults are not output
+    assert not prediction.has('mash_match')
+    out = prediction_to_output_dict(prediction, 0)
+    assert 'mash_match' not in out
+    assert 'qc_status' not in out
+    assert out['cgmlst_ST'] == 12345 and isinstance(out['cgmlst_ST'], int)
+    assert list(out.keys()) == sorted(out.keys())
+    assert out['h1_flic_prediction'] == {'h1': 'l,z13,z28',
+                                         'is_missing': False,
+                                         'is_perfect_match': False,
+                                         'is_trunc': False,
+                                         'top_result': {'qseqid': 'fliC|1|l,z13,z28', 'pident': 100.0}}
+    assert 'sseq' in prediction_to_output_dict(prediction, 1)['h1_flic_prediction']['top_result']
+    assert 'blast_results' not in prediction_to_output_dict(prediction, 1)['h1_flic_prediction']
+    assert 'blast_results' in prediction_to_output_dict(prediction, 2)['h1_flic_prediction']
+    flat = prediction_to_output_dict(prediction, 0, flatten=True)
+    assert 'h1_flic_prediction' not in flat
+    assert flat['genome'] == 'g1'
+    flat = prediction_to_output_dict(prediction, 1, flatten=True)
+    assert flat['h1_flic_prediction.top_result.sseq'] == 'ATGC'
+
+
+def test_streaming_prediction_writer(tmpdir):
+    import gzip
+    import json
+    from sistr.src.serovar_prediction import SerovarPrediction
+    from sistr.src.writers import PredictionWriter, prediction_to_output_dict, write_csv
+
+    predictions = [SerovarPrediction(genome='g{}'.format(i), serovar='Enteritidis', cgmlst_ST=np.int64(i))
+                   for i in range(3)]
+    # streamed JSON array is identical to dumping the whole list at once
+    with PredictionWriter(str(tmpdir.join('out')), 'json') as writer:
+        for prediction in predictions:
+            writer.write(prediction)
+    expected = json.dumps([prediction_to_output_dict(x) for x in predictions])
+    assert tmpdir.join('out.json').read() == expected
+
+    with PredictionWriter(str(tmpdir.join('out.jsonl.gz')), 'jsonl') as writer:
+        for prediction in predictions:
+            writer.write(prediction)
+    with gzip.open(str(tmpdir.join('out.jsonl.gz')), 'rt') as fh:
+        assert [json.loads(l)['genome'] for l in fh] == ['g0', 'g1', 'g2']
+
+    with PredictionWriter(str(tmpdir.join('out')), 'csv') as writer:
+        for prediction in predictions:
+            writer.write(prediction)
+    with open(str(tmpdir.join('expected.csv')), 'w') as fh:
+        write_csv(fh, [prediction_to_output_dict(x, flatten=True) for x in predictions])
+    assert tmpdir.join('out.csv').read() == tmpdir.join('expected.csv').read()
+
+    with PredictionWriter(str(tmpdir.join('empty')), 'json'):
+        pass
+    assert json.loads(tmpdir.join('empty.json').read()) == []
+
+
+def test_csv_prediction_writer_union_of_columns(tmpdir):
+    from sistr.src.readers import read_predictions
+    from sistr.src.serovar_prediction import SerovarPrediction, H2FljBPrediction
+    from sistr.src.writers import PredictionWriter
+
+    # only the second genome has a fljB top result
+    h2_pred = H2FljBPrediction(h2='1,2', top_result={'qseqid': 'fljB|1|1,2', 'pident': 99.5})
+    predictions = [SerovarPrediction(genome='g1', h2_fljb_prediction=H2FljBPrediction(h2='-', is_missing=True)),
+                   SerovarPrediction(genome='g2', h2_fljb_prediction=h2_pred)]
+    path = str(tmpdir.join('out.csv'))
+    with PredictionWriter(path, 'csv', more_results=1) as writer:
+        for prediction in predictions:
+            writer.write(prediction)
+    rows = read_predictions(path)
+    assert rows[0]['h2_fljb_prediction.top_result.qseqid'] is None
+    assert rows[1]['h2_fljb_prediction.top_result.qseqid'] == 'fljB|1|1,2'
+    assert rows[1]['h2_fljb_prediction.top_result.pident'] == '99.5'
+
+
+def test_csv_prediction_writer_streams_default_fields(tmpdir):
+    import argparse
+    import pytest
+    from sistr.src.serovar_prediction import SerovarPrediction
+    from sistr.src.writers import PredictionWriter, prediction_output_fields
+
+    args = argparse.Namespace(no_cgmlst=False, run_mash=True, qc=False, list_of_serovars=None)
+    fields = prediction_output_fields(args)
+    assert 'mash_distance' in fields and 'cgmlst_ST' in fields
+    assert 'qc_status' not in fields and 'predicted_serovar_in_list' not in fields
+    path = str(tmpdir.join('out.csv'))
+    writer = PredictionWriter(path, 'csv', fields=fields)
+    writer.write(SerovarPrediction(genome='g1', serovar='Enteritidis'))
+    # header and first row written before the second prediction
+    with open(path) as fh:
+        lines = fh.read().splitlines()
+    assert lines[0].split(',') == fields
+    assert len(lines) == 2
+    writer.write(SerovarPrediction(genome='g2', mash_distance=0.001))
+    with pytest.raises(ValueError):
+        writer.write(SerovarPrediction(genome='g3', qc_status='PASS'))
+    writer.close()
+    df = pd.read_csv(path)
+    assert list(df['genome']) == ['g1', 'g2']
+    assert list(df['mash_distance'].isnull()) == [True, False]
+
+
+def test_columnar_prediction_and_profiles_writers(tmpdir):
+    import pickle
+    import pytest
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    from sistr.src.serovar_prediction import SerovarPrediction
+    from sistr.src.writers import PredictionWriter, CgmlstProfilesWriter, prediction_to_output_dict
+
+    predictions = [SerovarPrediction(genome='g{}'.format(i),
+                                     serovar='Enteritidis' if i % 2 else 'Typhimurium',
+                                     cgmlst_ST=np.int64(4000000000 + i))
+                   for i in range(5)]
+    with PredictionWriter(str(tmpdir.join('out')), 'parquet') as writer:
+        writer.table_writer.batch_size = 2
+        for prediction in predictions:
+            writer.write(prediction)
+    parquet_file = pq.ParquetFile(str(tmpdir.join('out.parquet')))
+    assert parquet_file.metadata.num_row_groups == 3
+    table = parquet_file.read()
+    assert table.schema.field('cgmlst_ST').type == pa.uint32()
+    assert pa.types.is_dictionary(table.schema.field('serovar').type)
+    assert table.column('serovar').to_pylist() == [x.serovar for x in predictions]
+    assert table.column('cgmlst_ST').to_pylist() == [int(x.cgmlst_ST) for x in predictions]
+    assert table.column('serovar_cgmlst').null_count == 5
+
+    with PredictionWriter(str(tmpdir.join('out')), 'pickle') as writer:
+        for prediction in predictions:
+            writer.write(prediction)
+    with open(str(tmpdir.join('out.pickle')), 'rb') as fh:
+        assert pickle.load(fh) == [prediction_to_output_dict(x) for x in predictions]
+
+    cgmlst_results = {'m1': {'name': 4294967295}, 'm2': {'name': None}}
+    with CgmlstProfilesWriter(str(tmpdir.join('profiles.parquet')), ['m1', 'm2', 'm3']) as writer:
+        writer.write('g1', cgmlst_results)
+    table = pq.read_table(str(tmpdir.join('profiles.parquet')))
+    assert table.schema.field('m1').type == pa.uint32()
+    assert table.to_pylist() == [{'genome': 'g1', 'm1': 4294967295, 'm2': None, 'm3': None}]
+
+
+def test_columnar_prediction_writer_record_schema(tmpdir):
+    import pytest
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    from sistr.src.serovar_prediction import H2FljBPrediction, SerovarPrediction
+    from sistr.src.writers import PredictionWriter
+
+    # no Mash results or H2 top results in the first batch
+    predictions = [SerovarPrediction(genome='g{}'.format(i), serovar='Typhimurium') for i in range(3)]
+    predictions.append(SerovarPrediction(genome='g3',
+                                         serovar='Enteritidis',
+                                         mash_distance=0.001,
+                                         mash_match=1000,
+                                         h2_fljb_prediction=H2FljBPrediction(h2='1,2',
+                                                                             top_result={'pident': 99.5,
+                                                                                         'length': 1500})))
+    for more_results in (0, 1):
+        with PredictionWriter(str(tmpdir.join('out')), 'parquet', more_results=more_results) as writer:
+            writer.table_writer.batch_size = 2
+            for prediction in predictions:
+                writer.write(prediction)
+        table = pq.read_table(str(tmpdir.join('out.parquet')))
+        assert table.schema.field('mash_distance').type == pa.float64()
+        assert table.schema.field('mash_match').type == pa.int64()
+        assert table.column('mash_distance').to_pylist() == [None, None, None, 0.001]
+    assert table.schema.field('h2_fljb_prediction.h2').type == pa.string()
+    assert table.schema.field('h2_fljb_prediction.top_result.pident').type == pa.float64()
+    assert table.column('h2_fljb_prediction.top_result.length').to_pylist() == [None, None, None, 1500]
+
+
+def test_compact_alleles_writer(tmpdir):
+    import json
+    import pandas as pd
+    from sistr.src.writers import CompactAllelesWriter
+
+    blast_result = {'qseqid': 'm1|1', 'stitle': 'contig_1', 'pident': np.float64(100.0), 'length': np.int64(4),
+                    'qlen': 4, 'slen': 1000, 'coverage': 1.0, 'is_trunc': np.bool_(False), 'sseq': 'ACGT'}
+    genome_results = {'g1': {'m1': {'name': 111, 'seq': 'ACGT', 'blast_result': blast_result},
+                             'm2': {'name': None, 'seq': None, 'blast_result': None}},
+                      'g2': {'m1': {'name': 111, 'seq': 'ACGT', 'blast_result': blast_result},
+                             'm2': {'name': 222, 'seq': 'GGCC', 'blast_result': None}}}
+    dest = str(tmpdir.join('alleles.json'))
+    with CompactAllelesWriter(dest) as writer:
+        for genome, cgmlst_results in genome_results.items():
+            writer.write(genome, cgmlst_results)
+    out = json.loads(tmpdir.join('alleles.json').read())
+    assert out['genomes'] == {'g1': {'m1': 111, 'm2': None}, 'g2': {'m1': 111, 'm2': 222}}
+    assert out['alleles'] == {'111': 'ACGT', '222': 'GGCC'}
+    if writer.side_table_path.endswith('.parquet'):
+        df = pd.read_parquet(writer.side_table_path)
+    else:
+        df = pd.read_table(writer.side_table_path)
+    assert list(df['genome']) == ['g1', 'g2']
+    assert 'sseq' not in df.columns
+    assert list(df['pident']) == [100.0, 100.0]
+
+
+def test_blast_hits_writer(tmpdir):
+    from sistr.src.serovar_prediction import SerovarPrediction, H1FliCPrediction, H2FljBPrediction
+    from sistr.src.writers import BlastHitsWriter, prediction_to_output_dict
+
+    h1_pred = H1FliCPrediction(h1='i',
+                               blast_results={'qseqid': {3: 'fliC|1|i', 0: 'fliC|2|r'},
+                                              'pident': {3: np.float64(100.0), 0: np.float64(97.5)}})
+    h2_pred = H2FljBPrediction(h2='-', is_missing=True)
+    prediction = SerovarPrediction(genome='g1', h1_flic_prediction=h1_pred, h2_fljb_prediction=h2_pred)
+    dest = tmpdir.join('hits.tsv')
+    with BlastHitsWriter(str(dest)) as writer:
+        writer.write(prediction)
+    assert writer.count == 2
+    assert dest.read() == 'genome\tantigen\tqseqid\tpident\ng1\tfliC\tfliC|1|i\t100.0\ng1\tfliC\tfliC|2|r\t97.5\n'
+    # hits are not output with the prediction at verbosity levels below -MM
+    assert 'blast_results' not in prediction_to_output_dict(prediction, 1)['h1_flic_prediction']
+
+
+def test_read_cgmlst_profiles_and_predictions(tmpdir):
+    import numpy as np
+    from sistr.src.readers import read_cgmlst_profiles, read_predictions
+    from sistr.src.serovar_prediction import SerovarPrediction
+    from sistr.src.writers import CgmlstProfilesWriter, AllelesJsonWriter, CompactAllelesWriter, PredictionWriter
+
+    markers = ['m1', 'm2', 'm3']
+    results = {'g1': {'m1': {'name': 1, 'seq': 'A', 'blast_result': None},
+                      'm2': {'name': 4294967295, 'seq': 'C', 'blast_result': None},
+                      'm3': {'name': None, 'seq': None, 'blast_result': None}},
+               'g2': {'m1': {'name': 2, 'seq': 'G', 'blast_result': None},
+                      'm2': {'name': 3, 'seq': 'T', 'blast_result': None},
+                      'm3': {'name': 5, 'seq': 'AA', 'blast_result': None}}}
+    paths = [str(tmpdir.join('profiles.csv')), str(tmpdir.join('alleles.json')), str(tmpdir.join('compact.json'))]
+    writers = [CgmlstProfilesWriter(paths[0], markers), AllelesJsonWriter(paths[1]), CompactAllelesWriter(paths[2])]
+    for writer in writers:
+        for genome, res in results.items():
+            writer.write(genome, res)
+        writer.close()
+    for path in paths:
+        df = read_cgmlst_profiles(path)
+        assert list(df.index) == ['g1', 'g2']
+        assert df.loc['g1', 'm2'] == 4294967295
+        assert np.isnan(df.loc['g1', 'm3'])
+        assert df.loc['g2', 'm3'] == 5
+
+    for fmt in ['json', 'jsonl', 'csv', 'tab']:
+        path = str(tmpdir.join('predictions.' + fmt))
+        with PredictionWriter(path, fmt) as writer:
+            writer.write(SerovarPrediction(genome='g1', serovar='Enteritidis', h1='g,m', h2='-'))
+            writer.write(SerovarPrediction(genome='g2', serovar='Typhimurium', h1='i', h2='1,2'))
+        predictions = read_predictions(path)
+        assert [x['genome'] for x in predictions] == ['g1', 'g2']
+        assert predictions[0]['h1'] == 'g,m'
+        assert predictions[0]['serogroup'] is None